@@ -0,0 +1,56 @@
+import math
+from typing import Any, Iterable, List
+
+# (Brief) Counting Bloom filter over primary keys: "not in filter" means the key is definitely absent,
+#         "in filter" means it may be present. Counters (one byte each) make removal possible.
+# (Usage) Built per repository by Repository.load_key_filter, kept current by repository writes.
+#
+# Saturated counters (255) are never decremented, so removals can only leave false positives behind.
+# Keys are hashed with Python's hash(), so a filter is only valid within the process that built it.
+#
+# (Params)
+#   capacity (int) - Expected number of keys.
+#   error_rate (float) - False positive rate at `capacity` keys.
+#
+class CountingBloomFilter:
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 0.01):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        # False until the bulk load finished; an unready filter answers every lookup with "may be present".
+        self.ready = True
+        self._counters = bytearray(self.size)
+
+    def _indexes(self, key: Any) -> List[int]:
+        # double hashing: h1 + i * h2, with h2 odd
+        h1 = hash((key, ))
+        h2 = hash((key, 1)) | 1
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def add(self, key: Any) -> None:
+        counters = self._counters
+        for i in self._indexes(key):
+            if counters[i] < 255: counters[i] += 1
+
+    def update(self, keys: Iterable[Any]) -> None:
+        for key in keys:
+            self.add(key)
+
+    # Only remove keys that were added (e.g. rows confirmed deleted), or other keys become false negatives.
+    def remove(self, key: Any) -> None:
+        counters = self._counters
+        for i in self._indexes(key):
+            if 0 < counters[i] < 255: counters[i] -= 1
+
+    def __contains__(self, key: Any) -> bool:
+        if not self.ready: return True
+        counters = self._counters
+        for i in self._indexes(key):
+            if not counters[i]: return False
+        return True
+
+    def clear(self) -> None:
+        self._counters = bytearray(self.size)
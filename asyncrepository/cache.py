@@ -1,82 +1,263 @@
 from collections import OrderedDict, defaultdict
-from typing import Any, Optional
+from sys import getsizeof
+from typing import Any, Callable, Dict, Optional, Protocol, Set
 import time
 
+from asyncrepository import metrics
+
+# (Brief) Interface shared by every cache below, so the query decorators accept any of them (query_cached).
+#         A cache calls on_evict(key, value) when it drops an entry by itself (capacity or expiry),
+#         but not on pop/clear. Caches may also offer get_stale (see TTLCache) for stale-while-revalidate,
+#         and dump/restore for snapshots (see snapshot.py): dump() returns the entries as plain tuples in
+#         the order restore(entries) needs to rebuild the eviction order, restore() adds them to an empty cache.
+class CachePolicy(Protocol):
+    on_evict: Optional[Callable[[Any, Any], None]]
+
+    def get(self, key: Any, default: Any = None) -> Any: ...
+    def __setitem__(self, key: Any, value: Any) -> None: ...
+    def pop(self, key: Any, default: Any = None) -> Any: ...
+    def clear(self) -> None: ...
+    def __contains__(self, key: Any) -> bool: ...
+    def __len__(self) -> int: ...
+
+    @property
+    def weight(self) -> int: ...
+
+# (Brief) Default weigher: approximate bytes held by a cached entity or list of entities. An entity weighs
+#         its object plus its field values (shallow); a list weighs itself plus its length times the average
+#         weight of up to `sample` evenly spaced items, so weighing a 50k row result stays cheap.
+def estimate_size(value: Any, sample: int = 8) -> int:
+    if isinstance(value, list):
+        if not value: return getsizeof(value)
+        picked = value[::max(1, len(value) // sample)][:sample]
+        return getsizeof(value) + len(value) * sum(map(_object_size, picked)) // len(picked)
+    return _object_size(value)
+
+def _object_size(obj: Any) -> int:
+    size = getsizeof(obj)
+    attrs = getattr(obj, "__dict__", None)
+    if attrs is not None: size += getsizeof(attrs)
+
+    fields = getattr(type(obj), "__dataclass_fields__", None)
+    if fields is not None:
+        return size + sum(getsizeof(getattr(obj, x, None)) for x in fields)
+    if attrs is not None:
+        size += sum(map(getsizeof, attrs.values()))
+    return size
+
+# (Brief) Byte budget shared by the caches below. Every entry is weighed once when it is set, and the
+#         cache evicts (in its own order) until both the entry count and the total weight fit.
+#         An entry heavier than max_bytes on its own is not admitted at all, and drops the old value of its key.
+#
+# (Params)
+#   max_bytes (int) - Budget for the total weight, None for no byte bound (the weight is still reported).
+#   weigher (callable) - weigher(value) -> int, defaults to estimate_size.
+#
+class _Weighted:
+    def _init_weight(self, max_bytes: Optional[int], weigher: Optional[Callable[[Any], int]]):
+        self.max_bytes = max_bytes
+        self.weigher = weigher or estimate_size
+        self._weights: Dict[Any, int] = {}
+        self._weight = 0
+
+    # Current total weight of the entries, in bytes for the default weigher.
+    @property
+    def weight(self) -> int:
+        return self._weight
+
+    # Weighs `value`, returns None if it can never fit.
+    def _weigh(self, value: Any) -> Optional[int]:
+        weight = self.weigher(value)
+        return None if self.max_bytes is not None and weight > self.max_bytes else weight
+
+    def _add_weight(self, key: Any, weight: int):
+        self._weight += weight - self._weights.get(key, 0)
+        self._weights[key] = weight
+
+    def _drop_weight(self, key: Any):
+        self._weight -= self._weights.pop(key, 0)
+
+    def _clear_weight(self):
+        self._weights.clear()
+        self._weight = 0
+
+    def _overweight(self) -> bool:
+        return self.max_bytes is not None and self._weight > self.max_bytes
+
 # Stores cache constantly
-class LRUCache:
-    def __init__(self, capacity: int = 1000):
+class LRUCache(_Weighted):
+    def __init__(self, capacity: int = 1000, max_bytes: Optional[int] = None, weigher: Optional[Callable[[Any], int]] = None):
         self.capacity = capacity
         self.cache = OrderedDict()
+        self.on_evict: Optional[Callable[[Any, Any], None]] = None
+        self._init_weight(max_bytes, weigher)
 
-    def get(self, key):
+    def get(self, key, default=None):
         if key not in self.cache:
-            return None
+            return default
         self.cache.move_to_end(key)
         return self.cache[key]
 
     def __setitem__(self, key, value):
+        weight = self._weigh(value)
+        if weight is None:
+            self.pop(key)
+            return
+
         self.cache[key] = value
         self.cache.move_to_end(key)
-        if len(self.cache) > self.capacity:
-            self.cache.popitem(last=False)
+        self._add_weight(key, weight)
+        while len(self.cache) > self.capacity or self._overweight():
+            evicted = self.cache.popitem(last=False)
+            self._drop_weight(evicted[0])
+            if self.on_evict is not None: self.on_evict(*evicted)
+
+    def pop(self, key, default=None):
+        self._drop_weight(key)
+        return self.cache.pop(key, default)
 
     def clear(self):
         self.cache.clear()
+        self._clear_weight()
+
+    def __contains__(self, key):
+        return key in self.cache
+
+    def __len__(self):
+        return len(self.cache)
+
+    # [(key, value)], least recently used first.
+    def dump(self) -> list:
+        return list(self.cache.items())
+
+    def restore(self, entries) -> None:
+        for key, value in entries:
+            self[key] = value
 
 # Stores cache temporarily
-class TTLCache:
-    def __init__(self, maxsize: int = 128, ttl: float = 60.0):
+# All entries share one ttl and a re-set key moves to the end, so the store is ordered by
+# expiry time: expiring old entries only pops the expired prefix (amortized O(1)) and a hit
+# checks just its own deadline.
+#
+# (Params)
+#   stale (float) - Seconds an expired entry is still kept for get_stale (stale-while-revalidate).
+class TTLCache(_Weighted):
+    def __init__(
+            self,
+            maxsize: int = 128,
+            ttl: float = 60.0,
+            stale: float = 0.0,
+            max_bytes: Optional[int] = None,
+            weigher: Optional[Callable[[Any], int]] = None
+    ):
         self.maxsize = maxsize
         self.ttl = ttl
-        self._store = OrderedDict()
+        self.stale = stale
+        self._store: OrderedDict[Any, tuple[Any, float]] = OrderedDict() # key -> (value, expiry time)
+        self.on_evict: Optional[Callable[[Any, Any], None]] = None
+        self._init_weight(max_bytes, weigher)
 
     def _expire_old(self):
-        now = time.time()
-        expired_keys = [k for k, (_, t) in self._store.items() if now - t > self.ttl]
-        for k in expired_keys:
-            del self._store[k]
+        store = self._store
+        limit = time.monotonic() - self.stale
+        while store:
+            _, expires = store[next(iter(store))]
+            if expires > limit: break
+            self._evict(*store.popitem(last=False))
+
+    def _evict(self, key: Any, item: tuple[Any, float]):
+        self._drop_weight(key)
+        if self.on_evict is not None: self.on_evict(key, item[0])
 
     def get(self, key: Any, default: Any = None) -> Optional[Any]:
-        self._expire_old()
         item = self._store.get(key)
-        if item:
-            value, timestamp = item
-            if time.time() - timestamp <= self.ttl:
+        if item is not None:
+            value, expires = item
+            now = time.monotonic()
+            if now <= expires:
                 return value
-            else:
-                del self._store[key]
+            elif now > expires + self.stale:
+                self._evict(key, self._store.pop(key))
         return default
 
+    # Returns (value, fresh) for entries that are fresh or within the stale window, otherwise None.
+    def get_stale(self, key: Any) -> Optional[tuple[Any, bool]]:
+        item = self._store.get(key)
+        if item is not None:
+            value, expires = item
+            now = time.monotonic()
+            if now <= expires + self.stale:
+                return value, now <= expires
+            self._evict(key, self._store.pop(key))
+        return None
+
     def __setitem__(self, key: Any, value: Any):
         self._expire_old()
+        weight = self._weigh(value)
+        if weight is None:
+            self.pop(key)
+            return
+
         if key in self._store:
             del self._store[key]
-        elif len(self._store) >= self.maxsize:
-            self._store.popitem(last=False)
-        self._store[key] = (value, time.time())
+        self._store[key] = (value, time.monotonic() + self.ttl)
+        self._add_weight(key, weight)
+        while len(self._store) > self.maxsize or self._overweight():
+            self._evict(*self._store.popitem(last=False))
+
+    def pop(self, key: Any, default: Any = None) -> Optional[Any]:
+        self._drop_weight(key)
+        item = self._store.pop(key, None)
+        return default if item is None else item[0]
 
     def clear(self):
         self._store.clear()
+        self._clear_weight()
 
     def __contains__(self, key):
-        self._expire_old()
-        return key in self._store
+        item = self._store.get(key)
+        return item is not None and time.monotonic() <= item[1]
 
     def __len__(self):
         self._expire_old()
         return len(self._store)
 
-class LFUCache:
-    def __init__(self, capacity: int = 1000):
+    # [(key, value, expiry)], soonest expiry first. Expiry is converted to wall clock time (time.time),
+    # since monotonic time does not carry over to another process.
+    def dump(self) -> list:
+        offset = time.time() - time.monotonic()
+        return [(key, value, expires + offset) for key, (value, expires) in self._store.items()]
+
+    # Drops entries expired (past the stale window) in the meantime, and caps the rest at the current ttl.
+    def restore(self, entries) -> None:
+        now = time.monotonic()
+        offset = now - time.time()
+        for key, value, expires in entries:
+            expires = min(expires + offset, now + self.ttl)
+            if expires + self.stale < now: continue
+
+            weight = self._weigh(value)
+            if weight is None: continue
+            self._store.pop(key, None)
+            self._store[key] = (value, expires)
+            self._add_weight(key, weight)
+
+        while len(self._store) > self.maxsize or self._overweight():
+            self._evict(*self._store.popitem(last=False))
+
+class LFUCache(_Weighted):
+    def __init__(self, capacity: int = 1000, max_bytes: Optional[int] = None, weigher: Optional[Callable[[Any], int]] = None):
         self.capacity = capacity
         self.key_to_val = {}  # key -> value
         self.key_to_freq = {} # key -> freq
         self.freq_to_keys = defaultdict(OrderedDict) # freq -> OrderedDict of keys
         self.min_freq = 0
+        self.on_evict: Optional[Callable[[Any, Any], None]] = None
+        self._init_weight(max_bytes, weigher)
 
-    def get(self, key):
+    def get(self, key, default=None):
         if key not in self.key_to_val:
-            return None
+            return default
 
         self._increase_freq(key)
         return self.key_to_val[key]
@@ -85,18 +266,26 @@ class LFUCache:
         if self.capacity <= 0:
             return
 
+        weight = self._weigh(value)
+        if weight is None:
+            self.pop(key)
+            return
+
         if key in self.key_to_val:
             self.key_to_val[key] = value
             self._increase_freq(key)
-            return
+        else:
+            if len(self.key_to_val) >= self.capacity:
+                self._evict()
 
-        if len(self.key_to_val) >= self.capacity:
-            self._evict()
+            self.key_to_val[key] = value
+            self.key_to_freq[key] = 1
+            self.freq_to_keys[1][key] = None
+            self.min_freq = 1
 
-        self.key_to_val[key] = value
-        self.key_to_freq[key] = 1
-        self.freq_to_keys[1][key] = None
-        self.min_freq = 1
+        self._add_weight(key, weight)
+        while self._overweight():
+            self._evict()
 
     def _increase_freq(self, key):
         freq = self.key_to_freq[key]
@@ -110,9 +299,447 @@ class LFUCache:
         self.freq_to_keys[freq + 1][key] = None
 
     def _evict(self):
+        if self.min_freq not in self.freq_to_keys:
+            self.min_freq = min(self.freq_to_keys)
         key, _ = self.freq_to_keys[self.min_freq].popitem(last=False)
         if not self.freq_to_keys[self.min_freq]:
             del self.freq_to_keys[self.min_freq]
 
-        del self.key_to_val[key]
+        value = self.key_to_val.pop(key)
         del self.key_to_freq[key]
+        self._drop_weight(key)
+        if self.on_evict is not None: self.on_evict(key, value)
+
+    def pop(self, key, default=None):
+        if key not in self.key_to_val:
+            return default
+
+        self._drop_weight(key)
+        freq = self.key_to_freq.pop(key)
+        del self.freq_to_keys[freq][key]
+        if not self.freq_to_keys[freq]:
+            del self.freq_to_keys[freq]
+            if freq == self.min_freq:
+                self.min_freq = min(self.freq_to_keys, default=0)
+        return self.key_to_val.pop(key)
+
+    def clear(self):
+        self.key_to_val.clear()
+        self.key_to_freq.clear()
+        self.freq_to_keys.clear()
+        self.min_freq = 0
+        self._clear_weight()
+
+    def __contains__(self, key):
+        return key in self.key_to_val
+
+    def __len__(self):
+        return len(self.key_to_val)
+
+    # [(key, value, frequency)] in eviction order: lowest frequency first, least recent first within one.
+    def dump(self) -> list:
+        return [(key, self.key_to_val[key], freq) for freq in sorted(self.freq_to_keys) for key in self.freq_to_keys[freq]]
+
+    def restore(self, entries) -> None:
+        for key, value, freq in entries:
+            self[key] = value
+            current = self.key_to_freq.get(key)
+            if current is None or current >= freq: continue
+
+            del self.freq_to_keys[current][key]
+            if not self.freq_to_keys[current]:
+                del self.freq_to_keys[current]
+            self.key_to_freq[key] = freq
+            self.freq_to_keys[freq][key] = None
+            self.min_freq = min(self.freq_to_keys)
+
+# (Brief) Count-min sketch of access frequencies with 4-bit counters (saturating at 15), used for
+#         TinyLFU admission. After `sample_size` increments all counters are halved, so old popularity fades.
+class CountMinSketch:
+    _HALVE = bytes(i >> 1 for i in range(256))
+
+    def __init__(self, width: int, depth: int = 4, sample_size: int | None = None):
+        self.width = 1 << max(4, (width - 1).bit_length())
+        self.depth = depth
+        self.sample_size = sample_size or 10 * width
+        self._mask = self.width - 1
+        self._rows = [bytearray(self.width) for _ in range(depth)]
+        self._additions = 0
+
+    # Double hashing: row i uses hash + i * step, with step derived from the hash (odd, so rows differ for small ints).
+    def increment(self, key: Any) -> None:
+        h = hash(key)
+        step = ((h * 0x9E3779B1) >> 7) | 1
+        mask = self._mask
+        added = False
+        for row in self._rows:
+            i = h & mask
+            if row[i] < 15:
+                row[i] += 1
+                added = True
+            h += step
+
+        if added:
+            self._additions += 1
+            if self._additions >= self.sample_size:
+                self._reset()
+
+    def frequency(self, key: Any) -> int:
+        h = hash(key)
+        step = ((h * 0x9E3779B1) >> 7) | 1
+        mask = self._mask
+        result = 15
+        for row in self._rows:
+            count = row[h & mask]
+            if count < result: result = count
+            h += step
+        return result
+
+    def _reset(self) -> None:
+        for row in self._rows:
+            row[:] = row.translate(self._HALVE)
+        self._additions //= 2
+
+# (Brief) W-TinyLFU: a small LRU window admits new keys, and a segmented LRU (probation + protected)
+#         holds the main space. When the window overflows, its victim only replaces the probation victim
+#         if the count-min sketch saw it more often, so scans and one-hit keys can not flush popular entries.
+# (Usage) Skewed key distributions with scan-like traffic, e.g. query_cached(policy=WTinyLFUCache).
+#
+# (Params)
+#   capacity (int) - Maximum number of entries.
+#   window_ratio (float) - Share of the capacity used by the admission window.
+#   protected_ratio (float) - Share of the main space for entries hit at least twice.
+#
+class WTinyLFUCache(_Weighted):
+    def __init__(
+            self,
+            capacity: int = 1000,
+            window_ratio: float = 0.01,
+            protected_ratio: float = 0.8,
+            max_bytes: Optional[int] = None,
+            weigher: Optional[Callable[[Any], int]] = None
+    ):
+        self.capacity = capacity
+        self.window_capacity = max(1, int(capacity * window_ratio))
+        self.main_capacity = max(0, capacity - self.window_capacity)
+        self.protected_capacity = int(self.main_capacity * protected_ratio)
+        self.sketch = CountMinSketch(max(16, capacity))
+        self.on_evict: Optional[Callable[[Any, Any], None]] = None
+
+        self._window = OrderedDict()
+        self._probation = OrderedDict()
+        self._protected = OrderedDict()
+        self._init_weight(max_bytes, weigher)
+
+    def get(self, key, default=None):
+        self.sketch.increment(key)
+        for segment in (self._window, self._protected):
+            if key in segment:
+                segment.move_to_end(key)
+                return segment[key]
+
+        if key in self._probation:
+            value = self._probation.pop(key)
+            self._promote(key, value)
+            return value
+        return default
+
+    def __setitem__(self, key, value):
+        self.sketch.increment(key)
+        weight = self._weigh(value)
+        if weight is None:
+            self.pop(key)
+            return
+
+        self._add_weight(key, weight)
+        for segment in (self._window, self._probation, self._protected):
+            if key in segment:
+                segment[key] = value
+                segment.move_to_end(key)
+                break
+        else:
+            self._window[key] = value
+            if len(self._window) > self.window_capacity:
+                self._admit(*self._window.popitem(last=False))
+
+        # Over the byte budget: least valuable entries first (probation, protected, then window).
+        while self._overweight():
+            segment = self._probation or self._protected or self._window
+            self._evict(*segment.popitem(last=False))
+
+    def _promote(self, key, value):
+        self._protected[key] = value
+        if len(self._protected) > self.protected_capacity:
+            demoted = self._protected.popitem(last=False)
+            self._probation[demoted[0]] = demoted[1]
+
+    # Window victim (candidate) against the probation victim.
+    def _admit(self, key, value):
+        if len(self._probation) + len(self._protected) < self.main_capacity:
+            self._probation[key] = value
+            return
+
+        if not self._probation and self._protected:
+            demoted = self._protected.popitem(last=False)
+            self._probation[demoted[0]] = demoted[1]
+
+        if self._probation:
+            victim = next(iter(self._probation))
+            if self.sketch.frequency(key) > self.sketch.frequency(victim):
+                evicted = (victim, self._probation.pop(victim))
+                self._probation[key] = value
+            else:
+                evicted = (key, value)
+        else:
+            evicted = (key, value)
+
+        self._evict(*evicted)
+
+    def _evict(self, key, value):
+        self._drop_weight(key)
+        if self.on_evict is not None: self.on_evict(key, value)
+
+    def pop(self, key, default=None):
+        for segment in (self._window, self._probation, self._protected):
+            if key in segment:
+                self._drop_weight(key)
+                return segment.pop(key)
+        return default
+
+    def clear(self):
+        self._window.clear()
+        self._probation.clear()
+        self._protected.clear()
+        self._clear_weight()
+
+    def __contains__(self, key):
+        return key in self._window or key in self._probation or key in self._protected
+
+    def __len__(self):
+        return len(self._window) + len(self._probation) + len(self._protected)
+
+    # [(key, value, segment)] with segment 0 = probation, 1 = protected, 2 = window, least recent first.
+    # The sketch is not included: hashes of str keys differ between processes.
+    def dump(self) -> list:
+        segments = (self._probation, self._protected, self._window)
+        return [(key, value, i) for i, segment in enumerate(segments) for key, value in segment.items()]
+
+    # Puts entries back in their segments and counts them in the sketch (protected ones twice), so the
+    # restored entries are not the first victims of admission.
+    def restore(self, entries) -> None:
+        for key, value, segment in entries:
+            weight = self._weigh(value)
+            if weight is None or key in self: continue
+
+            self._add_weight(key, weight)
+            for _ in range(2 if segment == 1 else 1): self.sketch.increment(key)
+            if segment == 0:
+                self._probation[key] = value
+            elif segment == 1:
+                self._promote(key, value)
+            else:
+                self._window[key] = value
+                if len(self._window) > self.window_capacity:
+                    self._admit(*self._window.popitem(last=False))
+
+        while len(self._probation) + len(self._protected) > self.main_capacity or self._overweight():
+            segment = self._probation or self._protected or self._window
+            self._evict(*segment.popitem(last=False))
+
+# (Brief) Cache of one decorated query plus a reverse index from entity key to the entries holding it,
+#         so repository writes can drop exactly the affected entries.
+# (Usage) Created by the query decorators and registered on the repository by @repository.
+#
+# (Params)
+#   cache (LRUCache, TTLCache or LFUCache) - Storage keyed by the query args.
+#   key (callable) - key(args, entity) returns the entity key. None if entries can not be indexed,
+#                    then every invalidation clears the whole cache.
+#   many (bool) - Values are lists of entities (query_all_* decorators).
+#   negative (TTLCache) - Remembers args that returned no row. Invalidations drop the entries of args
+#                         identifying the written keys if `args_key`, otherwise all of them.
+#   args_key (bool) - Query args are the entity key, (key, ) for a single-column key.
+#
+class QueryCache:
+    def __init__(
+            self,
+            cache,
+            key: Optional[Callable[[tuple, Any], Any]] = None,
+            many: bool = False,
+            negative: Optional["TTLCache"] = None,
+            args_key: bool = False
+    ):
+        self.cache = cache
+        self.key = key
+        self.many = many
+        self.negative = negative
+        self.args_key = args_key
+        # Bumped by every invalidation. A load that started before it must not store its result.
+        self.generation = 0
+
+        self._keys: Dict[tuple, tuple] = {}                 # args -> entity keys
+        self._index: Dict[Any, Set[tuple]] = defaultdict(set) # entity key -> args
+        cache.on_evict = self._evicted
+
+        # Counted while metrics are enabled, see metrics.py.
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, args: tuple, default: Any = None) -> Any:
+        return self.cache.get(args, default)
+
+    def get_stale(self, args: tuple) -> Optional[tuple[Any, bool]]:
+        return self.cache.get_stale(args)
+
+    def __setitem__(self, args: tuple, value: Any):
+        self._unindex(args)
+        self.cache[args] = value
+        self._index_entry(args, value)
+
+    def _index_entry(self, args: tuple, value: Any):
+        if self.key is None or value is None or args not in self.cache: return # not admitted
+
+        keys = tuple(self.key(args, x) for x in value) if self.many else (self.key(args, value), )
+        self._keys[args] = keys
+        for key in keys:
+            self._index[key].add(args)
+
+    # Stores the value only if nothing was invalidated since `generation` was read.
+    def store(self, args: tuple, value: Any, generation: int):
+        if generation == self.generation:
+            self[args] = value
+
+    # True if `args` are known to return no row (negative caching).
+    def is_absent(self, args: tuple) -> bool:
+        return self.negative is not None and args in self.negative
+
+    def store_absent(self, args: tuple, generation: int):
+        if self.negative is not None and generation == self.generation:
+            self.negative[args] = True
+
+    def invalidate(self, keys) -> None:
+        self.generation += 1
+        if self.negative is not None:
+            if self.args_key:
+                for key in keys:
+                    self.negative.pop(key if isinstance(key, tuple) else (key, ))
+            else:
+                self.negative.clear()
+
+        if self.key is None:
+            self.clear()
+            return
+
+        for key in keys:
+            for args in self._index.pop(key, ()):
+                self._unindex(args)
+                self.cache.pop(args)
+
+    def clear(self):
+        self.generation += 1
+        self.cache.clear()
+        if self.negative is not None: self.negative.clear()
+        self._keys.clear()
+        self._index.clear()
+
+    def _evicted(self, args: tuple, value: Any = None):
+        if metrics.enabled: self.evictions += 1
+        self._unindex(args)
+
+    def _unindex(self, args: tuple):
+        keys = self._keys.pop(args, None)
+        if keys is None: return
+
+        for key in keys:
+            entries = self._index.get(key)
+            if entries is not None:
+                entries.discard(args)
+                if not entries: del self._index[key]
+
+    def __contains__(self, args):
+        return args in self.cache
+
+    def __len__(self):
+        return len(self.cache)
+
+    # Entries of the storage, see CachePolicy. Negative entries are not included.
+    def dump(self) -> list:
+        return self.cache.dump()
+
+    # (Brief) Replaces the contents with dumped entries and indexes them for invalidation.
+    #         Invalidates loads in flight, as if the entries had just been written.
+    def restore(self, entries) -> None:
+        self.clear()
+        self.cache.restore(entries)
+        for entry in entries:
+            self._index_entry(entry[0], entry[1])
+
+    @property
+    def weight(self) -> int:
+        return self.cache.weight
+
+# (Brief) Cache of aggregate results (counts, sums, GROUP BY rows) that are served stale while they refresh.
+#         An aggregate depends on the whole table, so a repository write does not drop entries: it marks every
+#         entry computed before it as outdated, and the next read refreshes it in the background.
+# (Usage) Created by the query_aggregate decorator and registered on the repository by @repository.
+#
+# (Params)
+#   capacity (int) - Maximum number of args cached (LRU).
+#   interval (float) - Seconds after which an entry is refreshed, None to refresh on writes only.
+#   refresh_on_write (bool) - Repository writes to the table outdate the entries.
+#
+class AggregateCache:
+    many = True
+    args_key = False
+
+    def __init__(self, capacity: int = 256, interval: float | None = 60.0, refresh_on_write: bool = True):
+        self.cache = LRUCache(capacity) # args -> (value, wall clock time the computation started)
+        self.interval = interval
+        self.refresh_on_write = refresh_on_write
+        self.generation = 0
+        self.written = 0.0 # wall clock time of the last write seen
+
+        self.cache.on_evict = self._evicted
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Returns (value, fresh) or None. Times are wall clock, so entries restored from a snapshot age correctly.
+    def get_stale(self, args: tuple) -> Optional[tuple[Any, bool]]:
+        item = self.cache.get(args)
+        if item is None: return None
+
+        value, computed = item
+        fresh = computed > self.written and (self.interval is None or time.time() - computed <= self.interval)
+        return value, fresh
+
+    def store(self, args: tuple, value: Any, started: float):
+        self.cache[args] = (value, started)
+
+    def invalidate(self, keys) -> None:
+        self.clear()
+
+    # Outdates every entry, they keep being served until refreshed.
+    def clear(self):
+        self.generation += 1
+        if self.refresh_on_write: self.written = time.time()
+
+    def _evicted(self, args: tuple, value: Any = None):
+        if metrics.enabled: self.evictions += 1
+
+    def __contains__(self, args):
+        return args in self.cache
+
+    def __len__(self):
+        return len(self.cache)
+
+    def dump(self) -> list:
+        return self.cache.dump()
+
+    def restore(self, entries) -> None:
+        self.cache.clear()
+        self.cache.restore(entries)
+
+    @property
+    def weight(self) -> int:
+        return self.cache.weight
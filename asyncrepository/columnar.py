@@ -0,0 +1,102 @@
+import io
+from datetime import date, datetime
+from typing import Any, Dict
+
+from asyncpg import Connection
+
+from asyncrepository.entity import Default, PrimaryKey, Timestamp, Varchar
+
+try:
+    import numpy as np
+except ImportError: # pragma: no cover - numpy is pinned in requirements.txt
+    np = None
+
+try:
+    import pandas as pd
+except ImportError: # pragma: no cover
+    pd = None
+
+# (Brief) Columnar results: rows are decoded straight into one NumPy array per column, with dtypes derived
+#         from the entity annotations, instead of being boxed into entities first.
+# (Usage) Repository.fetch_columns / the query_columns decorator, frame=True wraps the arrays in a DataFrame.
+#
+# Columns of int or bool fields that contain NULL fall back to float64 (NaN) and object respectively.
+# Columns without an annotation, or of types NumPy has no dtype for, are object arrays.
+
+_DTYPES: Dict[Any, str] = {
+    int:       "int64",
+    float:     "float64",
+    bool:      "bool",
+    str:       "object",
+    Timestamp: "datetime64[us]",
+    datetime:  "datetime64[us]",
+    date:      "datetime64[D]",
+}
+
+# Dtypes to retry with when a column does not fit its preferred dtype (NULLs, timezones).
+_FALLBACKS: Dict[str, str] = {
+    "int64": "float64",
+}
+
+def _require_numpy():
+    if np is None: raise ImportError("numpy is required for columnar results")
+
+def _require_pandas():
+    if pd is None: raise ImportError("pandas is required for DataFrame results")
+
+# (Brief) Maps an entity annotation (PrimaryKey[int], Default[Timestamp], Varchar[255], int, ...) to a NumPy dtype.
+def dtype_for(annotation: Any) -> str:
+    while isinstance(annotation, (PrimaryKey, Default)):
+        annotation = annotation.item
+    if isinstance(annotation, Varchar):
+        return "object"
+    return _DTYPES.get(annotation, "object")
+
+def column_dtypes(model) -> Dict[str, str]:
+    annotations = getattr(model, "__annotations__", {})
+    return {name: dtype_for(x) for name, x in annotations.items()}
+
+def _array(values: tuple, dtype: str):
+    if dtype == "bool" and None in values: # NumPy would silently turn NULL into False
+        dtype = "object"
+    while True:
+        try:
+            return np.array(values, dtype=dtype)
+        except (TypeError, ValueError):
+            dtype = _FALLBACKS.get(dtype, "object")
+
+# (Brief) Runs the query and returns {column: ndarray}, in result column order.
+async def fetch_columns(conn: Connection, model, sql: str, *args: Any) -> Dict[str, Any]:
+    _require_numpy()
+    dtypes = column_dtypes(model)
+
+    rows = await conn.fetch(sql, *args)
+    if not rows:
+        statement = await conn.prepare(sql)
+        return {x.name: np.array((), dtype=dtypes.get(x.name, object)) for x in statement.get_attributes()}
+
+    names = tuple(rows[0].keys())
+    return {name: _array(values, dtypes.get(name, "object")) for name, values in zip(names, zip(*rows))}
+
+async def fetch_frame(conn: Connection, model, sql: str, *args: Any):
+    _require_pandas()
+    return pd.DataFrame(await fetch_columns(conn, model, sql, *args), copy=False)
+
+# (Brief) Streams `COPY (sql) TO STDOUT` into `output` (path, file-like object or coroutine function
+#         receiving chunks) without building rows in Python. format='binary' is the fastest to produce.
+async def export(conn: Connection, sql: str, *args: Any, output, format: str = "binary") -> str:
+    return await conn.copy_from_query(sql, *args, output=output, format=format)
+
+# (Brief) Large exports into a DataFrame: the result is streamed with COPY as CSV and parsed by pandas'
+#         C parser, skipping asyncpg record decoding entirely. Datetime columns are converted from the annotations.
+async def export_frame(conn: Connection, model, sql: str, *args: Any):
+    _require_pandas()
+    buffer = io.BytesIO()
+    await conn.copy_from_query(sql, *args, output=buffer, format="csv", header=True)
+    buffer.seek(0)
+
+    frame = pd.read_csv(buffer)
+    for name, dtype in column_dtypes(model).items():
+        if name in frame and dtype.startswith("datetime64"):
+            frame[name] = pd.to_datetime(frame[name])
+    return frame
@@ -20,6 +20,25 @@ class DatabaseConfig:
     host: str = os.getenv("DB_HOST") or sys.exit("Environment variable DB_HOST is required")
     ssl = os.getenv("DB_SSL_MODE", "disable")
 
+    # Connection pool
+    pool_min_size: int = int(os.getenv("DB_POOL_MIN_SIZE", 10))
+    pool_max_size: int = int(os.getenv("DB_POOL_MAX_SIZE", 10))
+    statement_cache_size: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 1024))
+    max_inactive_lifetime: float = float(os.getenv("DB_MAX_INACTIVE_LIFETIME", 300.0))
+    max_queries: int = int(os.getenv("DB_MAX_QUERIES", 50000))
+    statement_timeout: float = float(os.getenv("DB_STATEMENT_TIMEOUT", 0.0)) # seconds, server side ceiling; 0 disables
+
+    # Fan-out (DBConnector.gather): concurrent calls of all fan-outs (0: half of the pool) and calls allowed to wait (0: no bound)
+    fanout_limit: int = int(os.getenv("DB_FANOUT_LIMIT", 0))
+    fanout_max_queue: int = int(os.getenv("DB_FANOUT_MAX_QUEUE", 0))
+
+    # Read replicas: comma separated host[:port] (same credentials and database) or full DSNs
+    replica_hosts: tuple = tuple(x.strip() for x in os.getenv("DB_REPLICA_HOSTS", "").split(",") if x.strip())
+    read_routing: str = os.getenv("DB_READ_ROUTING", "round_robin") # or least_outstanding
+    sticky_window: float = float(os.getenv("DB_STICKY_WINDOW", 6.0)) # never below replica_max_lag + replica_check_interval
+    replica_max_lag: float = float(os.getenv("DB_REPLICA_MAX_LAG", 5.0))
+    replica_check_interval: float = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", 1.0))
+
     schema: str = read_file(os.path.join(RESOURCE_DIR, os.getenv("DB_SCHEMA")))
 
 @dataclass(frozen=True)
@@ -1,24 +1,514 @@
-from typing import List, Any
+import asyncio
+import logging
+import time
 from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import date, datetime
+from functools import lru_cache
+from operator import attrgetter
+from time import perf_counter
+from typing import Any, Callable, Dict, List
 
 import asyncpg as pg
 
+from asyncrepository import deadline, fanout, metrics
 from asyncrepository.config import config
+from asyncrepository.entity import Default, PrimaryKey, Timestamp, Varchar
+from asyncrepository.materializer import materialize, materialize_all
 
 db_config = config.database
 conn_string = f"postgresql://{db_config.username}:{db_config.password}@{db_config.host}:{db_config.port}/{db_config.name}"
 
-class DBConnector:
+logger = logging.getLogger(__name__)
+
+# (Brief) Registry of the SQL statements declared by repositories and query decorators.
+# (Usage) Filled at import time by @repository and the query decorators. DBConnector prepares
+#         every statement on each new pool connection, so first requests skip statement parsing.
+#
+class StatementRegistry:
     def __init__(self):
+        self._statements: Dict[str, None] = {} # ordered set
+
+    def add(self, *sql: str) -> None:
+        for x in sql:
+            if x: self._statements[x] = None
+
+    def discard(self, sql: str) -> None:
+        self._statements.pop(sql, None)
+
+    def __iter__(self):
+        return iter(list(self._statements))
+
+    def __len__(self):
+        return len(self._statements)
+
+    def __contains__(self, sql):
+        return sql in self._statements
+
+statements = StatementRegistry()
+
+# Prepares registered statements into the connection's statement cache, the one fetch/execute use.
+# Public Connection.prepare() bypasses that cache, hence _prepare(use_cache=True).
+async def prepare_statements(conn: pg.Connection) -> None:
+    for sql in statements:
+        try:
+            await conn._prepare(sql, use_cache=True)
+        except pg.PostgresError as e:
+            logger.warning("Could not prepare statement %r: %s", sql, e)
+
+# Replica lag in seconds: 0 on a primary or a replica that replayed everything it received,
+# otherwise the age of the last replayed transaction.
+REPLICA_LAG_QUERY = """SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END::float8"""
+
+def replica_dsn(host: str) -> str:
+    if "://" in host: return host
+    host, _, port = host.partition(":")
+    return f"postgresql://{db_config.username}:{db_config.password}@{host}:{port or db_config.port}/{db_config.name}"
+
+@dataclass
+class Replica:
+    name: str                     # host:port, used in logs and metric labels
+    dsn: str
+    pool: pg.Pool | None = None
+    healthy: bool = False         # in rotation: reachable and lag <= max_lag
+    lag: float | None = None      # seconds, from the last check
+    outstanding: int = 0          # leases acquiring or holding a connection
+
+# (Brief) Connection lease of one operation: acquires from `pool` on enter and releases on exit.
+#         A write lease makes the connector route reads of its table to the primary for the sticky window.
+#         Inside a deadline (see deadline.py) acquiring and everything run on the connection are bounded by it.
+class _Lease:
+    __slots__ = ("connector", "pool", "replica", "write", "table", "conn", "timeout")
+
+    def __init__(self, connector: "DBConnector", pool: pg.Pool, replica: Replica | None = None, write: bool = False, table: str | None = None):
+        self.connector = connector
+        self.pool = pool
+        self.replica = replica
+        self.write = write
+        self.table = table
+        self.conn = None
+        self.timeout = None
+
+    async def __aenter__(self) -> pg.Connection:
+        timeout = self.timeout = deadline.scope()
+        if timeout is not None: await timeout.__aenter__()
+
+        replica = self.replica
+        if replica is not None: replica.outstanding += 1
+        try:
+            if not metrics.enabled:
+                self.conn = await self.pool.acquire()
+            else:
+                start = perf_counter()
+                self.conn = await self.pool.acquire()
+                label = self.connector.name if replica is None else f"{self.connector.name}:{replica.name}"
+                metrics.registry.histogram("pool_acquire_seconds", pool=label).record(perf_counter() - start)
+        except BaseException as e:
+            if replica is not None: replica.outstanding -= 1
+            await deadline.leave(timeout, type(e), e)
+            raise
+
+        if timeout is not None:
+            statement_timeout = deadline.server_timeout()
+            if statement_timeout is not None:
+                try:
+                    await self.conn.execute(f"SET statement_timeout = {statement_timeout}") # RESET ALL on release
+                except BaseException as e:
+                    await self.__aexit__(type(e), e, None)
+                    raise
+        return self.conn
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        try:
+            await deadline.leave(self.timeout, exc_type, exc)
+        finally:
+            try:
+                await self.pool.release(self.conn)
+            finally:
+                if self.replica is not None: self.replica.outstanding -= 1
+                if self.write: self.connector.mark_written(self.table)
+
+# A connection passed in by the caller, used as is. A deadline bounds the queries, but does not set statement_timeout.
+class _Held:
+    __slots__ = ("conn", "timeout")
+
+    def __init__(self, conn: pg.Connection):
+        self.conn = conn
+        self.timeout = None
+
+    async def __aenter__(self) -> pg.Connection:
+        timeout = self.timeout = deadline.scope()
+        if timeout is not None: await timeout.__aenter__()
+        return self.conn
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None or self.timeout is not None:
+            await deadline.leave(self.timeout, exc_type, exc)
+
+# (Brief) Connection for one repository operation: `conn` itself if it is a connection, otherwise a connection
+#         leased from the DBConnector `conn` for the duration of the block - the one of the task's
+#         transaction()/session() block, else a replica for reads and the primary for writes (see DBConnector.reader / writer).
+# (Usage) async with lease(conn, write=True, table=...) as conn: ...
+#         primary=True keeps a read on the primary, for what replicas do not have (e.g. pg_stat_* counters).
+def lease(conn, write: bool = False, table: str | None = None, primary: bool = False):
+    if hasattr(conn, "fetchrow"): return _Held(conn)
+    return conn.writer(table) if write else conn.reader(table, primary)
+
+# Connections in a transaction whose cache invalidations wait for its commit -> callbacks to run then. See after_commit.
+_after_commit: Dict[Any, List[Callable[[], None]]] = {}
+
+# (Brief) Runs `callback` once the writes made through `conn` are committed: at once, or when the outermost
+#         DBConnector.transaction() / transaction(conn) block holding `conn` commits. Dropped if it rolls back.
+#         Repository writes invalidate the caches and publish on the bus through it, so no reader can cache
+#         a row again before the write is visible.
+#
+# A connection in a transaction it was not registered for (a bare conn.transaction()) runs the callback at once,
+# before the commit, and logs a warning: the caches can load the old row again until the transaction commits.
+def after_commit(conn, callback: Callable[[], None]) -> None:
+    callbacks = _after_commit.get(conn)
+    if callbacks is not None:
+        callbacks.append(callback)
+        return
+
+    if _in_transaction(conn):
+        logger.warning(
+            "write inside a transaction not opened with transaction(conn): caches are invalidated before it "
+            "commits and may load the old rows again, use `async with transaction(conn):`"
+        )
+    callback()
+
+def _in_transaction(conn) -> bool:
+    if not hasattr(conn, "is_in_transaction"): # None or a DBConnector
+        return False
+    try:
+        return conn.is_in_transaction()
+    except pg.InterfaceError: # leased by the write and already released to its pool
+        return False
+
+# Collects after_commit callbacks of `conn` for the block and runs them if it exits without error.
+# Nested blocks leave them to the outermost one.
+@asynccontextmanager
+async def _committing(conn):
+    if conn in _after_commit:
+        yield
+        return
+
+    callbacks = _after_commit[conn] = []
+    try:
+        yield
+    finally:
+        del _after_commit[conn]
+    for callback in callbacks: callback()
+
+# (Brief) Transaction on a connection, or on a DBConnector (see DBConnector.transaction), that holds back the cache
+#         invalidations of the repository writes inside it until the outermost transaction commits.
+# (Usage)
+#   async with transaction(conn):
+#       await UserRepository.update(conn, user)
+#       await OrderRepository.insert(conn, order)
+#
+# Inside a bare conn.transaction() the caches are invalidated when each statement runs, before the commit,
+# so a concurrent reader can cache the old row again until it expires.
+@asynccontextmanager
+async def transaction(conn, **options):
+    if not hasattr(conn, "fetchrow"):
+        async with conn.transaction(**options) as conn:
+            yield conn
+        return
+
+    async with _committing(conn), conn.transaction(**options):
+        yield conn
+
+# (Brief) Primary pool plus optional read replica pools.
+# (Usage)
+#   connector = DBConnector()
+#   await connector.create_pool(replicas=["replica1:5432", "replica2"])
+#   user = await UserRepository.find_by_id(connector, 45) # read, routed to a replica
+#   await UserRepository.update(connector, user)         # write, primary
+#
+# Repository methods and query decorators accept the connector in place of a connection and lease one
+# per call: reads from a replica in rotation, writes from the primary. After a write through the connector,
+# reads of the same table go to the primary for `sticky_window` seconds (read-your-writes); call
+# mark_written after writing through a connection of get_connection. The window is at least `max_lag` plus
+# `check_interval`, as long as a replica in rotation can be that far behind, so a cache miss right after
+# a write (or an invalidation from the bus) never loads the old row from a replica. A background check measures the lag
+# of every replica and takes replicas lagging more than `max_lag` (or unreachable) out of rotation.
+# Without replicas in rotation every read goes to the primary. Explicit connections (get_connection) are primary.
+#
+# Inside `async with connector.transaction()` or `connector.session()` every lease of the same task returns the
+# connection of the block instead (see Repository.bind for calls without a connection):
+#   async with connector.transaction():
+#       user = await UserRepository.find_by_id(45)
+#       await UserRepository.update(user)
+# Tasks started inside the block lease their own connections, since one connection can not run concurrent queries.
+#
+# (Params)
+#   name (string) - Label of the pool metrics (pool_acquire_seconds, pool_size, pool_idle, pool_max_size).
+class DBConnector:
+    def __init__(self, name: str = "default"):
+        self.name = name
         self.pool: pg.Pool = None
+        self.slow_log = None
+        self.fanout: fanout.FairLimiter | None = None # admission of gather(), set by create_pool
+
+        self.replicas: List[Replica] = []
+        self.routing = db_config.read_routing
+        self.sticky_window = db_config.sticky_window
+        self.max_lag = db_config.replica_max_lag
+        self.check_interval = db_config.replica_check_interval
+
+        self._rotation: List[Replica] = [] # healthy replicas
+        self._next = 0
+        self._sticky: Dict[str | None, float] = {} # table (None: every table) -> monotonic deadline
+        self._checker: asyncio.Task | None = None
+        self._pool_options: Dict[str, Any] = {}
+        # (connection, owner task) of the innermost transaction()/session() block
+        self._current: ContextVar[tuple | None] = ContextVar(f"asyncrepository_{name}_connection", default=None)
+
+    # (Brief) Creates the primary pool (and the replica pools) with min_size connections open and every
+    #         registered statement prepared on them.
+    # (Params) Pool settings default to DatabaseConfig (DB_POOL_MIN_SIZE, DB_POOL_MAX_SIZE,
+    #          DB_STATEMENT_CACHE_SIZE, DB_MAX_INACTIVE_LIFETIME, DB_MAX_QUERIES, DB_STATEMENT_TIMEOUT, DB_FANOUT_LIMIT,
+    #          DB_FANOUT_MAX_QUEUE), and so do the replica
+    #          settings (DB_REPLICA_HOSTS, DB_READ_ROUTING, DB_STICKY_WINDOW, DB_REPLICA_MAX_LAG, DB_REPLICA_CHECK_INTERVAL).
+    #          slow_log (SlowQueryLog) - Installed on every connection of the pools, see slowlog.py.
+    #          replicas (list of host[:port] or DSNs) - Read replicas, each gets a pool with the same settings.
+    #          routing (string) - "round_robin" or "least_outstanding" (fewest leases in flight).
+    #          statement_timeout (float) - Server side ceiling in seconds for every statement, 0 for none.
+    #                                      Deadlines (see deadline.py) bound single calls below it.
+    #          fanout_limit (int) - Calls of all gather() fan-outs running at once, 0 for half of max_size.
+    #          fanout_max_queue (int) - Fan-out calls allowed to wait for the limit, 0 for no bound.
+    async def create_pool(
+            self,
+            min_size: int | None = None,
+            max_size: int | None = None,
+            statement_cache_size: int | None = None,
+            max_inactive_lifetime: float | None = None,
+            max_queries: int | None = None,
+            prepare: bool = True,
+            slow_log=None,
+            replicas: List[str] | None = None,
+            routing: str | None = None,
+            sticky_window: float | None = None,
+            max_lag: float | None = None,
+            statement_timeout: float | None = None,
+            fanout_limit: int | None = None,
+            fanout_max_queue: int | None = None
+    ) -> None:
+        self.slow_log = slow_log
+        if slow_log is not None and slow_log.connector is None:
+            slow_log.connector = self
+        if routing is not None: self.routing = routing
+        if sticky_window is not None: self.sticky_window = sticky_window
+        if max_lag is not None: self.max_lag = max_lag
+        if self.routing not in ("round_robin", "least_outstanding"):
+            raise ValueError(f"Unknown read routing {self.routing!r}")
+
+        async def init(conn: pg.Connection) -> None:
+            if slow_log is not None: slow_log.attach(conn)
+            if prepare: await prepare_statements(conn)
+
+        self._pool_options = dict(
+            min_size=db_config.pool_min_size if min_size is None else min_size,
+            max_size=db_config.pool_max_size if max_size is None else max_size,
+            statement_cache_size=db_config.statement_cache_size if statement_cache_size is None else statement_cache_size,
+            max_inactive_connection_lifetime=db_config.max_inactive_lifetime if max_inactive_lifetime is None else max_inactive_lifetime,
+            max_queries=db_config.max_queries if max_queries is None else max_queries,
+            init=init if prepare or slow_log is not None else None,
+        )
+        statement_timeout = db_config.statement_timeout if statement_timeout is None else statement_timeout
+        if statement_timeout:
+            self._pool_options["server_settings"] = {"statement_timeout": str(int(statement_timeout * 1000))}
+        self.pool = await pg.create_pool(conn_string, **self._pool_options)
+        self._register_pool_metrics(self.pool, self.name)
+
+        limit = db_config.fanout_limit if fanout_limit is None else fanout_limit
+        max_queue = db_config.fanout_max_queue if fanout_max_queue is None else fanout_max_queue
+        self.fanout = fanout.FairLimiter(limit or max(1, self._pool_options["max_size"] // 2), max_queue or None)
+        metrics.registry.gauge("fanout_queue_depth", lambda: self.fanout.queued, pool=self.name)
+        metrics.registry.gauge("fanout_active", lambda: self.fanout.active, pool=self.name)
+
+        hosts = db_config.replica_hosts if replicas is None else replicas
+        self.replicas = [Replica(name=self._replica_name(x), dsn=replica_dsn(x)) for x in hosts]
+        if self.replicas:
+            await self.check_replicas()
+            self._checker = asyncio.get_running_loop().create_task(self._check_loop())
+
+    @staticmethod
+    def _replica_name(host: str) -> str:
+        return host.rsplit("@", 1)[-1].split("/", 1)[0] if "://" in host else host
+
+    def _register_pool_metrics(self, pool: pg.Pool, label: str) -> None:
+        metrics.registry.gauge("pool_size", pool.get_size, pool=label)
+        metrics.registry.gauge("pool_idle", pool.get_idle_size, pool=label)
+        metrics.registry.gauge("pool_max_size", pool.get_max_size, pool=label)
+
+    # (Brief) Measures the lag of every replica (creating pools of replicas that were unreachable so far)
+    #         and rebuilds the rotation. Runs every check_interval seconds in the background.
+    async def check_replicas(self) -> None:
+        async def check(replica: Replica):
+            try:
+                if replica.pool is None:
+                    replica.pool = await pg.create_pool(replica.dsn, **self._pool_options)
+                    self._register_pool_metrics(replica.pool, f"{self.name}:{replica.name}")
+                    metrics.registry.gauge(
+                        "replica_lag_seconds", lambda: float("nan") if replica.lag is None else replica.lag,
+                        pool=f"{self.name}:{replica.name}"
+                    )
+                async with replica.pool.acquire(timeout=self.check_interval * 5) as conn:
+                    replica.lag = await conn.fetchval(REPLICA_LAG_QUERY, timeout=self.check_interval * 5)
+                healthy = replica.lag <= self.max_lag
+            except (pg.PostgresError, pg.InterfaceError, OSError, asyncio.TimeoutError) as e:
+                logger.debug("Replica %s check failed: %s", replica.name, e)
+                replica.lag = None
+                healthy = False
 
-    async def create_pool(self) -> None:
-        self.pool = await pg.create_pool(conn_string)
+            if healthy != replica.healthy:
+                if healthy: logger.info("Replica %s back in rotation (lag %.3fs)", replica.name, replica.lag)
+                else: logger.warning("Replica %s out of rotation (lag %s)", replica.name, replica.lag)
+            replica.healthy = healthy
 
+        await asyncio.gather(*(check(x) for x in self.replicas))
+        self._rotation = [x for x in self.replicas if x.healthy]
+
+    async def _check_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.check_interval)
+            try:
+                await self.check_replicas()
+            except Exception:
+                logger.exception("Replica check failed")
+
+    # Makes reads of `table` (every table if None) go to the primary for the sticky window.
+    def mark_written(self, table: str | None = None) -> None:
+        if self.replicas:
+            self._sticky[table] = time.monotonic() + max(self.sticky_window, self.max_lag + self.check_interval)
+
+    def _sticky_to_primary(self, table: str | None) -> bool:
+        sticky = self._sticky
+        if not sticky: return False
+
+        now = time.monotonic()
+        for key in (None, table):
+            deadline = sticky.get(key)
+            if deadline is not None:
+                if deadline > now: return True
+                del sticky[key]
+        return False
+
+    def _pick(self, table: str | None) -> Replica | None:
+        rotation = self._rotation
+        if not rotation or self._sticky_to_primary(table): return None
+        if self.routing == "least_outstanding":
+            return min(rotation, key=attrgetter("outstanding"))
+
+        self._next = (self._next + 1) % len(rotation)
+        return rotation[self._next]
+
+    # Connection of the transaction()/session() block the current task is in, if any.
+    def current(self) -> pg.Connection | None:
+        current = self._current.get()
+        if current is not None and current[1] is asyncio.current_task():
+            return current[0]
+        return None
+
+    # Lease of a read connection: the connection of the task's block, a replica in rotation, or the primary
+    # (always with `primary`, without marking the table written).
+    def reader(self, table: str | None = None, primary: bool = False) -> _Lease | _Held:
+        conn = self.current()
+        if conn is not None: return _Held(conn)
+
+        replica = None if primary else self._pick(table)
+        return _Lease(self, self.pool, None) if replica is None else _Lease(self, replica.pool, replica)
+
+    # Lease of a primary connection (or the one of the task's block). Reads of `table` stick to the primary
+    # for the sticky window afterwards.
+    def writer(self, table: str | None = None) -> _Lease | _Held:
+        conn = self.current()
+        if conn is not None:
+            self.mark_written(table)
+            return _Held(conn)
+        return _Lease(self, self.pool, None, True, table)
+
+    # (Brief) Primary connection held for the block, with a transaction. Repository calls of the same task
+    #         inside the block run on it; a nested transaction() is a savepoint on the same connection.
+    #         Their cache invalidations wait for the commit (see after_commit).
+    # (Params) options - conn.transaction() options: isolation, readonly, deferrable.
+    @asynccontextmanager
+    async def transaction(self, **options):
+        conn = self.current()
+        if conn is not None:
+            async with conn.transaction(**options):
+                yield conn
+            return
+
+        async with self.get_connection() as conn:
+            token = self._current.set((conn, asyncio.current_task()))
+            try:
+                async with _committing(conn), conn.transaction(**options):
+                    yield conn
+            finally:
+                self._current.reset(token)
+        if not options.get("readonly"): self.mark_written()
+
+    # (Brief) Primary connection held for the block without a transaction, so a sequence of repository calls
+    #         acquires once. Reuses the connection of an enclosing block.
     @asynccontextmanager
-    async def get_connection(self):
-        async with self.pool.acquire() as conn:
+    async def session(self):
+        conn = self.current()
+        if conn is not None:
             yield conn
+            return
+
+        async with self.get_connection() as conn:
+            token = self._current.set((conn, asyncio.current_task()))
+            try:
+                yield conn
+            finally:
+                self._current.reset(token)
+
+    # (Brief) Prepares the registered statements on every idle connection of the pools.
+    # (Usage) Call after importing repositories that were not loaded yet when the pool was created.
+    async def warm_up(self) -> None:
+        async def prepare_one(pool: pg.Pool):
+            async with pool.acquire() as conn:
+                await prepare_statements(conn)
+
+        pools = [self.pool] + [x.pool for x in self.replicas if x.pool is not None]
+        await asyncio.gather(*(prepare_one(pool) for pool in pools for _ in range(pool.get_idle_size())))
+
+    # Opens a dedicated connection outside of the pool (e.g. for LISTEN).
+    async def connect(self) -> pg.Connection:
+        conn = await pg.connect(conn_string)
+        if self.slow_log is not None: self.slow_log.attach(conn)
+        return conn
+
+    # (Brief) Runs independent repository calls concurrently, each leasing its own pooled connection, and
+    #         returns their results in order. At most `limit` calls of this fan-out run at once, and at most
+    #         fanout_limit calls of all fan-outs, so fan-outs can not drain the pool for other requests; queued
+    #         calls are admitted first come, first served. When the queue is full, OverloadError is raised.
+    #         If a call fails the others are cancelled, unless `return_exceptions`.
+    # (Usage)
+    #   user, orders, count = await connector.gather(
+    #       UserRepository.find_by_id(connector, 45),
+    #       OrderRepository.by_user(connector, 45),
+    #       OrderRepository.count(connector),
+    #   )
+    #
+    # Calls must get the connector (or run on bound repositories), not a connection: one connection can not
+    # run queries concurrently. Inside a transaction()/session() block the calls still lease their own
+    # connections, outside of the block's transaction. Calls may also be coroutine functions without arguments.
+    async def gather(self, *calls, limit: int | None = None, return_exceptions: bool = False) -> List[Any]:
+        return await fanout.gather(self, *calls, limit=limit, return_exceptions=return_exceptions)
+
+    # Primary connection for the duration of the block.
+    def get_connection(self) -> _Lease:
+        return _Lease(self, self.pool)
 
     async def schema(self):
         async with self.get_connection() as conn:
@@ -26,25 +516,185 @@ class DBConnector:
                 await conn.execute(db_config.schema)
 
     async def close(self):
+        if self._checker is not None:
+            self._checker.cancel()
+            self._checker = None
+        await asyncio.gather(*(x.pool.close() for x in self.replicas if x.pool is not None))
         await self.pool.close()
 
+# Placeholder types of where_batch arrays, by entity annotation.
+_PG_TYPES: Dict[Any, str] = {
+    int:       "bigint",
+    float:     "float8",
+    bool:      "boolean",
+    str:       "text",
+    Varchar:   "text",
+    Timestamp: "timestamp",
+    datetime:  "timestamp",
+    date:      "date",
+}
+
+def _pg_type(model, column: str) -> str:
+    annotation = getattr(model, "__annotations__", {}).get(column)
+    while isinstance(annotation, (PrimaryKey, Default)):
+        annotation = annotation.item
+    pg_type = _PG_TYPES.get(type(annotation) if isinstance(annotation, Varchar) else annotation)
+    if pg_type is None:
+        raise ValueError(f"No array type known for {model.__name__}.{column}, pass types=")
+    return pg_type
+
+# (Brief) Immutable statement compiled from a query shape: the SQL text and the number of its $n placeholders,
+#         numbered in the order the shape was built. Equal shapes compile to the same object.
+@dataclass(frozen=True)
+class CompiledQuery:
+    model: Any
+    sql: str
+    params: int
+
+    async def value(self, conn: pg.Connection, *args: Any):
+        return await conn.fetchval(self.sql, *args)
+
+    async def first(self, conn: pg.Connection, *args: Any):
+        return materialize(self.model, await conn.fetchrow(self.sql, *args))
+
+    async def all(self, conn: pg.Connection, *args: Any):
+        return materialize_all(self.model, await conn.fetch(self.sql, *args))
+
+# Renders a shape: replays the recorded StmtGenerator calls, numbering placeholders as they come.
+class _Builder:
+    OPERATORS = ('>=', '<=', '<>', '!=', '>', '<', '=')
+
+    def __init__(self, model):
+        self.model = model
+        self.sql_parts: List[str] = []
+        self.params = 0
+        self.where_started = False
+
+    def _param(self) -> str:
+        self.params += 1
+        return f"${self.params}"
+
+    def _compare(self, column: str) -> str:
+        upper = column.upper()
+        if upper.endswith((" IS NULL", " IS NOT NULL")):
+            return column.strip()
+        if upper.endswith(" NOT IN"):
+            return f"{column[:-7].strip()}<>ALL({self._param()})"
+        if upper.endswith(" IN"):
+            return f"{column[:-3].strip()}=ANY({self._param()})"
+        if upper.endswith(" BETWEEN"):
+            return f"{column[:-8].strip()} BETWEEN {self._param()} AND {self._param()}"
+        for op in self.OPERATORS:
+            if column.endswith(op):
+                return f"{column[:-len(op)].strip()}{op}{self._param()}"
+        return f"{column}={self._param()}"
+
+    # Appends a predicate, joined with AND to the previous ones.
+    def _predicate(self, sql: str) -> None:
+        self.sql_parts.append(f"{'AND' if self.where_started else 'WHERE'} {sql} ")
+        self.where_started = True
+
+    def select(self, *args: str) -> None:
+        if not args: args = ("*", )
+        self.sql_parts.append(f"SELECT {','.join(args)} FROM {self.model.__table_name__} ")
+
+    def where(self, *args: str) -> None:
+        self._predicate(' and '.join(self._compare(x) for x in args))
+
+    def where_any(self, *args: str) -> None:
+        self._predicate(' and '.join(f'{x}=ANY({self._param()})' for x in args))
+
+    def where_batch(self, columns: tuple, types: tuple) -> None:
+        types = types or tuple(_pg_type(self.model, x) for x in columns)
+        arrays = ','.join(f"{self._param()}::{x}[]" for x in types)
+        self._predicate(f"({','.join(columns)}) IN (SELECT * FROM unnest({arrays}))")
+
+    def after(self, args: tuple, desc: bool) -> None:
+        self._predicate(f"({','.join(args)}) {'<' if desc else '>'} ({','.join(self._param() for _ in args)})")
+
+    def order_by(self, asc: tuple, desc: tuple, nulls_last: tuple, nulls_first: tuple) -> None:
+        columns = ([f'{x} DESC' for x in desc] +
+                   [f'{x} ASC' for x in asc] +
+                   [f'{x} NULLS LAST' for x in nulls_last] +
+                   [f'{x} NULLS FIRST' for x in nulls_first])
+        self.sql_parts.append(f"ORDER BY {','.join(columns)} ")
+
+    def insert(self, *args: str) -> None:
+        self.sql_parts.append(f"INSERT INTO {self.model.__table_name__} ({','.join(args)}) VALUES ({','.join([f'${i}' for i in range(1, len(args)+1)])}) ")
+
+    def on_conflict(self, args: tuple, update: tuple) -> None:
+        action = f"DO UPDATE SET {','.join([f'{x}=EXCLUDED.{x}' for x in update])}" if update else "DO NOTHING"
+        self.sql_parts.append(f"ON CONFLICT ({','.join(args)}) {action} ")
+
+    def delete(self) -> None:
+        self.sql_parts.insert(0, f"DELETE FROM {self.model.__table_name__} ")
+
+    def update(self, *args: str) -> None:
+        self.sql_parts.insert(0, f"UPDATE {self.model.__table_name__} SET {','.join([f'{x}={self._param()}' for x in args])} ")
+
+    def update_all(self, exceptions: tuple) -> None:
+        self.sql_parts.insert(0, f"UPDATE {self.model.__table_name__} SET {','.join([f'{x}={self._param()}' for x in self.model.__fields__ if x not in exceptions])} ")
+
+    def group_by(self, *args: str) -> None:
+        self.sql_parts.append(f"GROUP BY {','.join(args)} ")
+
+    def limit(self, lim: int | None) -> None:
+        self.sql_parts.append(f"LIMIT {self._param() if lim is None else lim} ")
+
+    def count(self) -> None:
+        self.sql_parts.append(f'SELECT COUNT(*) FROM {self.model.__table_name__} ')
+
+# Shapes compiled so far, (model, recorded calls) -> CompiledQuery.
+@lru_cache(maxsize=4096)
+def _compile(model, shape: tuple) -> CompiledQuery:
+    builder = _Builder(model)
+    for name, args in shape:
+        getattr(builder, name)(*args)
+    return CompiledQuery(model, ''.join(builder.sql_parts), builder.params)
+
 # (Brief) Custom Statement Generator - Adapted statement generator with placeholders for asyncpg queries.
 # (Usage) Can be used as fast generator for queries.
 #
+# The calls only record the shape of the query (table, columns, predicate operators, ordering, limit);
+# compile() renders it once per distinct shape and returns the memoized CompiledQuery, so statements built
+# per request cost a dictionary lookup and always produce the same SQL text, prepared once per connection.
+# Placeholders of where/where_any/where_batch/after/update/limit are numbered continuously in call order.
+#
+# A where column may end with an operator:
+#   where('tag', 'created_at>=')            -> tag=$1 AND created_at>=$2
+#   where('id IN'), where('id NOT IN')      -> id=ANY($1), id<>ALL($1)     (one array parameter)
+#   where('created_at BETWEEN')             -> created_at BETWEEN $1 AND $2
+#   where('deleted_at IS NULL')             -> deleted_at IS NULL           (no parameter)
+# Values never go into the SQL text: limit() without a value is a placeholder too.
+#
 class StmtGenerator:
+    OPERATORS = _Builder.OPERATORS
+
     def __init__(self, model):
-        self.sql_parts: List[str] = []
         self.model = model
+        self._shape: List[tuple] = []
 
-    def select(self, *args: str) -> "StmtGenerator":
-        if not args: args = ("*", )
-
-        self.sql_parts.append(f"SELECT {','.join(args)} FROM {self.model.__table_name__} ")
+    def _add(self, name: str, *args: Any) -> "StmtGenerator":
+        self._shape.append((name, args))
         return self
 
+    def select(self, *args: str) -> "StmtGenerator":
+        return self._add("select", *args)
+
     def where(self, *args: str) -> "StmtGenerator":
-        self.sql_parts.append(f"WHERE {' and '.join(f'{x}=${i}' for i, x in enumerate(args, 1))} ")
-        return self
+        return self._add("where", *args)
+
+    def where_any(self, *args: str) -> "StmtGenerator":
+        return self._add("where_any", *args)
+
+    # Batch predicate on several columns: (a,b) IN (SELECT * FROM unnest($1::type[], $2::type[])), one array per
+    # column. Array types default to the ones of the model annotations.
+    def where_batch(self, *args: str, types: tuple = ()) -> "StmtGenerator":
+        return self._add("where_batch", args, tuple(types))
+
+    # Keyset predicate: rows strictly after the cursor values in the (columns) ordering, e.g. (created_at,id) > ($1,$2).
+    def after(self, *args: str, desc: bool = False) -> "StmtGenerator":
+        return self._add("after", args, desc)
 
     def order_by(self,
                  asc: List[str] | tuple = (),
@@ -52,55 +702,50 @@ class StmtGenerator:
                  nulls_last: List[str] | tuple = (),
                  nulls_first: List[str] | tuple = ()
     ) -> "StmtGenerator":
-        self.sql_parts.append(f"ORDER BY {','.join(
-            [f'{x} DESC' for x in desc] + 
-            [f'{x} ASC' for x in asc] + 
-            [f'{x} NULLS LAST' for x in nulls_last] +
-            [f'{x} NULLS FIRST' for x in nulls_first]
-        )}")
-        return self
+        return self._add("order_by", tuple(asc), tuple(desc), tuple(nulls_last), tuple(nulls_first))
 
     def insert(self, *args: str) -> "StmtGenerator":
-        self.sql_parts.append(f"INSERT INTO {self.model.__table_name__} ({','.join(args)}) VALUES ({','.join([f'${i}' for i in range(1, len(args)+1)])}) ")
-        return self
+        return self._add("insert", *args)
+
+    def on_conflict(self, *args: str, update: List[str] | tuple = ()) -> "StmtGenerator":
+        return self._add("on_conflict", args, tuple(update))
 
     def delete(self) -> "StmtGenerator":
-        self.sql_parts.insert(0, f"DELETE FROM {self.model.__table_name__} ")
-        return self
+        return self._add("delete")
 
     def update(self, *args: str) -> "StmtGenerator":
-        self.sql_parts.insert(0, f"UPDATE {self.model.__table_name__} SET {','.join([f'{x}=${i}' for i, x in enumerate(args, 1)])} ")
-        return self
+        return self._add("update", *args)
 
+    # SET every field except `exceptions`, in field order ($1..$n); a following where(key) is $n+1.
     def update_all(self, exceptions:  tuple[Any, ...] | List[str]) -> "StmtGenerator":
-        self.sql_parts.insert(0, f"UPDATE {self.model.__table_name__} SET {','.join([f'{x}=${i}' for i, x in enumerate(self.model.__fields__, 1) if x not in exceptions])} ")
-        return self
+        return self._add("update_all", tuple(exceptions))
 
-    def group_by(self, *args: str):
-        self.sql_parts.append(f"GROUP BY {[','.join(args)]}")
-        return self
+    def group_by(self, *args: str) -> "StmtGenerator":
+        return self._add("group_by", *args)
 
-    def limit(self, lim: int):
-        self.sql_parts.append(f"LIMIT {lim}")
-        return self
+    # Without `lim` the limit is a placeholder, so one statement serves every page size.
+    def limit(self, lim: int | None = None) -> "StmtGenerator":
+        return self._add("limit", lim)
 
-    def count(self):
-        self.sql_parts.append(f'SELECT COUNT(*) FROM {self.model.__table_name__}')
-        return self
+    def count(self) -> "StmtGenerator":
+        return self._add("count")
+
+    # Compiled statement of the recorded shape. The generator is empty again afterwards.
+    def compile(self) -> CompiledQuery:
+        shape, self._shape = tuple(self._shape), []
+        return _compile(self.model, shape)
 
     def sql(self) -> str:
-        final_string: str = ''.join(self.sql_parts)
-        self.sql_parts.clear()
-        return final_string
+        return self.compile().sql
 
     async def value(self, conn: pg.Connection, *args: Any):
-        return await conn.fetchval(''.join(self.sql_parts), args)
+        return await _compile(self.model, tuple(self._shape)).value(conn, *args)
 
     async def first(self, conn: pg.Connection, *args: Any):
-        return self.model(**await conn.fetchrow(''.join(self.sql_parts), *args))
+        return await _compile(self.model, tuple(self._shape)).first(conn, *args)
 
     async def all(self, conn: pg.Connection, *args: Any):
-        return [self.model(**x) for x in conn.fetch(''.join(self.sql_parts), *args)]
+        return await _compile(self.model, tuple(self._shape)).all(conn, *args)
 
 class StmtExt:
     @staticmethod
@@ -0,0 +1,132 @@
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import Any, Callable
+
+import asyncpg
+
+from asyncrepository import metrics
+from asyncrepository.expections import QueryTimeoutError
+
+# (deadline in event loop time, set statement_timeout on leased connections) of the current context.
+_deadline: ContextVar[tuple[float, bool] | None] = ContextVar("asyncrepository_deadline", default=None)
+
+# (Brief) Time budget for every repository call inside the block. Leases (see connection.lease) enforce it
+#         on pool acquisition and on the queries they run: when it passes, the waiting acquire or the running
+#         query is cancelled (asyncpg cancels the statement on the server too) and QueryTimeoutError is raised.
+# (Usage)
+#   with deadline(0.2):
+#       user = await UserRepository.find_by_id(connector, 45)
+#       orders = await OrderRepository.by_user(connector, 45)  # shares what is left of the 200ms
+#
+# Nested deadlines never extend an outer one. Tasks created inside the block inherit the deadline, except the
+# background work of the library (see background()).
+#
+# (Params)
+#   seconds (float) - Budget from now.
+#   server (bool) - Also SET statement_timeout to the remaining budget on connections leased from a pool, so the
+#                   server gives up even if the cancel request is lost. Costs one round trip per lease; the
+#                   setting is reset when the connection returns to the pool.
+#
+@contextmanager
+def deadline(seconds: float, server: bool = False):
+    at = asyncio.get_running_loop().time() + seconds
+    current = _deadline.get()
+    if current is not None:
+        at = min(at, current[0])
+        server = server or current[1]
+
+    token = _deadline.set((at, server))
+    try:
+        yield at
+    finally:
+        _deadline.reset(token)
+
+# (Brief) Starts `coro` as a task without the deadline of the caller. Background work (bus flushes, batched
+#         lookups, aggregate refreshes) is shared by every caller, so it must not run on the budget of the one
+#         that happened to start it. Other context variables are kept.
+def background(coro) -> asyncio.Task:
+    context = copy_context()
+    context.run(_deadline.set, None)
+    return asyncio.get_running_loop().create_task(coro, context=context)
+
+# Seconds left of the current deadline, None without one.
+def remaining() -> float | None:
+    current = _deadline.get()
+    return None if current is None else current[0] - asyncio.get_running_loop().time()
+
+# Timeout scope of a lease, None without a deadline. Raises QueryTimeoutError if the deadline already passed.
+def scope() -> asyncio.Timeout | None:
+    current = _deadline.get()
+    if current is None: return None
+    if current[0] <= asyncio.get_running_loop().time():
+        raise QueryTimeoutError("Deadline exceeded")
+    return asyncio.timeout_at(current[0])
+
+# Milliseconds for statement_timeout if the current deadline asks for it, else None.
+def server_timeout() -> int | None:
+    current = _deadline.get()
+    if current is None or not current[1]: return None
+    return max(1, int((current[0] - asyncio.get_running_loop().time()) * 1000))
+
+# (Brief) Leaves the timeout scope of a lease, turning a passed deadline or a server statement timeout into
+#         QueryTimeoutError. Any other exception is left to propagate.
+async def leave(timeout: asyncio.Timeout | None, exc_type, exc) -> None:
+    if timeout is not None:
+        try:
+            await timeout.__aexit__(exc_type, exc, None)
+        except TimeoutError as e:
+            raise QueryTimeoutError("Deadline exceeded") from e
+    if exc_type is asyncpg.QueryCanceledError and "statement timeout" in str(exc):
+        raise QueryTimeoutError("Statement timeout") from exc
+
+# Fewest query_seconds samples before hedged() trusts the latency quantile.
+HEDGE_MIN_SAMPLES: int = 100
+
+_losers: set = set()
+
+# (Brief) Hedged read: runs `method(*args)` and, if it has not answered after `delay` seconds, runs it a second
+#         time on another pool connection. The first successful answer wins and the other attempt is cancelled.
+# (Usage)
+#   user = await hedged(UserRepository.find_by_id, connector, 45)
+#
+# Only for idempotent reads. Each attempt leases its own connection, so the method must be called with a
+# DBConnector (or on a bound repository); with a plain connection, inside connector.transaction()/session()
+# or when the deadline leaves no time for a second attempt it runs once. Without `delay`, the `quantile`
+# of the method's query_seconds histogram is used (metrics must be enabled and have HEDGE_MIN_SAMPLES
+# samples), otherwise there is no hedging either.
+#
+async def hedged(method: Callable[..., Any], *args: Any, delay: float | None = None, quantile: float = 0.95, **kwargs: Any):
+    owner = getattr(method, "__self__", None)
+    name = f"{getattr(owner, '__name__', owner)}.{method.__name__}"
+    if delay is None and metrics.enabled:
+        histogram = metrics.registry.metrics.get(("query_seconds", (("query", name), )))
+        if histogram is not None and histogram.count >= HEDGE_MIN_SAMPLES: delay = histogram.quantile(quantile)
+
+    conn = args[0] if args else kwargs.get("conn")
+    connector = conn if hasattr(conn, "reader") else None if hasattr(conn, "fetchrow") else getattr(owner, "__connector__", None)
+    left = remaining()
+    if delay is None or connector is None or connector.current() is not None or (left is not None and left <= delay):
+        return await method(*args, **kwargs)
+
+    attempts = [asyncio.ensure_future(method(*args, **kwargs))]
+    try:
+        done, _ = await asyncio.wait(attempts, timeout=delay)
+        if not done:
+            if metrics.enabled: metrics.registry.counter("query_hedges_total", query=name).inc()
+            attempts.append(asyncio.ensure_future(method(*args, **kwargs)))
+
+        pending, error = list(attempts), None
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                pending.remove(task)
+                if task.exception() is None: return task.result()
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in attempts:
+            if not task.done():
+                task.cancel()
+                _losers.add(task)
+                task.add_done_callback(_losers.discard)
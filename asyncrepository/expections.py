@@ -1,2 +1,12 @@
 
-class DatabaseError(Exception): pass
\ No newline at end of file
+class DatabaseError(Exception): pass
+
+# Raised when the deadline of an operation passes (see deadline.py) or the server cancels a statement
+# for exceeding statement_timeout. Also a TimeoutError, so generic timeout handling catches it.
+class QueryTimeoutError(DatabaseError, TimeoutError): pass
+
+# Raised instead of queueing when too many calls already wait for a connection (see fanout.py).
+class OverloadError(DatabaseError): pass
+
+# Raised for a malformed or foreign keyset pagination cursor.
+class CursorError(ValueError): pass
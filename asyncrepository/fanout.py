@@ -0,0 +1,95 @@
+import asyncio
+import inspect
+from collections import deque
+from time import perf_counter
+from typing import Any, Awaitable, Callable, Deque, List
+
+from asyncrepository import metrics
+from asyncrepository.expections import OverloadError
+
+# Calls of one fan-out running at once, unless gather() is given a limit.
+CALL_LIMIT: int = 4
+
+# (Brief) Concurrency budget with a FIFO queue: a released slot is handed to the longest waiting caller
+#         instead of whoever asks next, so a burst of new calls can not starve queued ones. With `max_queue`,
+#         callers arriving at a full queue get OverloadError at once (load shedding) instead of waiting.
+class FairLimiter:
+    def __init__(self, limit: int, max_queue: int | None = None):
+        self.limit = limit
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self) -> None:
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        if self.max_queue is not None and len(self._waiters) >= self.max_queue:
+            raise OverloadError(f"{len(self._waiters)} calls already wait for a connection")
+
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release() # the slot was handed over just before the cancellation
+            else:
+                try:
+                    self._waiters.remove(future)
+                except ValueError:
+                    pass
+            raise
+
+    def release(self) -> None:
+        while self._waiters:
+            future = self._waiters.popleft()
+            if not future.done():
+                future.set_result(None) # the slot passes on, active stays the same
+                return
+        self.active -= 1
+
+# (Brief) Runs independent repository calls concurrently under the limiter of `connector`, each on its own
+#         pooled connection, and returns their results in order. See DBConnector.gather.
+async def gather(
+        connector,
+        *calls: Awaitable[Any] | Callable[[], Awaitable[Any]],
+        limit: int | None = None,
+        return_exceptions: bool = False
+) -> List[Any]:
+    limiter = connector.fanout
+    own = asyncio.Semaphore(limit or CALL_LIMIT)
+
+    async def run(call):
+        try:
+            async with own:
+                if not metrics.enabled:
+                    await limiter.acquire()
+                else:
+                    start = perf_counter()
+                    try:
+                        await limiter.acquire()
+                    except OverloadError:
+                        metrics.registry.counter("fanout_shed_total", pool=connector.name).inc()
+                        raise
+                    metrics.registry.histogram("fanout_wait_seconds", pool=connector.name).record(perf_counter() - start)
+                try:
+                    return await (call() if callable(call) else call)
+                finally:
+                    limiter.release()
+        finally:
+            if inspect.iscoroutine(call): call.close() # never awaited if shed or cancelled while queued
+
+    tasks = [asyncio.ensure_future(run(x)) for x in calls]
+    if return_exceptions:
+        return await asyncio.gather(*tasks, return_exceptions=True)
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks: task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
@@ -0,0 +1,130 @@
+import asyncio
+from typing import Any, Dict, List
+
+from asyncpg import Connection
+
+from asyncrepository.deadline import background
+
+# Keys collected for one connection source: a DBConnector (shared by callers) or one connection.
+class _Batch:
+    __slots__ = ("source", "futures", "handle", "full")
+
+    def __init__(self, source: Any):
+        self.source = source
+        self.futures: Dict[Any, asyncio.Future] = {}
+        self.handle: asyncio.Handle | None = None
+        self.full = asyncio.Event()
+
+# (Brief) DataLoader-style batching of primary key lookups. Keys requested within one
+#         window are deduplicated and fetched with a single repository.find_by_ids call.
+# (Usage) Created by Repository.enable_batching, so find_by_id goes through load().
+#
+# A batch only spans callers when it can run on a connection of its own: callers passing a DBConnector
+# (outside of its transaction()/session() blocks), or passing a connection outside of a transaction while
+# the loader has a connector. Other callers batch per connection, so they only share a query with callers
+# of the same connection and see what their transaction sees; their batch runs in the task of its first
+# caller, while it still holds the connection.
+#
+# (Params)
+#   repository (Repository class) - Repository whose find_by_ids runs the batches.
+#   connector (DBConnector) - Pool the shared batches run on. If None, batches span only the callers
+#                             that pass a DBConnector.
+#   window (float) - Seconds to collect keys for. 0 dispatches on the next event-loop iteration.
+#   max_batch_size (int) - Batch is dispatched as soon as it holds this many keys.
+#
+class BatchLoader:
+    def __init__(self, repository, connector=None, window: float = 0.0, max_batch_size: int = 1000):
+        self.repository = repository
+        self.connector = connector
+        self.window = window
+        self.max_batch_size = max_batch_size
+
+        self._batches: Dict[Any, _Batch] = {} # source -> batch collecting keys
+        self._tasks = set()
+
+    # (DBConnector to share the batch through, None) or (None, connection the caller's batch is bound to).
+    def _source(self, conn) -> tuple:
+        if hasattr(conn, "reader"):
+            held = conn.current()
+            return (None, held) if held is not None else (self.connector or conn, None)
+        if self.connector is not None and not conn.is_in_transaction():
+            return self.connector, None
+        return None, conn
+
+    async def load(self, conn: Connection, key: Any):
+        connector, held = self._source(conn)
+        source = connector if connector is not None else held
+        batch = self._batches.get(source)
+        leader = batch is None
+        if leader:
+            batch = self._batches[source] = _Batch(source)
+            if connector is not None:
+                loop = asyncio.get_running_loop()
+                batch.handle = loop.call_soon(self._dispatch, batch) if self.window <= 0 else loop.call_later(self.window, self._dispatch, batch)
+
+        future = batch.futures.get(key)
+        if future is None:
+            future = batch.futures[key] = asyncio.get_running_loop().create_future()
+            if len(batch.futures) >= self.max_batch_size:
+                if connector is not None: self._dispatch(batch)
+                else: batch.full.set()
+
+        if connector is None and leader:
+            await self._lead(batch)
+        try:
+            # Shielded, so a cancelled caller does not cancel the future shared with other callers of the same key.
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            if connector is None and future.cancelled() and not leader:
+                return await self.load(conn, key) # the leader was cancelled before its batch ran
+            raise
+
+    def _close(self, batch: _Batch) -> None:
+        if batch.handle is not None:
+            batch.handle.cancel()
+            batch.handle = None
+        if self._batches.get(batch.source) is batch:
+            del self._batches[batch.source]
+
+    # Shared batch: runs on the connector, in the background.
+    def _dispatch(self, batch: _Batch) -> None:
+        self._close(batch)
+        if not batch.futures: return
+
+        task = background(self._fetch(batch.source, batch.futures)) # shared by every waiter, not bound to the deadline of the first
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # Batch of one connection: collected for the window, then run by its first caller on that connection.
+    async def _lead(self, batch: _Batch) -> None:
+        try:
+            if self.window <= 0:
+                await asyncio.sleep(0)
+            else:
+                try:
+                    await asyncio.wait_for(batch.full.wait(), self.window)
+                except TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            self._close(batch)
+            for future in batch.futures.values(): future.cancel()
+            raise
+        self._close(batch)
+        await self._fetch(batch.source, batch.futures)
+
+    async def _fetch(self, conn: Connection, batch: Dict[Any, asyncio.Future]) -> None:
+        keys: List[Any] = list(batch)
+        try:
+            # With a connector, find_by_ids leases the connection itself (a replica if there are any).
+            entities = await self.repository.find_by_ids(conn, keys)
+        except asyncio.CancelledError:
+            for future in batch.values(): future.cancel()
+            raise
+        except Exception as e:
+            for future in batch.values():
+                if not future.done(): future.set_exception(e)
+            return
+
+        for key, entity in zip(keys, entities):
+            future = batch[key]
+            if not future.done(): future.set_result(entity)
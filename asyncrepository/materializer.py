@@ -0,0 +1,116 @@
+from dataclasses import MISSING, fields, is_dataclass
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Sequence, Tuple
+
+from asyncpg import Record
+
+from asyncrepository import metrics
+
+# (Brief) Compiled Record -> entity constructors. For every (model, result columns) pair a function is
+#         generated that creates the entity without calling __init__ and stores each attribute from the
+#         record by its precomputed position: no kwargs dict per row, no dataclass __init__.
+# (Usage) materialize(model, row) / materialize_all(model, rows) replace model(**row) on every read path.
+#
+# Constructors are built on first use rather than in @entity, since @dataclass(slots=True) is applied
+# after @entity and replaces the class. Models with a custom __setattr__ (e.g. frozen dataclasses) are
+# built through __init__ with keyword arguments passed by position of the record. Rows that are not
+# asyncpg Records (e.g. dicts) and results whose columns do not fit the model (unknown columns, missing
+# fields without defaults) go through model(**row), which keeps its errors.
+
+_materializers: Dict[Tuple[type, Tuple[str, ...]], Callable[[Record], Any] | None] = {}
+_lazy_classes: Dict[Tuple[type, Tuple[str, ...]], type] = {}
+
+def _defaults(model) -> Dict[str, str]:
+    # name -> expression of the default, evaluated against the generated function's namespace
+    result = {}
+    for field in fields(model):
+        if field.default is not MISSING:
+            result[field.name] = f"_defaults[{field.name!r}].default"
+        elif field.default_factory is not MISSING:
+            result[field.name] = f"_defaults[{field.name!r}].default_factory()"
+    return result
+
+def _compile(model, columns: Tuple[str, ...]) -> Callable[[Record], Any] | None:
+    if not is_dataclass(model): return None
+
+    names = [x.name for x in fields(model)]
+    if any(x not in names for x in columns): return None
+
+    defaults = _defaults(model)
+    missing = [x for x in names if x not in columns]
+    if any(x not in defaults for x in missing): return None
+
+    namespace: Dict[str, Any] = {"_new": object.__new__, "_cls": model, "_defaults": model.__dataclass_fields__}
+    values = [(name, f"row[{i}]") for i, name in enumerate(columns)] + [(name, defaults[name]) for name in missing]
+
+    if model.__setattr__ is object.__setattr__:
+        lines = ["def build(row):", "    obj = _new(_cls)"]
+        lines += [f"    obj.{name} = {value}" for name, value in values]
+        if hasattr(model, "__post_init__"):
+            lines.append("    obj.__post_init__()")
+        lines.append("    return obj")
+    else:
+        lines = ["def build(row):", f"    return _cls({', '.join(f'{name}={value}' for name, value in values if name in columns)})"]
+
+    exec("\n".join(lines), namespace)
+    return namespace["build"]
+
+# Returns the compiled constructor for records with `columns`, None if the model can not use one.
+def materializer(model, columns: Tuple[str, ...]) -> Callable[[Record], Any] | None:
+    key = (model, columns)
+    try:
+        return _materializers[key]
+    except KeyError:
+        build = _materializers[key] = _compile(model, columns)
+        return build
+
+def materialize(model, row: Record | None):
+    if row is None: return None
+    if isinstance(row, Record):
+        build = materializer(model, tuple(row.keys()))
+        if build is not None: return build(row)
+    return model(**row)
+
+def materialize_all(model, rows: Sequence[Record]) -> List[Any]:
+    if not rows: return []
+    if metrics.enabled:
+        start = perf_counter()
+        entities = _materialize_all(model, rows)
+        metrics.materialized(model, len(rows), start)
+        return entities
+    return _materialize_all(model, rows)
+
+def _materialize_all(model, rows: Sequence[Record]) -> List[Any]:
+    if isinstance(rows[0], Record):
+        build = materializer(model, tuple(rows[0].keys()))
+        if build is not None: return list(map(build, rows))
+    return [model(**x) for x in rows]
+
+# (Brief) Read-only entities backed by their Record: a subclass of the model whose fields are properties
+#         reading the record by position, so no per-field work happens until a field is accessed.
+# (Usage) Cheap wrappers for large read-only results; call to_entity() for a regular, mutable entity.
+def lazy_class(model, columns: Tuple[str, ...]) -> type:
+    key = (model, columns)
+    cls = _lazy_classes.get(key)
+    if cls is not None: return cls
+
+    def getter(i):
+        return property(lambda self: self._row[i])
+
+    namespace = {name: getter(i) for i, name in enumerate(columns)}
+    namespace["__slots__"] = ("_row", )
+    namespace["to_entity"] = lambda self: materialize(model, self._row)
+    cls = _lazy_classes[key] = type(f"Lazy{model.__name__}", (model, ), namespace)
+    return cls
+
+def materialize_lazy(model, rows: Sequence[Record]) -> List[Any]:
+    if not rows: return []
+
+    cls = lazy_class(model, tuple(rows[0].keys()))
+    new, slot = object.__new__, cls._row.__set__
+    entities = []
+    for row in rows:
+        obj = new(cls)
+        slot(obj, row)
+        entities.append(obj)
+    return entities
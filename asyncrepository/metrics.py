@@ -0,0 +1,247 @@
+from functools import wraps
+from time import perf_counter
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# (Brief) Instrumentation of repositories, pools and caches: per-query latency histograms and counters,
+#         pool saturation gauges, cache hit/miss/eviction counts and entity build time.
+# (Usage)
+#   metrics.enable()
+#   ...
+#   metrics.registry.export(metrics.snapshot)   # nested dicts, e.g. for a /debug endpoint
+#   metrics.registry.export(metrics.prometheus) # Prometheus text exposition format
+#
+# Everything is recorded only while `enabled` is true; when disabled the instrumented paths only check
+# the flag. Series are identified by name and labels:
+#   query_seconds / query_calls_total / query_errors_total / query_rows_total {query="UserRepository.find_by_id"}
+#   pool_acquire_seconds, pool_size, pool_idle, pool_max_size {pool="default"}
+#   cache_hits_total / cache_misses_total / cache_evictions_total / cache_entries / cache_weight {cache="..."}
+#   materialize_seconds / materialize_rows_total {model="UserExample"}
+
+enabled: bool = False
+
+PREFIX: str = "asyncrepository_"
+
+def enable() -> None:
+    global enabled
+    enabled = True
+
+def disable() -> None:
+    global enabled
+    enabled = False
+
+# (Brief) HDR-style log-linear histogram of durations: values are recorded in microseconds into buckets
+#         that are linear within each power of two (16 sub-buckets), so every bucket is within ~6% of its
+#         values at any magnitude with no configuration, and recording is O(1).
+class Histogram:
+    SUB_BITS = 4
+
+    def __init__(self):
+        self.counts: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    @classmethod
+    def _index(cls, micros: int) -> int:
+        shift = max(0, micros.bit_length() - cls.SUB_BITS - 1)
+        return (shift << cls.SUB_BITS) + (micros >> shift)
+
+    # Upper bound of the bucket in seconds.
+    @classmethod
+    def _upper(cls, index: int) -> float:
+        if index < 2 << cls.SUB_BITS:
+            return (index + 1) / 1e6
+        shift = (index >> cls.SUB_BITS) - 1
+        return (((index - (shift << cls.SUB_BITS)) + 1) << shift) / 1e6
+
+    def record(self, seconds: float) -> None:
+        micros = int(seconds * 1000000)
+        shift = micros.bit_length() - self.SUB_BITS - 1
+        index = micros if shift <= 0 else (shift << self.SUB_BITS) + (micros >> shift) # inlined _index
+        counts = self.counts
+        counts[index] = counts.get(index, 0) + 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max: self.max = seconds
+
+    # Upper bound of the bucket holding the q-th quantile (0 < q <= 1).
+    def quantile(self, q: float) -> float:
+        if not self.count: return 0.0
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen >= rank:
+                return min(self._upper(index), self.max)
+        return self.max
+
+    # [(upper bound in seconds, cumulative count)] of the non-empty buckets.
+    def buckets(self) -> List[Tuple[float, int]]:
+        result, seen = [], 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            result.append((self._upper(index), seen))
+        return result
+
+    def reset(self) -> None:
+        self.counts.clear()
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+# Monotonic counter. With `func`, the value is read from it on export instead.
+class Counter:
+    def __init__(self, func: Optional[Callable[[], float]] = None):
+        self.func = func
+        self._value = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value if self.func is None else self.func()
+
+    def reset(self) -> None:
+        self._value = 0
+
+# Current value. With `func`, the value is read from it on export (pool sizes, cache entries).
+class Gauge(Counter):
+    def set(self, value: float) -> None:
+        self._value = value
+
+# (Brief) Metric series by (name, labels). Metrics are created on first use and kept until reset.
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Any] = {}
+
+    def _get(self, kind: type, name: str, labels: Dict[str, str], func: Optional[Callable[[], float]] = None):
+        key = (name, tuple(sorted(labels.items())))
+        metric = self.metrics.get(key)
+        if metric is None:
+            metric = self.metrics[key] = kind() if func is None else kind(func)
+        elif func is not None:
+            metric.func = func
+        return metric
+
+    def counter(self, name: str, func: Optional[Callable[[], float]] = None, **labels: str) -> Counter:
+        return self._get(Counter, name, labels, func)
+
+    def gauge(self, name: str, func: Optional[Callable[[], float]] = None, **labels: str) -> Gauge:
+        return self._get(Gauge, name, labels, func)
+
+    def histogram(self, name: str, **labels: str) -> Histogram:
+        return self._get(Histogram, name, labels)
+
+    def unregister(self, **labels: str) -> None:
+        items = set(labels.items())
+        for key in [x for x in self.metrics if items <= set(x[1])]:
+            del self.metrics[key]
+
+    # Resets recorded values, callback metrics keep reading their source.
+    def reset(self) -> None:
+        for metric in self.metrics.values():
+            metric.reset()
+
+    # Exporters are callables receiving the registry: snapshot, prometheus or your own.
+    def export(self, exporter: Callable[["Registry"], Any]) -> Any:
+        return exporter(self)
+
+registry = Registry()
+
+# (Brief) Exporter: {name: [{"labels": {...}, ...values}]}. Histograms report count, sum, max and quantiles in seconds.
+def snapshot(registry: Registry = registry) -> Dict[str, List[Dict[str, Any]]]:
+    result: Dict[str, List[Dict[str, Any]]] = {}
+    for (name, labels), metric in sorted(registry.metrics.items(), key=lambda x: x[0]):
+        entry: Dict[str, Any] = {"labels": dict(labels)}
+        if isinstance(metric, Histogram):
+            entry.update(
+                count=metric.count, sum=metric.sum, max=metric.max,
+                p50=metric.quantile(0.5), p90=metric.quantile(0.9), p99=metric.quantile(0.99), p999=metric.quantile(0.999)
+            )
+        else:
+            entry["value"] = metric.value
+        result.setdefault(name, []).append(entry)
+    return result
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _labels(labels: Tuple[Tuple[str, str], ...], extra: str = "") -> str:
+    items = [f'{k}="{_escape(v)}"' for k, v in labels]
+    if extra: items.append(extra)
+    return "{" + ",".join(items) + "}" if items else ""
+
+# (Brief) Exporter: Prometheus text exposition format (version 0.0.4).
+def prometheus(registry: Registry = registry) -> str:
+    lines: List[str] = []
+    declared = set()
+    for (name, labels), metric in sorted(registry.metrics.items(), key=lambda x: x[0]):
+        full = PREFIX + name
+        kind = "histogram" if isinstance(metric, Histogram) else "gauge" if isinstance(metric, Gauge) else "counter"
+        if full not in declared:
+            declared.add(full)
+            lines.append(f"# TYPE {full} {kind}")
+
+        if isinstance(metric, Histogram):
+            for upper, count in metric.buckets():
+                le = 'le="%.6g"' % upper
+                lines.append(f"{full}_bucket{_labels(labels, le)} {count}")
+            le = 'le="+Inf"'
+            lines.append(f"{full}_bucket{_labels(labels, le)} {metric.count}")
+            lines.append(f"{full}_sum{_labels(labels)} {metric.sum}")
+            lines.append(f"{full}_count{_labels(labels)} {metric.count}")
+        else:
+            lines.append(f"{full}{_labels(labels)} {metric.value}")
+    return "\n".join(lines) + "\n"
+
+# (Brief) Times a repository method (cls, conn, ...) into query_seconds / query_calls_total / query_errors_total
+#         and counts the rows it returned, under query="<repository class>.<method>".
+# (Usage) Applied by the query decorators and the Repository methods, below @classmethod.
+#         `name` replaces the method name in the label.
+#
+# The wrapper is a plain function: while metrics are disabled it returns the coroutine of the method itself,
+# so an instrumented call costs one function call and no extra coroutine.
+def instrument(func, name: str | None = None):
+    method = name or func.__name__
+    series: Dict[type, Tuple[Histogram, Counter, Counter, Counter]] = {}
+
+    async def timed(cls, args, kwargs):
+        metrics = series.get(cls)
+        if metrics is None:
+            name = f"{getattr(cls, '__name__', cls)}.{method}"
+            metrics = series[cls] = (
+                registry.histogram("query_seconds", query=name),
+                registry.counter("query_calls_total", query=name),
+                registry.counter("query_errors_total", query=name),
+                registry.counter("query_rows_total", query=name),
+            )
+
+        start = perf_counter()
+        try:
+            result = await func(cls, *args, **kwargs)
+        except BaseException:
+            metrics[2].inc()
+            raise
+        finally:
+            metrics[0].record(perf_counter() - start)
+            metrics[1].inc()
+
+        if isinstance(result, list):
+            metrics[3].inc(len(result))
+        elif result is not None:
+            metrics[3].inc()
+        return result
+
+    @wraps(func)
+    def wrapper(cls, *args, **kwargs):
+        if not enabled:
+            return func(cls, *args, **kwargs)
+        return timed(cls, args, kwargs)
+    return wrapper
+
+# Records the time spent building `rows` entities of `model` since `start` (perf_counter).
+def materialized(model, rows: int, start: float) -> None:
+    name = getattr(model, "__name__", str(model))
+    registry.histogram("materialize_seconds", model=name).record(perf_counter() - start)
+    registry.counter("materialize_rows_total", model=name).inc(rows)
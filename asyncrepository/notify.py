@@ -0,0 +1,220 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Any, Dict, List
+from uuid import uuid4
+
+from asyncpg import Connection
+
+from asyncrepository.deadline import background
+
+logger = logging.getLogger(__name__)
+
+# Postgres rejects NOTIFY payloads of 8000 bytes or more.
+MAX_PAYLOAD: int = 7900
+
+# Pending invalidations of one table: keys to evict, or clear=True to drop everything.
+class _Pending:
+    __slots__ = ("keys", "inserted", "clear")
+
+    def __init__(self):
+        self.keys = set()
+        self.inserted = False
+        self.clear = False
+
+# (Brief) Cross-process cache invalidation over Postgres LISTEN/NOTIFY.
+# (Usage) Every process creates a bus, registers its repositories and starts it:
+#
+#   bus = InvalidationBus(connector)
+#   bus.register(UserRepository)
+#   await bus.start()
+#
+# Repository writes publish the written keys. Keys are collected for `flush_interval` seconds,
+# coalesced per table and sent with one pg_notify per payload on a pooled connection. Keys that could not be
+# sent are kept (up to max_keys per table, beyond that the table is sent as one "clear") and retried with
+# exponential backoff up to max_retry_delay seconds. A dedicated
+# listener connection receives the notifications of the other processes and evicts the keys from
+# the local caches of every repository registered for that table. If the listener connection is
+# lost, notifications may have been missed, so all registered caches are cleared before reconnecting.
+#
+# Keys travel as JSON: tuples become lists and are turned back into tuples, keys JSON can not
+# represent are sent as strings and will not match, so such tables should be invalidated with
+# invalidate_all.
+#
+# (Params)
+#   connector (DBConnector) - Pool used for NOTIFY and source of the listener connection.
+#   channel_prefix (str) - Channel of a table is channel_prefix + table name.
+#   flush_interval (float) - Seconds to coalesce invalidations for before sending them.
+#   max_keys (int) - Tables with more pending keys are sent as a single "clear" notification.
+#   max_retry_delay (float) - Longest wait between attempts while NOTIFY fails.
+#
+class InvalidationBus:
+    def __init__(
+            self,
+            connector,
+            channel_prefix: str = "",
+            flush_interval: float = 0.05,
+            max_keys: int = 10000,
+            reconnect_delay: float = 1.0,
+            max_retry_delay: float = 30.0
+    ):
+        self.connector = connector
+        self.channel_prefix = channel_prefix
+        self.flush_interval = flush_interval
+        self.max_keys = max_keys
+        self.reconnect_delay = reconnect_delay
+        self.max_retry_delay = max_retry_delay
+        self.origin = uuid4().hex # ignores own notifications
+
+        self._repositories: Dict[str, List[Any]] = defaultdict(list) # table -> repositories
+        self._pending: Dict[str, _Pending] = {}
+        self._handle: asyncio.TimerHandle | None = None
+        self._failures = 0 # flushes failed in a row
+        self._listener: Connection | None = None
+        self._tasks = set()
+        self._running = False
+
+    def register(self, *repositories) -> None:
+        for repository in repositories:
+            repository.__bus__ = self
+            self._repositories[repository.__model__.__table_name__].append(repository)
+
+    def channel(self, table: str) -> str:
+        return f"{self.channel_prefix}{table}"
+
+    async def start(self) -> None:
+        self._running = True
+        await self._listen()
+
+    async def stop(self) -> None:
+        self._running = False
+        try:
+            await self.flush()
+        finally:
+            if self._handle is not None: # no retries once stopped
+                self._handle.cancel()
+                self._handle = None
+            if self._listener is not None:
+                listener, self._listener = self._listener, None
+                await listener.close()
+
+    # Queues an invalidation of `keys` (None clears the table) to be sent with the next flush.
+    def publish(self, table: str, keys: List[Any] | None, inserted: bool = False) -> None:
+        self._queue(table, keys, inserted)
+        if self._handle is None:
+            self._schedule(self.flush_interval)
+
+    def _queue(self, table: str, keys: List[Any] | None, inserted: bool) -> None:
+        pending = self._pending.get(table)
+        if pending is None:
+            pending = self._pending[table] = _Pending()
+
+        pending.inserted |= inserted
+        if keys is None:
+            pending.clear = True
+        elif not pending.clear:
+            pending.keys.update(keys)
+            if len(pending.keys) > self.max_keys:
+                pending.clear = True
+        if pending.clear:
+            pending.keys.clear()
+
+    def _schedule(self, delay: float) -> None:
+        self._handle = asyncio.get_running_loop().call_later(delay, self._schedule_flush)
+
+    def _schedule_flush(self) -> None:
+        self._handle = None
+        task = background(self._flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    # Timed flush: nobody awaits it, so a failure is logged here. flush() already queued the retry.
+    async def _flush(self) -> None:
+        try:
+            await self.flush()
+        except Exception:
+            logger.warning(
+                "Could not send cache invalidations (%d failures in a row), retrying", self._failures, exc_info=True
+            )
+
+    async def flush(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+        pending, self._pending = self._pending, {}
+        if not pending: return
+
+        try:
+            async with self.connector.get_connection() as conn:
+                for table, item in pending.items():
+                    for payload in self._payloads(item):
+                        await conn.execute("SELECT pg_notify($1, $2)", self.channel(table), payload)
+        except Exception:
+            # Not sent: resend later rather than leave other processes stale, backing off while it keeps failing.
+            self._failures += 1
+            for table, item in pending.items():
+                self._queue(table, None if item.clear else list(item.keys), item.inserted)
+            if self._handle is not None: self._handle.cancel()
+            self._schedule(min(self.flush_interval * 2 ** min(self._failures, 32), self.max_retry_delay))
+            raise
+        self._failures = 0
+
+    def _payloads(self, item: _Pending):
+        if item.clear:
+            yield json.dumps({"o": self.origin, "c": True})
+            return
+
+        chunks = [list(item.keys)]
+        while chunks:
+            keys = chunks.pop()
+            payload = json.dumps({"o": self.origin, "k": keys, "i": item.inserted}, default=str)
+            if len(payload.encode()) <= MAX_PAYLOAD:
+                yield payload
+            elif len(keys) > 1:
+                middle = len(keys) // 2
+                chunks.extend((keys[middle:], keys[:middle]))
+            else:
+                yield json.dumps({"o": self.origin, "c": True})
+
+    async def _listen(self) -> None:
+        listener = await self.connector.connect()
+        try:
+            for table in self._repositories:
+                await listener.add_listener(self.channel(table), self._on_notify)
+        except Exception:
+            await listener.close()
+            raise
+        listener.add_termination_listener(self._on_terminate)
+        self._listener = listener
+
+    def _on_notify(self, conn: Connection, pid: int, channel: str, payload: str) -> None:
+        message = json.loads(payload)
+        if message["o"] == self.origin: return
+
+        table = channel[len(self.channel_prefix):]
+        keys = None if message.get("c") else [tuple(x) if isinstance(x, list) else x for x in message["k"]]
+        self.connector.mark_written(table) # replicas may not have the write yet
+        for repository in self._repositories.get(table, ()):
+            repository._remote_written(keys, message.get("i", False))
+
+    def _on_terminate(self, conn: Connection) -> None:
+        if conn is not self._listener: return
+        self._listener = None
+        self.connector.mark_written()
+        for repositories in self._repositories.values():
+            for repository in repositories:
+                repository._remote_written(None)
+
+        if self._running:
+            task = asyncio.ensure_future(self._reconnect())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _reconnect(self) -> None:
+        while self._running and self._listener is None:
+            try:
+                await self._listen()
+            except Exception:
+                await asyncio.sleep(self.reconnect_delay)
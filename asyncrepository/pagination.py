@@ -0,0 +1,55 @@
+import base64
+import json
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, List, Tuple
+from uuid import UUID
+
+from asyncrepository.expections import CursorError
+
+# Types JSON can not represent are tagged: {"$t": tag, "v": text}.
+_ENCODERS: Dict[type, Tuple[str, Callable[[Any], str]]] = {
+    datetime:  ("dt", datetime.isoformat),
+    date:      ("d", date.isoformat),
+    time:      ("t", time.isoformat),
+    timedelta: ("td", lambda x: repr(x.total_seconds())),
+    Decimal:   ("dec", str),
+    UUID:      ("uuid", str),
+    bytes:     ("b", lambda x: base64.b64encode(x).decode()),
+}
+
+_DECODERS: Dict[str, Callable[[str], Any]] = {
+    "dt":   datetime.fromisoformat,
+    "d":    date.fromisoformat,
+    "t":    time.fromisoformat,
+    "td":   lambda x: timedelta(seconds=float(x)),
+    "dec":  Decimal,
+    "uuid": UUID,
+    "b":    base64.b64decode,
+}
+
+def _encode_value(value: Any) -> Any:
+    encoder = _ENCODERS.get(type(value))
+    if encoder is None: return value
+    tag, encode = encoder
+    return {"$t": tag, "v": encode(value)}
+
+def _decode_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        return _DECODERS[value["$t"]](value["v"])
+    return value
+
+# (Brief) Encodes the ordering column values of the last row of a page into an opaque, URL-safe cursor.
+def encode_cursor(values: Tuple[Any, ...] | List[Any]) -> str:
+    data = json.dumps([_encode_value(x) for x in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+# (Brief) Decodes a cursor made by encode_cursor. Raises CursorError if it is malformed.
+def decode_cursor(cursor: str) -> Tuple[Any, ...]:
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data)
+        if not isinstance(values, list): raise ValueError("cursor is not a list")
+        return tuple(_decode_value(x) for x in values)
+    except (ValueError, KeyError, TypeError) as e:
+        raise CursorError(f"Invalid page cursor: {cursor!r}") from e
@@ -1,73 +1,301 @@
-from dataclasses import astuple
-from typing import Set, List
+import asyncio
+import logging
+import time
+from functools import wraps
+from operator import attrgetter
+from typing import List, Any, Callable, Dict, Iterable, AsyncIterable
 
 import asyncpg
 from asyncpg import Connection
 
-from asyncrepository.connection import StmtGenerator
-from asyncrepository.expections import DatabaseError
+from asyncrepository.connection import StmtGenerator, after_commit, lease, statements
+from asyncrepository.expections import DatabaseError, CursorError
 from asyncrepository.entity import BaseEntity
-from asyncrepository.cache import LRUCache, TTLCache
+from asyncrepository.cache import CachePolicy, LRUCache, TTLCache, QueryCache, AggregateCache
+from asyncrepository.bloom import CountingBloomFilter
+from asyncrepository.loader import BatchLoader
+from asyncrepository.deadline import background
+from asyncrepository.singleflight import SingleFlight
+from asyncrepository import columnar, metrics
+from asyncrepository.materializer import materialize, materialize_all, materialize_lazy
+from asyncrepository.pagination import encode_cursor, decode_cursor
+
+logger = logging.getLogger(__name__)
 
 # Class Decorator - Used to statically generate common queries for the concrete repository.
 def repository(model: BaseEntity.__class__ = None):
     def decorator(cls):
+        cls.__caches__ = _collect_caches(cls)
+        _register_cache_metrics(cls)
         if model is None: return cls
 
         cls.__model__ = model
 
         stmt = StmtGenerator(model=model)
+        fields = tuple(model.__fields__)
+        values = tuple(x for x in fields if x != model.__key__)
+        staging = f"_{model.__table_name__}_staging"
+
+        cls.__columns__ = fields
+        cls.__key_index__ = fields.index(model.__key__)
+        cls.__record__  = attrgetter(*fields) if len(fields) > 1 else lambda entity: (getattr(entity, fields[0]), )
+        cls.__update_record__ = attrgetter(*values, model.__key__) if values else lambda entity: (getattr(entity, model.__key__), )
+
+        cls.__find_all_query__       = stmt.select().sql()
+        cls.__find_by_id_query__     = stmt.select().where(model.__key__).sql()
+        cls.__find_by_ids_query__    = stmt.select().where_any(model.__key__).sql()
+        cls.__exists_by_id_query__   = f"SELECT EXISTS({stmt.select('1').where(model.__key__).sql().strip()})"
+        cls.__keys_query__           = stmt.select(model.__key__).sql()
+        cls.__insert_query__         = stmt.insert(*fields).sql()
+        cls.__upsert_query__         = stmt.insert(*fields).on_conflict(model.__key__, update=values).sql()
+        cls.__delete_by_id_query__   = stmt.delete().where(model.__key__).sql()
+        cls.__delete_many_query__    = stmt.delete().where_any(model.__key__).sql() + f"RETURNING {model.__key__}"
+        cls.__update_query__         = stmt.update_all(exceptions=(model.__key__, )).where(model.__key__).sql()
+        cls.__count_query__          = stmt.count().sql()
+        cls.__page_queries__         = {} # (order, desc, first page) -> sql, filled by page()
 
-        cls.__find_all_query__     = stmt.select().sql()
-        cls.__find_by_id_query__   = stmt.select().where(model.__key__).sql()
-        cls.__insert_query__       = stmt.insert(model.__key__).sql()
-        cls.__delete_by_id_query__ = stmt.delete().where(model.__key__).sql()
-        cls.__update_query__       = stmt.update_all(exceptions=model.__key__).where(model.__key__).sql()
-        cls.__count_query__        = stmt.count().sql()
+        # Staging table used by upsert_many for batches large enough to go through COPY.
+        cls.__staging_table__        = staging
+        cls.__create_staging_query__ = f"CREATE TEMP TABLE {staging} (LIKE {model.__table_name__} INCLUDING DEFAULTS) ON COMMIT DROP"
+        cls.__merge_staging_query__  = (f"INSERT INTO {model.__table_name__} ({','.join(fields)}) "
+                                        f"SELECT {','.join(fields)} FROM {staging} "
+                                        + StmtGenerator(model=model).on_conflict(model.__key__, update=values).sql())
+        cls.__truncate_staging_query__ = f"TRUNCATE {staging}"
+        cls.__drop_staging_query__     = f"DROP TABLE {staging}" # ON COMMIT DROP waits for the caller's transaction
+
+        statements.add(cls.__find_all_query__, cls.__find_by_id_query__, cls.__find_by_ids_query__, cls.__exists_by_id_query__,
+                       cls.__insert_query__, cls.__upsert_query__, cls.__delete_by_id_query__,
+                       cls.__delete_many_query__, cls.__update_query__, cls.__count_query__)
         return cls
     return decorator
 
-# (Brief) Takes entity from the cache if exists. Checks whether entity is old by comparing current time
-#         and time that was inserted in hash table.
-# (Usage) Use if entity should not update some timeout that specified in the cache.
+# Gathers the QueryCache of every decorated query method of the repository and its bases.
+def _collect_caches(cls) -> List[QueryCache]:
+    caches = []
+    for klass in reversed(cls.__mro__):
+        for attr in vars(klass).values():
+            cache = getattr(getattr(attr, "__func__", attr), "__query_cache__", None)
+            if cache is not None and cache not in caches:
+                caches.append(cache)
+    return caches
+
+# Exposes the statistics of the caches declared on `cls` as callback metrics labelled cache="<class>.<method>".
+def _register_cache_metrics(cls) -> None:
+    for attr, value in vars(cls).items():
+        cache = getattr(getattr(value, "__func__", value), "__query_cache__", None)
+        if cache is None: continue
+
+        name = f"{cls.__name__}.{attr}"
+        metrics.registry.counter("cache_hits_total", lambda c=cache: c.hits, cache=name)
+        metrics.registry.counter("cache_misses_total", lambda c=cache: c.misses, cache=name)
+        metrics.registry.counter("cache_evictions_total", lambda c=cache: c.evictions, cache=name)
+        metrics.registry.gauge("cache_entries", lambda c=cache: len(c), cache=name)
+        metrics.registry.gauge("cache_weight", lambda c=cache: c.weight, cache=name)
+
+# Returns key(args, entity) for QueryCache: the entity's `cache_key` attribute (model key by default),
+# or the args themselves if they identify the entity. None if there is no key to index by.
+# Lists are always indexed by the keys of the entities they hold: their args identify the list, not an entity.
+def _entity_key(model, cache_key: str = "", args_cache_key: bool = False, many: bool = False):
+    if args_cache_key and not many:
+        return lambda args, entity: args[0] if len(args) == 1 else args
+
+    name = cache_key or getattr(model, "__key__", "")
+    if not name: return None
+
+    getter = attrgetter(name)
+    return lambda args, entity: getter(entity)
+
+# (Brief) Planner row estimate of the table $1 and the seconds since it was last analyzed. Like the planner,
+#         reltuples is scaled by the current size of the table, so growth since the last ANALYZE is included.
+#         The estimate is NULL for tables never analyzed (reltuples < 0), the age is NULL without any ANALYZE.
+ESTIMATE_COUNT_QUERY: str = (
+    "SELECT CASE WHEN c.reltuples < 0 THEN NULL "
+    "WHEN c.relpages = 0 THEN c.reltuples::bigint "
+    "ELSE (c.reltuples / c.relpages * (pg_relation_size(c.oid) / current_setting('block_size')::int))::bigint END, "
+    "extract(epoch FROM now() - greatest(s.last_analyze, s.last_autoanalyze))::float8 "
+    "FROM pg_class c LEFT JOIN pg_stat_user_tables s ON s.relid = c.oid "
+    "WHERE c.oid = $1::regclass"
+)
+
+# Bulk writes touching more keys than this clear the repository caches instead of invalidating key by key.
+INVALIDATE_ALL_THRESHOLD: int = 10000
+
+# Rows sent per round trip by the bulk methods. Input is consumed chunk by chunk,
+# so only one chunk of entities is held in memory at a time.
+BULK_CHUNK_SIZE: int = 5000
+
+# Chunks with at least this many rows are written with COPY instead of executemany.
+COPY_THRESHOLD: int = 500
+
+# (Brief) Splits a sync or async iterable into lists of at most `size` items.
+async def chunked(items: Iterable[Any] | AsyncIterable[Any], size: int):
+    chunk = []
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    else:
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+    if chunk: yield chunk
+
+# Background refreshes scheduled or running, (flight, args) -> task.
+_refreshes: Dict[tuple, asyncio.Task] = {}
+
+# (Brief) Refreshes the entry of `args` in the background (see deadline.background) through `flight`, so
+#         callers keep getting the stale value and concurrent refreshes of the same args share one query,
+#         including while a scheduled refresh has not started yet. Failures are logged; the next call on
+#         the stale entry tries again.
+def _revalidate(flight: SingleFlight, load, connector, args: tuple, table: str | None, name: str) -> None:
+    key = (flight, args)
+    if key in _refreshes: return
+
+    async def refresh():
+        try:
+            await flight.do(args, lambda: load(connector, args, table))
+        except Exception:
+            logger.exception("Background refresh of %s failed", name)
+
+    task = _refreshes[key] = background(refresh())
+    task.add_done_callback(lambda _: _refreshes.pop(key, None))
+
+# (Brief) Caches the result of a query in any cache implementing CachePolicy (LRUCache, TTLCache, LFUCache,
+#         WTinyLFUCache or your own). Concurrent misses on the same args share one query (see SingleFlight),
+#         and repository writes invalidate the entries holding the written keys (see QueryCache).
+# (Usage)
+#   @query_cached(UserExample, "SELECT * FROM users WHERE tag = $1", policy=WTinyLFUCache, cache_capacity=10000)
+#   async def find_by_tag(cls, conn, tag): pass
+#
+# Caches offering get_stale (TTLCache) return an expired entry at once and refresh it in the background. As for
+# query_aggregate, that needs a DBConnector or a bound repository; with a plain connection the caller waits.
 #
 # (Params)
+#   model (class of Model)
 #   sql (string) - SQL Query
-#   cache (LRUCache or LFUCache) - Cache class
+#   policy (cache class or instance) - A class is created with cache_capacity; an instance is used as is
+#                                      and must not be shared between queries.
+#   many (bool) - Cache lists of entities (fetch) instead of one entity (fetchrow). Every list is dropped on insert.
+#   cache_key (name of entity's identifier) - Defaults to the model's primary key.
+#   args_cache_key (bool) - Query args identify the entity, use them as its key. Lists (many) are still
+#                           invalidated by the keys of the entities they hold.
+#   negative_expire (float) - Seconds to remember args that returned no row (0 disables negative caching).
+#                             Inserts drop exactly the entry of the inserted key if args_cache_key, else all of them.
+#   cache_max_bytes (int) - Byte budget of the cache besides cache_capacity, results heavier than it are not cached.
+#   weigher (callable) - weigher(value) -> int used against cache_max_bytes, defaults to cache.estimate_size.
 #
-def query_ttl(
+def query_cached(
         model: BaseEntity.__class__,
         sql: str,
+        policy: type | CachePolicy = LRUCache,
         cache_capacity: int = 256,
-        cache_expire: float = 60.0
+        many: bool = False,
+        cache_key: str = "",
+        args_cache_key: bool = False,
+        negative_expire: float = 0.0,
+        cache_max_bytes: int | None = None,
+        weigher: Callable[[Any], int] | None = None
 ):
     def decorator(func):
-        cache = TTLCache(cache_capacity, cache_expire)
-        async def wrapper(cls, conn: Connection, *args, **kwargs):
-            try:
-                cached: BaseEntity = cache.get(args)
-                if cached is not None: return cached
+        statements.add(sql)
+        if not isinstance(policy, type):
+            storage = policy
+        elif cache_max_bytes is None and weigher is None:
+            storage = policy(cache_capacity)
+        else:
+            storage = policy(cache_capacity, max_bytes=cache_max_bytes, weigher=weigher)
+        cache = QueryCache(
+            storage,
+            _entity_key(model, cache_key, args_cache_key, many),
+            many=many,
+            negative=TTLCache(cache_capacity, negative_expire) if negative_expire > 0 and not many else None,
+            args_key=args_cache_key
+        )
+        flight = SingleFlight()
+        stale = hasattr(storage, "get_stale")
+
+        async def load(conn: Connection, args: tuple, table: str | None):
+            generation = cache.generation
+            async with lease(conn, table=table) as conn:
+                if many:
+                    value = materialize_all(model, await conn.fetch(sql, *args))
+                else:
+                    row = await conn.fetchrow(sql, *args)
+                    if row is None:
+                        cache.store_absent(args, generation)
+                        return None
+                    value = materialize(model, row)
 
-                row = await conn.fetchrow(sql, *args)
-                if row is None: return None
+            cache.store(args, value, generation)
+            return value
 
-                entity = model(**row)
+        @wraps(func)
+        async def wrapper(cls, conn: Connection, *args, **kwargs):
+            try:
+                if stale:
+                    cached = cache.get_stale(args)
+                    if cached is not None:
+                        value, fresh = cached
+                        if not fresh and args not in flight:
+                            connector = conn if hasattr(conn, "reader") else cls.__connector__
+                            if connector is None:
+                                if metrics.enabled: cache.misses += 1
+                                return await flight.do(args, lambda: load(conn, args, _table(cls)))
+                            _revalidate(flight, load, connector, args, _table(cls), func.__name__)
+                        if metrics.enabled: cache.hits += 1
+                        return value
+                    elif cache.is_absent(args):
+                        if metrics.enabled: cache.hits += 1
+                        return None
+                else:
+                    cached = cache.get(args)
+                    if cached is not None or cache.is_absent(args):
+                        if metrics.enabled: cache.hits += 1
+                        return cached
 
-                cache[args] = entity
-                return entity
+                if metrics.enabled: cache.misses += 1
+                return await flight.do(args, lambda: load(conn, args, _table(cls)))
             except asyncpg.PostgresError as e:
                 raise DatabaseError() from e
-        return wrapper
+        wrapper.__query_cache__ = cache
+        return metrics.instrument(_connected(wrapper), func.__name__)
     return decorator
 
-# (Brief) Takes entity from the cache if exists. Checks whether entity is old by searching in hash set [Demands the only identifier from the entity].
-# (Usage) If you delete or change entities frequently, it can be not effective.
+# (Brief) Takes entity from the cache if exists. Checks whether entity is old by comparing current time
+#         and time that was inserted in hash table.
+# (Usage) Use if entity should not update some timeout that specified in the cache.
 #
 # (Params)
-#   model (class of Model)
 #   sql (string) - SQL Query
-#   cache_key (name of entity's identifier)
-#   cache (Cache class)
+#   cache_key (name of entity's identifier) - Defaults to the model's primary key.
+#   cache_stale (float) - Seconds an expired entity is still served while it is refreshed in the background.
+#   negative_expire (float) - Seconds to remember args that returned no row (0 disables negative caching).
+#                             Inserts and updates drop these entries, see QueryCache.
+#
+def query_ttl(
+        model: BaseEntity.__class__,
+        sql: str,
+        cache_capacity: int = 256,
+        cache_expire: float = 60.0,
+        cache_stale: float = 0.0,
+        cache_key: str = "",
+        negative_expire: float = 0.0,
+        cache_max_bytes: int | None = None
+):
+    return query_cached(
+        model, sql, TTLCache(cache_capacity, cache_expire, cache_stale, max_bytes=cache_max_bytes), cache_capacity,
+        cache_key=cache_key, negative_expire=negative_expire
+    )
+
+# (Brief) Takes entity from the cache if exists. Entries live until they are evicted or a repository
+#         write (insert, update, delete, bulk methods) invalidates the key they hold.
+# (Usage) Use for long-lived caches of entities that are written through the repository.
+#
+# (Params) See query_cached.
 #
 def query_lru(
         model: BaseEntity.__class__,
@@ -75,166 +303,726 @@ def query_lru(
         cache_key: str="",
         cache_capacity: int = 256,
         args_cache_key: bool = False,
+        negative_expire: float = 0.0,
+        cache_max_bytes: int | None = None
 ):
-    def decorator(func):
-        cache = LRUCache(cache_capacity)
-        async def wrapper(cls, conn: Connection, *args, **kwargs):
-            try:
-                cached: BaseEntity = cache.get(args)
-                if cached is not None and (getattr(cached, cache_key) if not args_cache_key else args): return cached
-
-                row = await conn.fetchrow(sql, *args)
-                if row is None: return None
-
-                entity = model(**row)
-
-                cls.__cache_id__.add(getattr(entity, cache_key) if not args_cache_key else args)
-                cache[args] = entity
-                return entity
-            except asyncpg.PostgresError as e:
-                raise DatabaseError() from e
-        return wrapper
-    return decorator
+    return query_cached(
+        model, sql, LRUCache, cache_capacity,
+        cache_key=cache_key, args_cache_key=args_cache_key, negative_expire=negative_expire, cache_max_bytes=cache_max_bytes
+    )
 
 def query_all_ttl(
         model: BaseEntity.__class__,
         sql: str,
         cache_capacity: int = 256,
-        cache_expire: float = 60.0
+        cache_expire: float = 60.0,
+        cache_stale: float = 0.0,
+        cache_key: str = "",
+        cache_max_bytes: int | None = None
 ):
-    def decorator(func):
-        cache = TTLCache(cache_capacity, cache_expire)
-        async def wrapper(cls, conn: Connection, *args, **kwargs):
-            try:
-                cached: List[BaseEntity] = cache.get(args)
-                if cached is not None: return cached
-
-                entities = [model(**x) for x in await conn.fetch(sql, *args)]
-                cache[args] = entities
-                return entities
-            except asyncpg.PostgresError as e:
-                raise DatabaseError() from e
-        return wrapper
-    return decorator
+    return query_cached(
+        model, sql, TTLCache(cache_capacity, cache_expire, cache_stale, max_bytes=cache_max_bytes), cache_capacity,
+        many=True, cache_key=cache_key
+    )
 
+# (Brief) Caches lists of entities. A list is dropped when an entity it contains is updated or deleted,
+#         and every list is dropped on insert, since a new row may belong to any of them.
+#         Lists vary a lot in size, so prefer bounding these caches with cache_max_bytes.
 def query_all_lru(
         model: BaseEntity.__class__,
         sql: str,
         cache_key: str = "",
         cache_capacity: int = 256,
-        args_cache_key: bool = False
+        args_cache_key: bool = False,
+        cache_max_bytes: int | None = None
+):
+    return query_cached(
+        model, sql, LRUCache, cache_capacity,
+        many=True, cache_key=cache_key, args_cache_key=args_cache_key, cache_max_bytes=cache_max_bytes
+    )
+
+# (Brief) Caches an aggregate query (COUNT, SUM/AVG/MAX from StmtExt, GROUP BY) per args and refreshes it in the
+#         background, so only the first call for some args waits on the scan. Entries older than `interval`
+#         seconds, or computed before a write of the repository, are returned as is while one refresh runs.
+# (Usage)
+#   @query_aggregate(StmtGenerator(model=Order).select(StmtExt.sum("amount")).where("tag").sql(), interval=300)
+#   async def total_by_tag(cls, conn, tag): pass
+#
+# The refresh needs a connection of its own after the call returns, so it runs in the background only when
+# the method is called with a DBConnector or on a bound repository (see Repository.bind); with a plain
+# connection the caller waits for the refresh. Failed background refreshes are logged and retried on the next call.
+#
+# (Params)
+#   sql (string) - SQL Query
+#   interval (float) - Seconds a result stays fresh, None to refresh on writes only.
+#   refresh_on_write (bool) - Writes through the repository (and the InvalidationBus) outdate the results.
+#   many (bool) - Return all rows as dicts instead of the first column of the first row.
+#
+def query_aggregate(
+        sql: str,
+        interval: float | None = 60.0,
+        refresh_on_write: bool = True,
+        many: bool = False,
+        cache_capacity: int = 256
 ):
     def decorator(func):
-        cache = LRUCache(cache_capacity)
+        statements.add(sql)
+        cache = AggregateCache(cache_capacity, interval, refresh_on_write)
+        flight = SingleFlight()
+
+        async def load(conn: Connection, args: tuple, table: str | None):
+            started = time.time()
+            async with lease(conn, table=table) as conn:
+                value = [dict(x) for x in await conn.fetch(sql, *args)] if many else await conn.fetchval(sql, *args)
+            cache.store(args, value, started)
+            return value
+
+        @wraps(func)
         async def wrapper(cls, conn: Connection, *args, **kwargs):
             try:
-                cached: List[BaseEntity] = cache.get(args)
+                cached = cache.get_stale(args)
                 if cached is not None:
-                    if all(getattr(entity, cache_key) if not args_cache_key else args in cls.__cache_id__ for entity in cached):
-                        return cached
+                    value, fresh = cached
+                    if not fresh and args not in flight:
+                        connector = conn if hasattr(conn, "reader") else cls.__connector__
+                        if connector is None:
+                            return await flight.do(args, lambda: load(conn, args, _table(cls)))
+                        _revalidate(flight, load, connector, args, _table(cls), func.__name__)
+                    if metrics.enabled: cache.hits += 1
+                    return value
 
-                entities = [model(**x) for x in await conn.fetch(sql, *args)]
-                for entity in entities:
-                    cls.__cache_id__.add(getattr(entity, cache_key) if not args_cache_key else args)
-                cache[args] = entities
-                return entities
+                if metrics.enabled: cache.misses += 1
+                return await flight.do(args, lambda: load(conn, args, _table(cls)))
             except asyncpg.PostgresError as e:
                 raise DatabaseError() from e
-        return wrapper
+        wrapper.__query_cache__ = cache
+        return metrics.instrument(_connected(wrapper), func.__name__)
     return decorator
 
 # (Brief) Fetches the entity from a query. Does not use cache.
 def query(model: BaseEntity.__class__,sql: str):
     def decorator(func):
+        statements.add(sql)
+        @wraps(func)
         async def wrapper(cls, conn: Connection, *args, **kwargs):
             try:
-                return model(*await conn.fetchrow(sql, *args))
+                async with lease(conn, table=_table(cls)) as conn:
+                    return materialize(model, await conn.fetchrow(sql, *args))
             except asyncpg.PostgresError as e:
                 raise DatabaseError() from e
-        return wrapper
+        return metrics.instrument(_connected(wrapper), func.__name__)
     return decorator
 
 # (Brief) Fetches list of entities from a query. Does not use cache.
-def query_all(sql: str):
+# (Params)
+#   lazy (bool) - Return read-only entities backed by their records (see materializer.lazy_class).
+def query_all(sql: str, lazy: bool = False):
+    def decorator(func):
+        statements.add(sql)
+        build = materialize_lazy if lazy else materialize_all
+        @wraps(func)
+        async def wrapper(cls, conn: Connection, *args, **kwargs):
+            try:
+                async with lease(conn, table=_table(cls)) as conn:
+                    return build(cls.__model__, await conn.fetch(sql, *args))
+            except asyncpg.PostgresError as e:
+                raise DatabaseError() from e
+        return metrics.instrument(_connected(wrapper), func.__name__)
+    return decorator
+
+# (Brief) Makes the connection argument of a repository method optional: when the first argument is neither a
+#         connection nor a DBConnector, the connector the repository is bound to is passed in its place
+#         (see Repository.bind). The DBConnector then leases a connection per call, or hands out the one of
+#         the task's transaction()/session() block.
+def _connected(func):
+    @wraps(func)
+    def wrapper(cls, *args, **kwargs):
+        if (args and (hasattr(args[0], "fetchrow") or hasattr(args[0], "reader"))) or "conn" in kwargs:
+            return func(cls, *args, **kwargs)
+
+        connector = cls.__connector__
+        if connector is None:
+            raise TypeError(f"{cls.__name__} is not bound to a DBConnector, pass a connection")
+        return func(cls, connector, *args, **kwargs)
+    return wrapper
+
+# Table of the repository, for the read-your-writes routing of DBConnector.
+def _table(cls) -> str | None:
+    model = getattr(cls, "__model__", None)
+    return None if model is None else model.__table_name__
+
+# Rows fetched per round trip by the streaming methods.
+STREAM_BATCH_SIZE: int = 1000
+
+# (Brief) Yields entities (or lists of up to `batch_size` entities if `chunks`) of a query through a server-side cursor.
+#         Only one batch of rows is held in memory. Runs in a transaction (a savepoint if one is already open),
+#         as cursors require it.
+async def stream(
+        conn: Connection,
+        model: BaseEntity.__class__,
+        sql: str,
+        *args: Any,
+        batch_size: int = STREAM_BATCH_SIZE,
+        chunks: bool = False
+):
+    try:
+        async with conn.transaction():
+            cursor = await conn.cursor(sql, *args)
+            while True:
+                rows = await cursor.fetch(batch_size)
+                if not rows: break
+
+                entities = materialize_all(model, rows)
+                if chunks:
+                    yield entities
+                else:
+                    for entity in entities: yield entity
+    except asyncpg.PostgresError as e:
+        raise DatabaseError() from e
+
+# (Brief) Streams entities of a query through a server-side cursor instead of materializing the whole result.
+# (Usage) The decorated method becomes an async generator: `async for user in UserRepository.users_by_tag(conn, tag)`.
+#
+# (Params)
+#   sql (string) - SQL Query
+#   model (class of Model) - Defaults to the repository model.
+#   batch_size (int) - Rows fetched per round trip.
+#   chunks (bool) - Yield lists of entities instead of single entities.
+#
+def query_stream(sql: str, model: BaseEntity.__class__ = None, batch_size: int = STREAM_BATCH_SIZE, chunks: bool = False):
+    def decorator(func):
+        statements.add(sql)
+        @wraps(func)
+        async def wrapper(cls, conn: Connection, *args, **kwargs):
+            async with lease(conn, table=_table(cls)) as conn:
+                async for x in stream(conn, model or cls.__model__, sql, *args, batch_size=batch_size, chunks=chunks):
+                    yield x
+        return _connected(wrapper)
+    return decorator
+
+# (Brief) Fetches a query as columns: {column: ndarray}, or a pandas DataFrame if `frame`.
+#         Dtypes come from the annotations of `model` (the repository model by default).
+def query_columns(sql: str, model: BaseEntity.__class__ = None, frame: bool = False):
     def decorator(func):
-        async def  wrapper(cls, conn: Connection, *args, **kwargs):
+        statements.add(sql)
+        fetch = columnar.fetch_frame if frame else columnar.fetch_columns
+        @wraps(func)
+        async def wrapper(cls, conn: Connection, *args, **kwargs):
             try:
-                return [cls.__model__(**x) for x in await conn.fetch(sql, *args)]
+                async with lease(conn, table=_table(cls)) as conn:
+                    return await fetch(conn, model or cls.__model__, sql, *args)
             except asyncpg.PostgresError as e:
                 raise DatabaseError() from e
-        return wrapper
+        return metrics.instrument(_connected(wrapper), func.__name__)
     return decorator
 
 # Method Decorator - Executes SQL queries without returning anything.
 def execute(sql: str):
     def decorator(func):
+        statements.add(sql)
+        @wraps(func)
         async def wrapper(cls, conn: Connection, *args, **kwargs):
             try:
-                async with conn.transaction():
-                        return conn.execute(sql, *args)
+                async with lease(conn, write=True, table=_table(cls)) as conn, conn.transaction():
+                    return await conn.execute(sql, *args)
             except asyncpg.PostgresError as e:
                 raise DatabaseError() from e
-        return wrapper
+        return metrics.instrument(_connected(wrapper), func.__name__)
     return decorator
 
 class Repository:
     # Static fields
-    __cache_id__: Set[tuple] = set() # primary key(id)
+    __caches__: List[QueryCache] = [] # caches of the decorated queries, set by @repository
     __model__: BaseEntity.__class__
+    __loader__: "BatchLoader | None" = None # set by enable_batching
+    __bus__: "InvalidationBus | None" = None # set by InvalidationBus.register
+    __key_filter__: CountingBloomFilter | None = None # set by load_key_filter
+    __key_filter_next__: CountingBloomFilter | None = None # filter being loaded, replaces __key_filter__ when done
+    __key_filter_task__: "asyncio.Task | None" = None # periodic rebuild of the key filter
+    __connector__: "DBConnector | None" = None # set by bind
 
     # Default queries
     __find_all_query__:     str
     __find_by_id_query__:   str
+    __find_by_ids_query__:  str
     __exists_by_id_query__: str
+    __keys_query__:         str
     __insert_query__:       str
     __delete_by_id_query__: str
     __update_query__:       str
+    __update_record__:      Callable[[BaseEntity], tuple] # args of __update_query__: SET columns, then the key
     __count_query__:        str
+    __page_queries__:       dict
+
+    # Bulk queries
+    __columns__:                tuple[str, ...]
+    __key_index__:              int
+    __upsert_query__:           str
+    __delete_many_query__:      str
+    __staging_table__:          str
+    __create_staging_query__:   str
+    __merge_staging_query__:    str
+    __truncate_staging_query__: str
+    __drop_staging_query__:     str
+
+    @classmethod
+    @metrics.instrument
+    @_connected
+    async def find_all(cls, conn: Connection, lazy: bool = False) -> List[BaseEntity]:
+        try:
+            async with lease(conn, table=cls.__model__.__table_name__) as conn:
+                rows = await conn.fetch(cls.__find_all_query__)
+            return materialize_lazy(cls.__model__, rows) if lazy else materialize_all(cls.__model__, rows)
+        except asyncpg.PostgresError as e: raise DatabaseError() from e
+
+    # (Brief) Streams every entity of the table in bounded memory. See stream().
+    @classmethod
+    @_connected
+    async def stream_all(cls, conn: Connection, batch_size: int = STREAM_BATCH_SIZE, chunks: bool = False):
+        async with lease(conn, table=cls.__model__.__table_name__) as conn:
+            async for x in stream(conn, cls.__model__, cls.__find_all_query__, batch_size=batch_size, chunks=chunks):
+                yield x
+
+    # (Brief) Keyset pagination: returns up to `size` entities following the `after` cursor and the cursor of
+    #         the next page (None on the last page). Every page is an index seek, so page N costs the same as page 1.
+    # (Params)
+    #   after (str) - Cursor returned by the previous page, None for the first page.
+    #   order (tuple of column names) - Ordering columns. The primary key is appended to make the order unique.
+    #   desc (bool) - Descending order for all columns.
+    @classmethod
+    @metrics.instrument
+    @_connected
+    async def page(
+            cls,
+            conn: Connection,
+            after: str | None = None,
+            size: int = 50,
+            order: tuple[str, ...] | List[str] = (),
+            desc: bool = False
+    ) -> tuple[List[BaseEntity], str | None]:
+        key = cls.__model__.__key__
+        order = tuple(order) if key in order else (*order, key)
+
+        values = decode_cursor(after) if after is not None else ()
+        if after is not None and len(values) != len(order):
+            raise CursorError(f"Page cursor does not match the ordering {order}")
+
+        sql = cls.__page_queries__.get((order, desc, after is None))
+        if sql is None:
+            stmt = StmtGenerator(model=cls.__model__).select()
+            if after is not None: stmt.after(*order, desc=desc)
+            stmt.order_by(**{"desc" if desc else "asc": order})
+            sql = cls.__page_queries__[(order, desc, after is None)] = stmt.limit().sql()
+
+        try:
+            async with lease(conn, table=cls.__model__.__table_name__) as conn:
+                entities = materialize_all(cls.__model__, await conn.fetch(sql, *values, size))
+        except asyncpg.PostgresError as e: raise DatabaseError() from e
+
+        if len(entities) < size: return entities, None
+        return entities, encode_cursor(tuple(getattr(entities[-1], x) for x in order))
+
+    # (Brief) Runs `sql` and returns its result as per-column NumPy arrays (a DataFrame if `frame`),
+    #         typed by the repository model annotations. See asyncrepository.columnar.
+    @classmethod
+    @metrics.instrument
+    @_connected
+    async def fetch_columns(cls, conn: Connection, sql: str, *args: Any, frame: bool = False):
+        try:
+            async with lease(conn, table=cls.__model__.__table_name__) as conn:
+                if frame: return await columnar.fetch_frame(conn, cls.__model__, sql, *args)
+                return await columnar.fetch_columns(conn, cls.__model__, sql, *args)
+        except asyncpg.PostgresError as e: raise DatabaseError() from e
 
+    # (Brief) Exports `sql` (the whole table by default) into a DataFrame through COPY, for large results.
     @classmethod
-    async def find_all(cls, conn: Connection) -> List[BaseEntity]:
+    @metrics.instrument
+    @_connected
+    async def export_frame(cls, conn: Connection, sql: str | None = None, *args: Any):
         try:
-            return [cls.__model__(**x) for x in await conn.fetch(cls.__find_all_query__)]
+            async with lease(conn, table=cls.__model__.__table_name__) as conn:
+                return await columnar.export_frame(conn, cls.__model__, sql or cls.__find_all_query__, *args)
         except asyncpg.PostgresError as e: raise DatabaseError() from e
 
     @classmethod
+    @metrics.instrument
+    @_connected
     async def find_by_id(cls, conn: Connection, *id: int | str | tuple) -> BaseEntity | None:
+        if cls.__key_filter__ is not None and len(id) == 1 and id[0] not in cls.__key_filter__:
+            return None
+        if cls.__loader__ is not None and len(id) == 1:
+            return await cls.__loader__.load(conn, id[0])
         try:
-            row = await conn.fetchrow(cls.__find_by_id_query__, *id)
-            return cls.__model__(**row) if row else None
+            async with lease(conn, table=cls.__model__.__table_name__) as conn:
+                row = await conn.fetchrow(cls.__find_by_id_query__, *id)
+            return materialize(cls.__model__, row)
         except asyncpg.PostgresError as e: raise DatabaseError() from e
 
+    # (Brief) Fetches entities for several primary keys with one `key = ANY($1)` query.
+    #         The result is aligned with `ids`, absent keys map to None.
     @classmethod
+    @metrics.instrument
+    @_connected
+    async def find_by_ids(cls, conn: Connection, ids: Iterable[Any]) -> List[BaseEntity | None]:
+        ids = list(ids)
+        if not ids: return []
+        try:
+            key = cls.__model__.__key__
+            async with lease(conn, table=cls.__model__.__table_name__) as conn:
+                rows = await conn.fetch(cls.__find_by_ids_query__, ids)
+            found = {getattr(x, key): x for x in materialize_all(cls.__model__, rows)}
+            return [found.get(x) for x in ids]
+        except asyncpg.PostgresError as e: raise DatabaseError() from e
+
+    # (Brief) Binds the repository to a DBConnector, so its methods can be called without a connection:
+    #         each call leases one for just the query (reads from a replica when routed) and releases it
+    #         right away, and calls inside connector.transaction() / connector.session() share the connection
+    #         of the block. Writes through any connection also keep the reads of the table on the primary
+    #         for the connector's sticky window.
+    # (Usage)
+    #   Repository.bind(connector)       # every repository
+    #   UserRepository.bind(connector)   # or one
+    #   user = await UserRepository.find_by_id(45)
+    #   async with connector.transaction():
+    #       await UserRepository.update(user)
+    #       await OrderRepository.insert(order)
+    @classmethod
+    def bind(cls, connector) -> None:
+        cls.__connector__ = connector
+
+    # (Brief) Makes find_by_id coalesce concurrent single-key lookups into find_by_ids batches.
+    # (Params)
+    #   connector (DBConnector) - Pool the batches shared by callers run on. Callers in a transaction, and without it
+    #                             every caller passing a connection, only batch with callers of the same connection.
+    #   window (float) - Seconds to collect keys for. 0 collects keys requested within one event-loop tick.
+    #   max_batch_size (int) - Keys per query, larger batches are dispatched immediately.
+    @classmethod
+    def enable_batching(cls, connector=None, window: float = 0.0, max_batch_size: int = 1000) -> "BatchLoader":
+        cls.__loader__ = BatchLoader(cls, connector, window, max_batch_size)
+        return cls.__loader__
+
+    @classmethod
+    def disable_batching(cls) -> None:
+        cls.__loader__ = None
+
+    @classmethod
+    @metrics.instrument
+    @_connected
     async def exists_by_id(cls, conn: Connection, id: int | str) -> bool:
+        if cls.__key_filter__ is not None and id not in cls.__key_filter__:
+            return False
         try:
-            return await conn.fetchrow(cls.__find_by_id_query__, id) is not None
+            async with lease(conn, table=cls.__model__.__table_name__) as conn:
+                return await conn.fetchval(cls.__exists_by_id_query__, id)
         except asyncpg.PostgresError as e: raise DatabaseError() from e
 
+    # (Brief) Builds a counting Bloom filter over the primary keys of the table, so find_by_id and exists_by_id
+    #         answer definite misses without a query. Keys are streamed through a cursor. Repository writes
+    #         keep the filter current; writes it can not follow (invalidate_all, bus "clear" messages) disable
+    #         it until it is loaded again.
+    #
+    # Rows inserted outside of the repository methods (other services, SQL scripts, processes without an
+    # InvalidationBus) are false negatives: find_by_id returns None for them until the next load. Call
+    # invalidate(*keys) after such writes, or set `rebuild_interval` to bound how long they stay invisible.
+    # A rebuild loads a new filter while the current one keeps answering, then swaps them.
+    #
+    # (Params)
+    #   capacity (int) - Expected number of keys, defaults to twice the current row count.
+    #   error_rate (float) - False positive rate at `capacity` keys.
+    #   rebuild_interval (float) - Seconds between rebuilds in the background. Needs a DBConnector. None
+    #                              disables them; a later load_key_filter or unload_key_filter stops them.
+    @classmethod
+    @_connected
+    async def load_key_filter(
+            cls,
+            conn: Connection,
+            capacity: int | None = None,
+            error_rate: float = 0.01,
+            batch_size: int = 10000,
+            rebuild_interval: float | None = None
+    ) -> CountingBloomFilter:
+        if rebuild_interval is not None and not hasattr(conn, "reader"):
+            raise TypeError("rebuild_interval needs a DBConnector, a connection can not be kept for the rebuilds")
+        if cls.__bus__ is None and rebuild_interval is None:
+            logger.warning(
+                "key filter of %s loaded without an InvalidationBus or rebuild_interval: rows inserted by other "
+                "processes are reported missing until it is loaded again", cls.__name__
+            )
+
+        cls._stop_key_filter_rebuild()
+        key_filter = await cls._build_key_filter(conn, capacity, error_rate, batch_size)
+        if rebuild_interval is not None:
+            async def rebuild():
+                while True:
+                    await asyncio.sleep(rebuild_interval)
+                    try:
+                        await cls._build_key_filter(conn, capacity, error_rate, batch_size)
+                    except DatabaseError:
+                        logger.warning("rebuilding the key filter of %s failed", cls.__name__, exc_info=True)
+            cls.__key_filter_task__ = background(rebuild())
+        return key_filter
+
+    # (Brief) Stops the rebuilds and drops the key filter, so find_by_id and exists_by_id query every key again.
+    @classmethod
+    def unload_key_filter(cls) -> None:
+        cls._stop_key_filter_rebuild()
+        cls._drop_key_filter()
+
+    @classmethod
+    def _stop_key_filter_rebuild(cls) -> None:
+        if cls.__key_filter_task__ is not None:
+            cls.__key_filter_task__.cancel()
+            cls.__key_filter_task__ = None
+
+    # Loads a filter as __key_filter_next__ (inserts during the load are added to it already) and swaps it in, unless
+    # a write it can not follow happened meanwhile.
+    @classmethod
+    async def _build_key_filter(cls, conn, capacity: int | None, error_rate: float, batch_size: int) -> CountingBloomFilter:
+        if capacity is None:
+            capacity = max(1024, 2 * await cls.count(conn))
+
+        key_filter = CountingBloomFilter(capacity, error_rate)
+        key_filter.ready = False
+        cls.__key_filter_next__ = key_filter
+        try:
+            async with lease(conn, table=cls.__model__.__table_name__) as conn, conn.transaction():
+                cursor = await conn.cursor(cls.__keys_query__)
+                while rows := await cursor.fetch(batch_size):
+                    key_filter.update(x[0] for x in rows)
+        except asyncpg.PostgresError as e:
+            raise DatabaseError() from e
+        finally:
+            current = cls.__key_filter_next__ is key_filter
+            if current: cls.__key_filter_next__ = None
+
+        key_filter.ready = True
+        if current: cls.__key_filter__ = key_filter
+        return key_filter
+
     @classmethod
+    @metrics.instrument
+    @_connected
     async def insert(cls, conn: Connection, entity: BaseEntity) -> None:
         try:
-            async with conn.transaction():
-                await conn.execute(cls.__insert_query__, *astuple(entity))
+            record = cls.__record__(entity)
+            cls._inserted((record[cls.__key_index__], ))
+            async with lease(conn, write=True, table=cls.__model__.__table_name__) as conn, conn.transaction():
+                await conn.execute(cls.__insert_query__, *record)
+        except asyncpg.PostgresError as e: raise DatabaseError() from e
+        cls._written([record[cls.__key_index__]], inserted=True, conn=conn)
+
+    # (Brief) Inserts entities from an iterable or async iterable in chunks inside one transaction.
+    #         Small chunks use executemany, large ones COPY. Returns the number of inserted rows.
+    @classmethod
+    @metrics.instrument
+    @_connected
+    async def insert_many(
+            cls,
+            conn: Connection,
+            entities: Iterable[BaseEntity] | AsyncIterable[BaseEntity],
+            chunk_size: int = BULK_CHUNK_SIZE
+    ) -> int:
+        total = 0
+        keys = []
+        try:
+            async with lease(conn, write=True, table=cls.__model__.__table_name__) as conn, conn.transaction():
+                async for chunk in chunked(entities, chunk_size):
+                    records = list(map(cls.__record__, chunk))
+                    cls._inserted(x[cls.__key_index__] for x in records)
+                    if len(records) >= COPY_THRESHOLD:
+                        await conn.copy_records_to_table(cls.__model__.__table_name__, records=records, columns=cls.__columns__)
+                    else:
+                        await conn.executemany(cls.__insert_query__, records)
+                    total += len(records)
+                    keys = cls._collect_keys(keys, records)
+        except asyncpg.PostgresError as e: raise DatabaseError() from e
+        cls._written(keys, inserted=True, conn=conn)
+        return total
+
+    # (Brief) Inserts entities or updates every non-key column of the rows whose key already exists.
+    #         Large chunks are copied into a temporary staging table and merged with one statement.
+    #         Of entities repeating a key, the last one wins, as with executemany.
+    @classmethod
+    @metrics.instrument
+    @_connected
+    async def upsert_many(
+            cls,
+            conn: Connection,
+            entities: Iterable[BaseEntity] | AsyncIterable[BaseEntity],
+            chunk_size: int = BULK_CHUNK_SIZE
+    ) -> int:
+        total = 0
+        keys = []
+        staging = False
+        try:
+            async with lease(conn, write=True, table=cls.__model__.__table_name__) as conn, conn.transaction():
+                async for chunk in chunked(entities, chunk_size):
+                    records = list(map(cls.__record__, chunk))
+                    cls._inserted(x[cls.__key_index__] for x in records)
+                    if len(records) >= COPY_THRESHOLD:
+                        if not staging:
+                            await conn.execute(cls.__create_staging_query__)
+                            staging = True
+                        # One merge can not update a row twice: keep the last record of every key.
+                        unique = list({x[cls.__key_index__]: x for x in records}.values())
+                        await conn.copy_records_to_table(cls.__staging_table__, records=unique, columns=cls.__columns__)
+                        await conn.execute(cls.__merge_staging_query__)
+                        await conn.execute(cls.__truncate_staging_query__)
+                    else:
+                        await conn.executemany(cls.__upsert_query__, records)
+                    total += len(records)
+                    keys = cls._collect_keys(keys, records)
+                if staging:
+                    await conn.execute(cls.__drop_staging_query__)
+        except asyncpg.PostgresError as e: raise DatabaseError() from e
+        cls._written(keys, inserted=True, conn=conn)
+        return total
+
+    # (Brief) Deletes rows by primary key with one `key = ANY($1)` statement per chunk. Returns the number of deleted rows.
+    @classmethod
+    @metrics.instrument
+    @_connected
+    async def delete_many_by_ids(
+            cls,
+            conn: Connection,
+            ids: Iterable[Any] | AsyncIterable[Any],
+            chunk_size: int = BULK_CHUNK_SIZE
+    ) -> int:
+        total = 0
+        keys = []
+        removed = [] if cls.__key_filter__ is not None else None # keys to remove from the filter after commit
+        try:
+            async with lease(conn, write=True, table=cls.__model__.__table_name__) as conn, conn.transaction():
+                async for chunk in chunked(ids, chunk_size):
+                    deleted = [x[0] for x in await conn.fetch(cls.__delete_many_query__, chunk)]
+                    total += len(deleted)
+                    keys = cls._collect_keys(keys, [(x, ) for x in deleted], 0)
+                    if removed is not None: removed.extend(deleted)
         except asyncpg.PostgresError as e: raise DatabaseError() from e
+        if removed: cls._deleted(removed, conn)
+        cls._written(keys, conn=conn)
+        return total
 
     @classmethod
+    @metrics.instrument
+    @_connected
     async def delete_by_id(cls, conn: Connection, *id) -> None:
         try:
-            async with conn.transaction():
-                cls.__cache_id__.discard(id)
-                await conn.execute(cls.__delete_by_id_query__, id)
+            async with lease(conn, write=True, table=cls.__model__.__table_name__) as conn, conn.transaction():
+                status = await conn.execute(cls.__delete_by_id_query__, *id)
         except asyncpg.PostgresError as e: raise DatabaseError() from e
+        key = id[0] if len(id) == 1 else id
+        if status.split()[-1] != "0": cls._deleted([key], conn)
+        cls._written([key], conn=conn)
 
     @classmethod
+    @metrics.instrument
+    @_connected
     async def update(cls, conn: Connection, entity: BaseEntity) -> None:
         try:
-            async with conn.transaction():
-                cls.__cache_id__.discard(entity.primary_key())
-                await conn.execute(cls.__update_query__, *astuple(entity))
+            record = cls.__update_record__(entity)
+            async with lease(conn, write=True, table=cls.__model__.__table_name__) as conn, conn.transaction():
+                await conn.execute(cls.__update_query__, *record)
         except asyncpg.PostgresError as e: raise DatabaseError() from e
+        cls._written([record[-1]], conn=conn)
+
+    # (Brief) Drops every cached entry holding one of the keys from the query caches of this repository
+    #         (and of other processes, if an InvalidationBus is registered).
+    # (Usage) Call after writing the table outside of the repository methods.
+    @classmethod
+    def invalidate(cls, *keys) -> None:
+        cls._inserted(keys)
+        cls._written(list(keys), inserted=True)
+
+    @classmethod
+    def invalidate_all(cls) -> None:
+        cls._drop_key_filter() # the key filter can not follow unknown writes
+        cls._written(None)
+
+    # Applies a write published by another process (see InvalidationBus). Reads of the table stick to the
+    # primary for a while, so the next miss does not load the old row from a lagging replica.
+    @classmethod
+    def _remote_written(cls, keys: List[Any] | None, inserted: bool = False) -> None:
+        if cls.__connector__ is not None:
+            cls.__connector__.mark_written(cls.__model__.__table_name__)
+        if keys is None:
+            cls._drop_key_filter()
+        elif inserted:
+            cls._inserted(keys)
+        cls._evict(keys, inserted)
+
+    # Adds written keys to the key filter. Called before the write commits: a rolled back key is only a false positive.
+    @classmethod
+    def _inserted(cls, keys: Iterable[Any]) -> None:
+        if cls.__key_filter__ is None and cls.__key_filter_next__ is None: return
+        keys = list(keys)
+        if cls.__key_filter__ is not None:
+            cls.__key_filter__.update(keys)
+        if cls.__key_filter_next__ is not None:
+            cls.__key_filter_next__.update(keys)
+
+    # Disables the key filter, and the one being loaded, until the next load or rebuild.
+    @classmethod
+    def _drop_key_filter(cls) -> None:
+        cls.__key_filter__ = None
+        cls.__key_filter_next__ = None
+
+    # Invalidates the caches after a write through `conn` commits (see after_commit) and publishes it on the bus.
+    # keys=None means too many keys were written to track them.
+    @classmethod
+    def _written(cls, keys: List[Any] | None, inserted: bool = False, conn: Connection | None = None) -> None:
+        if cls.__connector__ is not None:
+            cls.__connector__.mark_written(cls.__model__.__table_name__)
+        after_commit(conn, lambda: cls._committed(keys, inserted))
+
+    @classmethod
+    def _committed(cls, keys: List[Any] | None, inserted: bool) -> None:
+        cls._evict(keys, inserted)
+        if cls.__bus__ is not None:
+            cls.__bus__.publish(cls.__model__.__table_name__, keys, inserted)
+
+    # Invalidates the local caches only. Inserts also drop every cached list, since a new row may belong to any of them.
+    @classmethod
+    def _evict(cls, keys: List[Any] | None, inserted: bool = False) -> None:
+        for cache in cls.__caches__:
+            if keys is None or (inserted and cache.many):
+                cache.clear()
+            else:
+                cache.invalidate(keys)
+
+    # Removes keys of rows confirmed deleted through `conn` from the key filter, once committed. Skipped while the
+    # filter is loading, since removing a key the load has not added yet would turn other keys into false negatives.
+    @classmethod
+    def _deleted(cls, keys: List[Any], conn: Connection | None = None) -> None:
+        def remove():
+            key_filter = cls.__key_filter__
+            if key_filter is not None and key_filter.ready:
+                for key in keys: key_filter.remove(key)
+        after_commit(conn, remove)
+
+    @classmethod
+    def _collect_keys(cls, keys: List[Any] | None, records: List[tuple], index: int | None = None) -> List[Any] | None:
+        if keys is None: return None
+
+        index = cls.__key_index__ if index is None else index
+        keys.extend(x[index] for x in records)
+        return keys if len(keys) <= INVALIDATE_ALL_THRESHOLD else None
 
+    # (Brief) Number of rows. With `approximate`, the planner's estimate is returned instead of scanning the table
+    #         (see ESTIMATE_COUNT_QUERY); it falls back to COUNT(*) if the table was never analyzed, or, when
+    #         `max_staleness` is given, last analyzed more than `max_staleness` seconds ago. Standbys do not
+    #         track when tables were analyzed, so a count with `max_staleness` is read from the primary.
     @classmethod
-    async def count(cls, conn: Connection) -> int:
+    @metrics.instrument
+    @_connected
+    async def count(cls, conn: Connection, approximate: bool = False, max_staleness: float | None = None) -> int:
         try:
-            return await conn.fetchval(cls.__count_query__)
+            primary = approximate and max_staleness is not None
+            async with lease(conn, table=cls.__model__.__table_name__, primary=primary) as conn:
+                if approximate:
+                    row = await conn.fetchrow(ESTIMATE_COUNT_QUERY, cls.__model__.__table_name__)
+                    if row is not None and row[0] is not None \
+                            and (max_staleness is None or (row[1] is not None and row[1] <= max_staleness)):
+                        return int(row[0])
+                return await conn.fetchval(cls.__count_query__)
         except asyncpg.PostgresError as e: raise DatabaseError() from e
\ No newline at end of file
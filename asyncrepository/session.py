@@ -0,0 +1,137 @@
+from typing import Any, Dict, List, Tuple
+
+import asyncpg
+from asyncpg import Connection
+
+from asyncrepository.connection import StmtGenerator, lease
+from asyncrepository.expections import DatabaseError
+
+# (Brief) Unit of work: tracks entities loaded through it, detects which fields changed and writes
+#         everything in one transaction on flush. Updates send only the changed columns, and updates
+#         with the same column set are sent together with one executemany.
+# (Usage)
+#   async with UnitOfWork(conn) as uow:
+#       user = await uow.get(UserRepository, 45)
+#       user.tag = "new"
+#       uow.add(UserRepository, UserExample(id=46, tag="other"))
+#   # flushed on exit without error
+#
+# Changes are detected by comparing the field values with a snapshot taken on load, so mutating a
+# mutable field value in place (e.g. appending to a list) is not detected; assign a new value instead.
+# The session is an identity map: loading the same key twice returns the same tracked entity.
+# With a DBConnector instead of a connection, loads lease connections per query and flush leases a primary
+# connection for its transaction only (or uses the one of an enclosing connector.transaction()).
+#
+class UnitOfWork:
+    def __init__(self, conn: Connection): # or a DBConnector
+        self.conn = conn
+        self._tracked: Dict[Tuple[Any, Any], Tuple[Any, tuple]] = {} # (repository, key) -> (entity, snapshot)
+        self._new: Dict[Any, List[Any]] = {}                         # repository -> entities to insert
+        self._deleted: Dict[Any, List[Any]] = {}                     # repository -> keys to delete
+
+    async def __aenter__(self) -> "UnitOfWork":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            await self.flush()
+
+    # Starts tracking an entity loaded elsewhere. Returns the tracked instance for its key.
+    def track(self, repository, entity):
+        key = (repository, getattr(entity, repository.__model__.__key__))
+        tracked = self._tracked.get(key)
+        if tracked is not None: return tracked[0]
+
+        self._tracked[key] = (entity, repository.__record__(entity))
+        return entity
+
+    async def get(self, repository, id: Any):
+        tracked = self._tracked.get((repository, id))
+        if tracked is not None: return tracked[0]
+
+        entity = await repository.find_by_id(self.conn, id)
+        return None if entity is None else self.track(repository, entity)
+
+    async def get_many(self, repository, ids) -> List[Any]:
+        ids = list(ids)
+        missing = [x for x in ids if (repository, x) not in self._tracked]
+        for entity in await repository.find_by_ids(self.conn, missing):
+            if entity is not None: self.track(repository, entity)
+        return [self._tracked[(repository, x)][0] if (repository, x) in self._tracked else None for x in ids]
+
+    def add(self, repository, entity) -> None:
+        self._new.setdefault(repository, []).append(entity)
+
+    def delete(self, repository, id: Any) -> None:
+        self._tracked.pop((repository, id), None)
+        self._deleted.setdefault(repository, []).append(id)
+
+    # Returns [(repository, entity, changed columns)] of tracked entities that differ from their snapshot.
+    def dirty(self) -> List[Tuple[Any, Any, Tuple[str, ...]]]:
+        return [(repository, entity, changed) for repository, _, entity, changed in self._changes()]
+
+    # dirty() with the key each entity was loaded with, which the UPDATE must match if the key itself changed.
+    def _changes(self) -> List[Tuple[Any, Any, Any, Tuple[str, ...]]]:
+        result = []
+        for (repository, key), (entity, snapshot) in self._tracked.items():
+            current = repository.__record__(entity)
+            if current != snapshot:
+                changed = tuple(name for name, old, new in zip(repository.__columns__, snapshot, current) if old != new)
+                result.append((repository, key, entity, changed))
+        return result
+
+    # (Brief) Writes pending inserts, partial updates and deletes in one transaction, then refreshes the
+    #         snapshots and invalidates the affected repository caches. An entity whose primary key was changed
+    #         is updated by the key it was loaded with and tracked under the new one.
+    async def flush(self) -> None:
+        dirty = self._changes()
+        if not (dirty or self._new or self._deleted): return
+
+        updates: Dict[Tuple[Any, Tuple[str, ...]], List[tuple]] = {}
+        for repository, key, entity, changed in dirty:
+            values = tuple(getattr(entity, x) for x in changed)
+            updates.setdefault((repository, changed), []).append((*values, key))
+
+        deleted: Dict[Any, List[Any]] = {}
+        try:
+            async with lease(self.conn, write=True) as conn, conn.transaction():
+                for repository, entities in self._new.items():
+                    repository._inserted(getattr(x, repository.__model__.__key__) for x in entities)
+                    await conn.executemany(repository.__insert_query__, list(map(repository.__record__, entities)))
+                for (repository, changed), records in updates.items():
+                    await conn.executemany(_update_query(repository, changed), records)
+                for repository, keys in self._deleted.items():
+                    deleted[repository] = [x[0] for x in await conn.fetch(repository.__delete_many_query__, keys)]
+        except asyncpg.PostgresError as e: raise DatabaseError() from e
+
+        for repository, keys in deleted.items():
+            repository._deleted(keys, conn)
+
+        written: Dict[Any, List[Any]] = {}
+        for repository, key, entity, _ in dirty:
+            new = getattr(entity, repository.__model__.__key__)
+            if new != key:
+                del self._tracked[(repository, key)]
+                written.setdefault(repository, []).append(key)
+            self._tracked[(repository, new)] = (entity, repository.__record__(entity))
+            written.setdefault(repository, []).append(new)
+        for repository, keys in self._deleted.items():
+            written.setdefault(repository, []).extend(keys)
+        for repository, entities in self._new.items():
+            repository._written([getattr(x, repository.__model__.__key__) for x in entities], inserted=True, conn=conn)
+            for entity in entities: self.track(repository, entity)
+        for repository, keys in written.items():
+            repository._written(keys, conn=conn)
+
+        self._new.clear()
+        self._deleted.clear()
+
+_update_queries: Dict[Tuple[Any, Tuple[str, ...]], str] = {}
+
+# UPDATE of only `columns`: SET columns from $1.., key as the last parameter.
+def _update_query(repository, columns: Tuple[str, ...]) -> str:
+    sql = _update_queries.get((repository, columns))
+    if sql is None:
+        model = repository.__model__
+        sql = _update_queries[(repository, columns)] = StmtGenerator(model=model).update(*columns).where(model.__key__).sql()
+    return sql
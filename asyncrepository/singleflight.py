@@ -0,0 +1,53 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+# (Brief) In-flight request deduplication. Concurrent calls with the same key share one execution:
+#         the first caller (leader) runs the coroutine, the others await its result or exception.
+# (Usage) Wrap cache-miss loads so a burst of misses on one key sends a single query.
+#
+# The leader runs the load itself, so the query stays on the leader's own connection. Followers
+# are shielded: cancelling a follower never affects the others. If the leader is cancelled,
+# one of the remaining followers takes over and runs the load again.
+#
+class SingleFlight:
+    def __init__(self):
+        self._calls: Dict[Any, asyncio.Future] = {}
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._calls
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: Any, func: Callable[[], Awaitable[Any]]) -> Any:
+        while True:
+            future = self._calls.get(key)
+            if future is None:
+                return await self._lead(key, func)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if future.cancelled(): continue # leader was cancelled, retry as the new leader
+                raise
+
+    async def _lead(self, key: Any, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._calls[key] = future
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception() # mark retrieved, there may be no followers
+            raise
+        except BaseException:
+            future.cancel()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
@@ -0,0 +1,187 @@
+import asyncio
+import inspect
+import json
+import logging
+import random
+import re
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional, Tuple
+
+import asyncpg
+
+from asyncrepository import metrics
+from asyncrepository.cache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+_WRITE_CTE = re.compile(r"\b(INSERT|UPDATE|DELETE|MERGE)\b", re.IGNORECASE)
+_LOCKING = re.compile(r"\bFOR\s+(NO\s+KEY\s+)?(UPDATE|SHARE|KEY\s+SHARE)\b", re.IGNORECASE)
+
+# True unless `sql` is a plain read that EXPLAIN ANALYZE may run without side effects.
+def is_write(sql: str) -> bool:
+    words = sql.lstrip().split(None, 1)
+    first = words[0].upper() if words else ""
+    if first in ("SELECT", "VALUES", "TABLE"):
+        return bool(_LOCKING.search(sql))
+    if first == "WITH":
+        return bool(_WRITE_CTE.search(sql) or _LOCKING.search(sql))
+    return True
+
+# Shape of query parameters without their values: ('int', 'str', 'list[25]', 'NoneType').
+def params_shape(args: Any) -> Tuple[str, ...]:
+    if not isinstance(args, tuple):
+        return (f"batch[{len(args)}]" if hasattr(args, "__len__") else "batch", )
+    return tuple(f"{type(x).__name__}[{len(x)}]" if isinstance(x, (list, tuple)) else type(x).__name__ for x in args)
+
+@dataclass
+class SlowQuery:
+    sql: str
+    params: Tuple[str, ...]
+    elapsed: float                     # seconds
+    at: float                          # wall clock time the query finished
+    error: Optional[str] = None        # exception of the query itself, if it failed
+    plan: Any = None                   # EXPLAIN (FORMAT JSON) output when the query was sampled
+    analyzed: bool = False             # plan comes from EXPLAIN ANALYZE (actual times and buffers)
+    explain_error: Optional[str] = None
+
+# (Brief) Slow-query log. Installed as an asyncpg query logger on every pool connection, so every execution
+#         path of the repositories (decorators, Repository methods, UnitOfWork) is covered. Queries slower than
+#         `threshold` are recorded, and a rate-limited sample of them is re-run with
+#         EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) on a separate connection of the pool.
+# (Usage)
+#   slow_log = SlowQueryLog(threshold=0.2, callback=lambda entry: logger.warning("%s", entry))
+#   await connector.create_pool(slow_log=slow_log)
+#   ...
+#   slow_log.entries # last `capacity` SlowQuery entries
+#
+# EXPLAIN runs inside a transaction that is always rolled back, with statement_timeout set to explain_timeout.
+# Reads are analyzed in a read-only transaction. In safe mode writes (and locking reads) only get a plain
+# EXPLAIN, without executing them; with safe=False they are analyzed too, which executes them before the
+# rollback (locks and load included). executemany batches are recorded without a plan.
+#
+# (Params)
+#   connector (DBConnector) - Pool used for EXPLAIN, set by DBConnector.create_pool(slow_log=...) if omitted.
+#   threshold (float) - Seconds above which a query is slow.
+#   sample_rate (float) - Share of slow queries considered for EXPLAIN.
+#   max_per_minute (float) - EXPLAIN budget (token bucket, bursts of at most `burst`).
+#   cooldown (float) - Seconds before the same statement is explained again.
+#   capacity (int) - Size of the ring buffer of entries.
+#   callback (callable) - Receives every SlowQuery once its plan (if sampled) is captured; may be a coroutine function.
+#
+class SlowQueryLog:
+    def __init__(
+            self,
+            connector=None,
+            threshold: float = 0.5,
+            sample_rate: float = 1.0,
+            max_per_minute: float = 6.0,
+            burst: int = 1,
+            cooldown: float = 300.0,
+            capacity: int = 100,
+            callback: Optional[Callable[[SlowQuery], Any]] = None,
+            safe: bool = True,
+            explain_timeout: float = 10.0,
+            acquire_timeout: float = 1.0,
+            max_concurrent: int = 1
+    ):
+        self.connector = connector
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.max_per_minute = max_per_minute
+        self.burst = burst
+        self.cooldown = cooldown
+        self.callback = callback
+        self.safe = safe
+        self.explain_timeout = explain_timeout
+        self.acquire_timeout = acquire_timeout
+        self.max_concurrent = max_concurrent
+
+        self.entries: deque[SlowQuery] = deque(maxlen=capacity)
+        self._tokens = float(burst)
+        self._refilled = time.monotonic()
+        self._explained = LRUCache(1000) # sql -> monotonic time of the last EXPLAIN
+        self._tasks: set[asyncio.Task] = set()
+
+    # Installs the log on a connection (DBConnector does it for every pool connection).
+    def attach(self, conn: asyncpg.Connection) -> None:
+        conn.add_query_logger(self)
+
+    def detach(self, conn: asyncpg.Connection) -> None:
+        conn.remove_query_logger(self)
+
+    # asyncpg query logger, called after every query with arguments.
+    def __call__(self, record) -> None:
+        if record.elapsed < self.threshold or record.query.startswith("EXPLAIN"): return
+        if metrics.enabled: metrics.registry.counter("slow_queries_total").inc()
+
+        entry = SlowQuery(
+            sql=record.query,
+            params=params_shape(record.args),
+            elapsed=record.elapsed,
+            at=time.time(),
+            error=None if record.exception is None else repr(record.exception)
+        )
+        if isinstance(record.args, tuple) and self._sample(record.query):
+            task = asyncio.get_running_loop().create_task(self._capture(entry, record.args))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            self._emit(entry)
+
+    # Sampling, concurrency limit, per-statement cooldown and token bucket, in that order.
+    def _sample(self, sql: str) -> bool:
+        if self.connector is None or random.random() >= self.sample_rate: return False
+        if len(self._tasks) >= self.max_concurrent: return False
+
+        now = time.monotonic()
+        last = self._explained.get(sql)
+        if last is not None and now - last < self.cooldown: return False
+
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.max_per_minute / 60.0)
+        self._refilled = now
+        if self._tokens < 1: return False
+
+        self._tokens -= 1
+        self._explained[sql] = now
+        return True
+
+    async def _capture(self, entry: SlowQuery, args: tuple) -> None:
+        analyze = not (self.safe and is_write(entry.sql))
+        options = "ANALYZE, BUFFERS, FORMAT JSON" if analyze else "FORMAT JSON"
+        try:
+            async with self.connector.pool.acquire(timeout=self.acquire_timeout) as conn:
+                transaction = conn.transaction(readonly=analyze and not is_write(entry.sql))
+                await transaction.start()
+                try:
+                    await conn.execute(f"SET LOCAL statement_timeout = {int(self.explain_timeout * 1000)}")
+                    plan = await conn.fetchval(f"EXPLAIN ({options}) {entry.sql}", *args)
+                finally:
+                    await transaction.rollback()
+
+            entry.plan = json.loads(plan) if isinstance(plan, str) else plan
+            entry.analyzed = analyze
+        except (asyncpg.PostgresError, asyncpg.InterfaceError, asyncio.TimeoutError, OSError) as e:
+            entry.explain_error = repr(e)
+        finally:
+            self._emit(entry)
+
+    def _emit(self, entry: SlowQuery) -> None:
+        self.entries.append(entry)
+        if self.callback is None: return
+        try:
+            result = self.callback(entry)
+            if inspect.isawaitable(result):
+                asyncio.ensure_future(result)
+        except Exception:
+            logger.exception("Slow query callback failed")
+
+    def recent(self, limit: int | None = None) -> List[SlowQuery]:
+        entries = list(self.entries)
+        return entries if limit is None else entries[-limit:]
+
+    # Waits for the EXPLAIN captures in flight.
+    async def close(self) -> None:
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import logging
+import os
+import pickle
+import time
+import zlib
+from typing import Any, Callable, Dict, List
+
+logger = logging.getLogger(__name__)
+
+MAGIC: bytes = b"ARCS"
+FORMAT: int = 1
+
+# Hash of the table, columns and annotations of `model`. Snapshots of a repository whose model changed are ignored.
+def model_version(model) -> str:
+    if model is None: return ""
+    annotations = getattr(model, "__annotations__", {})
+    parts = [model.__table_name__, model.__key__, *(f"{x}:{_describe(annotations.get(x))}" for x in model.__fields__)]
+    return hashlib.sha1("\n".join(parts).encode()).hexdigest()
+
+def _describe(annotation: Any) -> str:
+    item = getattr(annotation, "item", None)
+    if item is not None:
+        return f"{type(annotation).__name__}[{_describe(item)}]"
+    return getattr(annotation, "__qualname__", repr(annotation))
+
+# {method name: QueryCache} of the decorated queries of `repository` and its bases.
+def caches_of(repository) -> Dict[str, Any]:
+    caches = {}
+    for klass in reversed(repository.__mro__):
+        for attr, value in vars(klass).items():
+            cache = getattr(getattr(value, "__func__", value), "__query_cache__", None)
+            if cache is not None: caches[attr] = cache
+    return caches
+
+def _name(repository) -> str:
+    return f"{repository.__module__}.{repository.__qualname__}"
+
+# True if restored entries are served for a bounded time: a TTLCache storage, or aggregates refreshed every `interval`.
+def _expires(cache) -> bool:
+    return getattr(cache.cache, "ttl", None) is not None or getattr(cache, "interval", None) is not None
+
+# Caches whose entries CacheSnapshot.refresh can reload: single-entity caches keyed by the entity key.
+def _refreshable(cache) -> bool:
+    return getattr(cache, "args_key", False) and not cache.many
+
+# (Brief) Serializes the query caches of `repositories`: entries with their eviction order and TTL deadlines
+#         (see CachePolicy.dump), per repository with the version of its model.
+def dumps(repositories, compress: bool = True) -> bytes:
+    data = {"format": FORMAT, "saved_at": time.time(), "repositories": {}}
+    for repository in repositories:
+        caches = {}
+        for attr, cache in caches_of(repository).items():
+            try:
+                caches[attr] = (type(cache.cache).__name__, pickle.dumps(cache.dump(), pickle.HIGHEST_PROTOCOL))
+            except Exception:
+                logger.exception("Skipped the cache of %s.%s in the snapshot", repository.__name__, attr)
+        data["repositories"][_name(repository)] = {
+            "version": model_version(getattr(repository, "__model__", None)),
+            "caches": caches
+        }
+
+    payload = pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+    return MAGIC + (b"z" + zlib.compress(payload, 1) if compress else b"p" + payload)
+
+# (Brief) Restores the caches of `repositories` from dumps() output. Caches are skipped when the snapshot is older
+#         than `max_age` seconds, the model version differs, the cache policy changed, or `select(cache)` is false.
+#         Returns entries restored.
+def loads(data: bytes, repositories, max_age: float | None = None, select: Callable[[Any], bool] | None = None) -> int:
+    if data[:len(MAGIC)] != MAGIC: raise ValueError("Not a cache snapshot")
+    payload = data[len(MAGIC) + 1:]
+    snapshot = pickle.loads(zlib.decompress(payload) if data[len(MAGIC):len(MAGIC) + 1] == b"z" else payload)
+    if snapshot.get("format") != FORMAT: return 0
+    if max_age is not None and time.time() - snapshot["saved_at"] > max_age: return 0
+
+    restored = 0
+    for repository in repositories:
+        saved = snapshot["repositories"].get(_name(repository))
+        if saved is None or saved["version"] != model_version(getattr(repository, "__model__", None)): continue
+
+        for attr, cache in caches_of(repository).items():
+            kind, blob = saved["caches"].get(attr, (None, None))
+            if kind != type(cache.cache).__name__ or not hasattr(cache.cache, "restore"): continue
+            if select is not None and not select(cache): continue
+            try:
+                cache.restore(pickle.loads(blob))
+            except Exception:
+                logger.exception("Could not restore the cache of %s.%s", repository.__name__, attr)
+                cache.clear()
+                continue
+            restored += len(cache)
+    return restored
+
+def _write(path: str, data: bytes) -> None:
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "wb") as file:
+        file.write(data)
+    os.replace(temp, path)
+
+def _read(path: str) -> bytes | None:
+    try:
+        with open(path, "rb") as file:
+            return file.read()
+    except FileNotFoundError:
+        return None
+
+# (Brief) Snapshot of the query caches on disk, so a restarted process starts warm instead of sending every
+#         first request to the database.
+# (Usage)
+#   snapshot = CacheSnapshot("/var/cache/app/caches.bin", interval=60.0)
+#   snapshot.register(UserRepository, OrderRepository)
+#   await snapshot.restore()   # on boot, before serving
+#   await snapshot.start()     # saves every `interval` seconds
+#   ...
+#   await snapshot.stop()      # saves a last time on shutdown
+#
+# Entries are dumped on the event loop (they must not change while being read); compressing and writing
+# the file runs in a thread, and the file is replaced atomically. Writes that happen while the process is
+# down are not in the snapshot, so a restored entry may be stale:
+#   - restore() only restores caches whose entries expire (TTLCache, capped at their ttl), from snapshots
+#     younger than `max_age`. Caches without expiry (LRU, LFU, W-TinyLFU) would serve a stale entry until
+#     it is evicted or written again, so they start empty.
+#   - restore(conn) also restores caches without expiry and reloads the cached entities from the database:
+#     the keys of every single-entity args_cache_key cache are fetched with one find_by_ids (`key = ANY($1)`)
+#     query per repository, in their saved order. Caches without expiry that can not be reloaded this way
+#     (lists, non-key args) start empty.
+#
+# The file is a pickle: only restore snapshots this application wrote.
+#
+# (Params)
+#   path (str) - Snapshot file.
+#   interval (float) - Seconds between periodic saves, None to save on stop only.
+#   max_age (float) - Snapshots older than this many seconds are not restored. None restores snapshots of any age.
+#   compress (bool) - zlib-compress the file.
+#
+class CacheSnapshot:
+    def __init__(self, path: str, interval: float | None = 60.0, max_age: float | None = 300.0, compress: bool = True):
+        self.path = path
+        self.interval = interval
+        self.max_age = max_age
+        self.compress = compress
+        self.repositories: List[Any] = []
+        self._task: asyncio.Task | None = None
+        self._lock = asyncio.Lock()
+
+    def register(self, *repositories) -> None:
+        self.repositories.extend(x for x in repositories if x not in self.repositories)
+
+    async def save(self) -> None:
+        async with self._lock:
+            data = dumps(self.repositories, self.compress)
+            await asyncio.to_thread(_write, self.path, data)
+
+    # Restores the caches from the file, if there is one. Without `conn`, only caches whose entries expire;
+    # with `conn`, every cache, and cached entities are reloaded from the database (see refresh).
+    async def restore(self, conn=None) -> int:
+        data = await asyncio.to_thread(_read, self.path)
+        if data is None: return 0
+
+        try:
+            select = _expires if conn is None else lambda x: _expires(x) or _refreshable(x)
+            restored = loads(data, self.repositories, self.max_age, select)
+        except Exception:
+            logger.exception("Could not read the cache snapshot %s", self.path)
+            return 0
+        if conn is not None:
+            await self.refresh(conn)
+        return restored
+
+    # (Brief) Replaces the values of the single-entity args_cache_key caches with fresh rows: one find_by_ids
+    #         per repository. Entries whose row is gone, and entries of composite keys, are dropped.
+    async def refresh(self, conn) -> None:
+        for repository in self.repositories:
+            caches = [x for x in caches_of(repository).values() if _refreshable(x) and len(x)]
+            if not caches: continue
+
+            dumped = [x.dump() for x in caches]
+            keys = list(dict.fromkeys(entry[0][0] for entries in dumped for entry in entries if len(entry[0]) == 1))
+            found = dict(zip(keys, await repository.find_by_ids(conn, keys)))
+            for cache, entries in zip(caches, dumped):
+                cache.restore([
+                    (entry[0], found[entry[0][0]], *entry[2:]) for entry in entries
+                    if len(entry[0]) == 1 and found.get(entry[0][0]) is not None
+                ])
+
+    async def start(self) -> None:
+        if self.interval is not None and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.save()
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.shield(self.save()) # a save cancelled by stop() still completes before the last one
+            except Exception:
+                logger.exception("Could not save the cache snapshot %s", self.path)
@@ -0,0 +1,24 @@
+# (Brief) Benchmarks of the hot paths: caches, query decorators against an in-process fake connection,
+#         entity materialization and StmtGenerator, plus a mode running against a real Postgres.
+# (Usage)
+#   python -m benchmark                          # fake mode, prints the results
+#   python -m benchmark --output bench.json      # also writes them as JSON
+#   python -m benchmark --baseline bench.json    # compares against a previous run, exits 1 on regressions
+#   python -m benchmark --postgres               # concurrency sweeps, bulk writes, pool contention (DB_* from .env)
+#
+# The fake mode needs no database: the variables asyncrepository.config requires get placeholder
+# defaults here, before anything imports asyncrepository.connection. Real values (.env or environment) win.
+import os
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+for name, value in (
+        ("DB_PASSWORD", "benchmark"),
+        ("DB_USERNAME", "benchmark"),
+        ("DB_HOST", "localhost"),
+        ("RESOURCE_DIR", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "resources", "sql")),
+        ("DB_SCHEMA", "schema.sql"),
+):
+    os.environ.setdefault(name, value)
@@ -0,0 +1,39 @@
+import argparse
+import asyncio
+import sys
+
+from benchmark.runner import Suite, compare, meta, read_json, write_json
+
+def main() -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmark", description="asyncrepository benchmarks")
+    parser.add_argument("--postgres", action="store_true", help="run against the database from DB_* instead of the fake connection")
+    parser.add_argument("--pool-size", type=int, default=10, help="pool size of the Postgres mode")
+    parser.add_argument("--quick", action="store_true", help="fewer repeats and smaller sizes")
+    parser.add_argument("--only", default="", help="run only benchmarks whose name starts with this prefix")
+    parser.add_argument("--output", help="write the results as JSON")
+    parser.add_argument("--baseline", help="JSON results to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed slowdown against the baseline (0.15 = 15%%)")
+    args = parser.parse_args()
+
+    suite = Suite(quick=args.quick, only=args.only)
+    if args.postgres:
+        from benchmark import postgres
+        asyncio.run(postgres.run(suite, pool_size=args.pool_size))
+    else:
+        from benchmark import caches, decorators, materialize, statements
+        caches.run(suite)
+        asyncio.run(decorators.run(suite))
+        materialize.run(suite)
+        statements.run(suite)
+
+    if args.output:
+        write_json(args.output, suite.results, meta("postgres" if args.postgres else "fake"))
+    if args.baseline:
+        regressions = compare(suite.results, read_json(args.baseline), args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%}", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
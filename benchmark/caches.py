@@ -0,0 +1,37 @@
+import itertools
+import random
+
+from asyncrepository.cache import LFUCache, LRUCache, TTLCache, WTinyLFUCache
+
+# (Brief) Cache classes in isolation: hits, misses and sets that evict, at several sizes.
+#         Every timed call performs BATCH operations, so the closure overhead is amortized.
+
+BATCH = 1000
+
+POLICIES = {
+    "lru": LRUCache,
+    "lfu": LFUCache,
+    "ttl": lambda size: TTLCache(size, 3600.0),
+    "wtinylfu": WTinyLFUCache,
+}
+
+def run(suite) -> None:
+    sizes = (1_000, 10_000) if suite.quick else (1_000, 10_000, 100_000)
+    random.seed(0)
+    for size in sizes:
+        hits = [random.randrange(size) for _ in range(BATCH)]
+        misses = [size + x for x in hits]
+        for name, factory in POLICIES.items():
+            cache = factory(size)
+            for i in range(size): cache[i] = i
+
+            get = cache.get
+            suite.run(f"cache.{name}.get_hit.{size}", lambda: [get(x) for x in hits], ops=BATCH)
+            suite.run(f"cache.{name}.get_miss.{size}", lambda: [get(x) for x in misses], ops=BATCH)
+
+            # The cache is full, so every set of a new key evicts one entry.
+            keys = itertools.count(size * 2)
+            def set_evict():
+                for key in itertools.islice(keys, BATCH):
+                    cache[key] = key
+            suite.run(f"cache.{name}.set_evict.{size}", set_evict, ops=BATCH)
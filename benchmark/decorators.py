@@ -0,0 +1,46 @@
+import itertools
+
+from asyncrepository import metrics
+from asyncrepository.materializer import materialize
+
+from benchmark.fake import FakeConnection
+from benchmark.models import BY_ID, BenchRepository, BenchUser, make_entities, make_values
+
+# (Brief) Overhead the query decorators and Repository methods add on top of the driver, measured against
+#         FakeConnection. "driver.fetchrow" (the fake call plus materialize) is the floor of every uncached read.
+
+ROWS = 1000
+
+async def run(suite) -> None:
+    conn = FakeConnection(BenchUser, rows=ROWS, make_values=make_values)
+    keys = itertools.cycle(range(ROWS))
+    repo = BenchRepository
+
+    async def driver():
+        return materialize(BenchUser, await conn.fetchrow(BY_ID, 1))
+
+    await suite.run_async("decorator.driver.fetchrow", driver)
+    await suite.run_async("decorator.query", lambda: repo.plain(conn, 1))
+    await suite.run_async("decorator.query_lru.hit", lambda: repo.lru(conn, 1))
+    await suite.run_async("decorator.query_ttl.hit", lambda: repo.ttl(conn, 1))
+    await suite.run_async("decorator.query_cached.wtinylfu.hit", lambda: repo.wtinylfu(conn, 1))
+    # 1000 distinct keys through a 16 entry cache: every call misses, loads and evicts.
+    await suite.run_async("decorator.query_lru.miss", lambda: repo.lru_small(conn, next(keys)))
+
+    metrics.enable()
+    try:
+        await suite.run_async("decorator.query_lru.hit.metrics", lambda: repo.lru(conn, 1))
+        await suite.run_async("decorator.query.metrics", lambda: repo.plain(conn, 1))
+    finally:
+        metrics.disable()
+        metrics.registry.reset()
+
+    await suite.run_async("repository.find_by_id", lambda: repo.find_by_id(conn, 1))
+    await suite.run_async("repository.exists_by_id", lambda: repo.exists_by_id(conn, 1))
+    await suite.run_async("repository.find_all.1000", lambda: repo.find_all(conn), number=200, ops=ROWS)
+    await suite.run_async("repository.find_by_ids.100", lambda: repo.find_by_ids(conn, list(range(100))), number=1000, ops=100)
+
+    entities = make_entities(0, ROWS)
+    updates = itertools.cycle(entities)
+    await suite.run_async("repository.update", lambda: repo.update(conn, next(updates)))
+    await suite.run_async("repository.upsert_many.1000", lambda: repo.upsert_many(conn, entities), number=20, ops=ROWS)
@@ -0,0 +1,78 @@
+from contextlib import asynccontextmanager
+from typing import Any, Dict, Iterable, List
+
+from asyncpg import Record
+from asyncpg.protocol.protocol import _create_record
+
+# (Brief) In-process stand-in for asyncpg.Connection over an in-memory table of Records, so the
+#         decorator and repository overhead can be measured without a database round trip.
+# (Usage) conn = FakeConnection(BenchUser, rows=1000); await BenchRepository.find_by_id(conn, 1)
+#
+# SQL is not parsed: rows are looked up by the first argument (a key, or a list of keys for ANY($1)),
+# queries without arguments see the whole table, and writes are applied by their leading keyword.
+# Nothing awaits, so a call costs what the library adds on top of the driver.
+#
+class FakeConnection:
+    def __init__(self, model, rows: int = 1000, make_values=None):
+        self.model = model
+        self.columns = {name: i for i, name in enumerate(model.__fields__)}
+        self.key_index = self.columns[model.__key__]
+        self.table: Dict[Any, Record] = {}
+        self.queries = 0
+        for i in range(rows):
+            self._store(make_values(i))
+
+    def _store(self, values: tuple) -> None:
+        self.table[values[self.key_index]] = _create_record(self.columns, tuple(values))
+
+    async def fetchrow(self, sql: str, *args: Any) -> Record | None:
+        self.queries += 1
+        if not args: return next(iter(self.table.values()), None)
+        return self.table.get(args[0])
+
+    async def fetch(self, sql: str, *args: Any) -> List[Record]:
+        self.queries += 1
+        if args and isinstance(args[0], list):
+            if sql.lstrip().startswith("DELETE"):
+                return [_create_record({self.model.__key__: 0}, (x, )) for x in args[0] if self.table.pop(x, None) is not None]
+            return [self.table[x] for x in args[0] if x in self.table]
+        return list(self.table.values())
+
+    async def fetchval(self, sql: str, *args: Any) -> Any:
+        self.queries += 1
+        if sql.startswith("SELECT EXISTS"): return args[0] in self.table
+        return len(self.table)
+
+    async def execute(self, sql: str, *args: Any) -> str:
+        self.queries += 1
+        command = sql.lstrip().split(None, 1)[0].upper()
+        if not args: return command # DDL, staging merges
+        if command == "INSERT":
+            self._store(args)
+            return "INSERT 0 1"
+        if command == "UPDATE": # SET columns, then the key
+            values = list(args[:-1])
+            values.insert(self.key_index, args[-1])
+            self._store(values)
+            return "UPDATE 1"
+        if command == "DELETE":
+            return "DELETE 1" if self.table.pop(args[0], None) is not None else "DELETE 0"
+        return command
+
+    async def executemany(self, sql: str, args: Iterable[tuple]) -> None:
+        for x in args:
+            await self.execute(sql, *x)
+
+    async def copy_records_to_table(self, table: str, records: Iterable[tuple], columns=None, **kwargs) -> str:
+        count = 0
+        for x in records:
+            self._store(x)
+            count += 1
+        return f"COPY {count}"
+
+    def transaction(self, **kwargs):
+        return _transaction()
+
+@asynccontextmanager
+async def _transaction():
+    yield
@@ -0,0 +1,23 @@
+import sys
+
+from asyncrepository.materializer import materialize_all, materialize_lazy
+
+from benchmark.models import BenchUser, make_rows
+
+# (Brief) Row -> entity materialization: model(**row) against the compiled materializers and lazy
+#         record-backed entities. Reported per row.
+# (Usage) Part of python -m benchmark, or alone: python -m benchmark.materialize [rows]
+
+def run(suite, count: int | None = None) -> None:
+    count = count or (10_000 if suite.quick else 100_000)
+    rows = make_rows(count)
+
+    suite.run("materialize.model_kwargs", lambda: [BenchUser(**x) for x in rows], ops=count)
+    suite.run("materialize.model_args", lambda: [BenchUser(*x) for x in rows], ops=count)
+    suite.run("materialize.compiled", lambda: materialize_all(BenchUser, rows), ops=count)
+    suite.run("materialize.lazy", lambda: materialize_lazy(BenchUser, rows), ops=count)
+    suite.run("materialize.lazy_read_field", lambda: [x.tag for x in materialize_lazy(BenchUser, rows)], ops=count)
+
+if __name__ == "__main__":
+    from benchmark.runner import Suite
+    run(Suite(), int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,77 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import List
+
+from asyncpg import Record
+from asyncpg.protocol.protocol import _create_record
+
+from asyncrepository.cache import WTinyLFUCache
+from asyncrepository.connection import StmtGenerator
+from asyncrepository.entity import entity, BaseEntity, PrimaryKey, Varchar, Timestamp
+from asyncrepository.repository import (
+    Repository, repository, query, query_all, query_lru, query_ttl, query_cached
+)
+
+# Entity and repository shared by the benchmarks. The table is created by the Postgres mode only.
+@dataclass(slots=True)
+@entity(table_name="bench_users")
+class BenchUser(BaseEntity):
+    id: PrimaryKey[int]
+    tag: Varchar[255]
+    created_at: Timestamp
+    score: float
+    active: bool
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bench_users (
+    id BIGINT PRIMARY KEY,
+    tag VARCHAR(255),
+    created_at TIMESTAMP,
+    score DOUBLE PRECISION,
+    active BOOLEAN
+)
+"""
+
+BY_ID = StmtGenerator(model=BenchUser).select().where("id").sql()
+
+@repository(BenchUser)
+class BenchRepository(Repository):
+    @classmethod
+    @query(model=BenchUser, sql=BY_ID)
+    def plain(cls, conn, id: int): pass
+
+    @classmethod
+    @query_lru(model=BenchUser, sql=BY_ID, args_cache_key=True, cache_capacity=10000)
+    def lru(cls, conn, id: int): pass
+
+    @classmethod
+    @query_lru(model=BenchUser, sql=BY_ID, args_cache_key=True, cache_capacity=16)
+    def lru_small(cls, conn, id: int): pass
+
+    @classmethod
+    @query_ttl(model=BenchUser, sql=BY_ID, cache_capacity=10000, cache_expire=3600.0)
+    def ttl(cls, conn, id: int): pass
+
+    @classmethod
+    @query_cached(model=BenchUser, sql=BY_ID, policy=WTinyLFUCache, cache_capacity=10000, args_cache_key=True)
+    def wtinylfu(cls, conn, id: int): pass
+
+    @classmethod
+    @query_all(sql=StmtGenerator(model=BenchUser).select().where("active").sql())
+    def by_active(cls, conn, active: bool): pass
+
+COLUMNS = {name: i for i, name in enumerate(BenchUser.__fields__)}
+
+def make_record(i: int, now: datetime | None = None) -> Record:
+    return _create_record(COLUMNS, make_values(i, now))
+
+def make_values(i: int, now: datetime | None = None) -> tuple:
+    return (i, f"user{i}", now or datetime(2024, 1, 1), i * 0.5, i % 2 == 0)
+
+def make_rows(count: int) -> List[Record]:
+    now = datetime.now()
+    return [make_record(i, now) for i in range(count)]
+
+def make_entities(start: int, count: int) -> List[BenchUser]:
+    now = datetime.now()
+    return [BenchUser(*make_values(i, now)) for i in range(start, start + count)]
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from typing import List
+
+from asyncrepository import metrics
+from asyncrepository.connection import DBConnector
+
+from benchmark.models import SCHEMA, BenchRepository, make_entities
+
+# (Brief) Benchmarks against a real Postgres (connection settings from DB_* / .env): bulk writes,
+#         concurrency sweeps of uncached and cached reads through the pool, and pool contention.
+#         Works on its own table, bench_users, which is dropped at the end.
+
+ROWS = 100_000
+
+def _percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else 0.0
+
+# `concurrency` tasks, each doing `per_task` calls of read(conn, key), acquiring a pool connection per call.
+async def _sweep(suite, connector: DBConnector, name: str, read, concurrency: int, per_task: int) -> None:
+    if not suite.selected(name): return
+    latencies: List[float] = []
+
+    async def worker(offset: int):
+        for i in range(per_task):
+            start = time.perf_counter()
+            async with connector.get_connection() as conn:
+                await read(conn, (offset * per_task + i) % ROWS)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(x) for x in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    ops = concurrency * per_task
+    suite.record(
+        name, elapsed / ops * 1e9, ops,
+        ops_per_second=ops / elapsed,
+        p50_ms=_percentile(latencies, 0.5) * 1000,
+        p99_ms=_percentile(latencies, 0.99) * 1000
+    )
+
+async def run(suite, pool_size: int = 10) -> None:
+    connector = DBConnector(name="benchmark")
+    await connector.create_pool(min_size=pool_size, max_size=pool_size)
+    try:
+        async with connector.get_connection() as conn:
+            await conn.execute("DROP TABLE IF EXISTS bench_users")
+            await conn.execute(SCHEMA)
+        await connector.warm_up()
+
+        rows = ROWS // 10 if suite.quick else ROWS
+        async with connector.get_connection() as conn:
+            entities = make_entities(0, rows)
+            start = time.perf_counter()
+            await BenchRepository.insert_many(conn, entities)
+            suite.record("pg.insert_many", (time.perf_counter() - start) / rows * 1e9, rows)
+
+            start = time.perf_counter()
+            await BenchRepository.upsert_many(conn, entities)
+            suite.record("pg.upsert_many", (time.perf_counter() - start) / rows * 1e9, rows)
+
+            small = entities[:100]
+            start = time.perf_counter()
+            for _ in range(10):
+                await BenchRepository.upsert_many(conn, small)
+            suite.record("pg.upsert_many.executemany_100", (time.perf_counter() - start) / 1000 * 1e9, 1000)
+
+            start = time.perf_counter()
+            found = await BenchRepository.find_all(conn)
+            suite.record("pg.find_all", (time.perf_counter() - start) / max(1, len(found)) * 1e9, len(found))
+
+        per_task = 50 if suite.quick else 500
+        for concurrency in (1, 4, 16, 64):
+            await _sweep(suite, connector, f"pg.query.c{concurrency}", BenchRepository.plain, concurrency, per_task)
+            await _sweep(suite, connector, f"pg.query_lru.c{concurrency}", BenchRepository.lru, concurrency, per_task)
+
+        # Pool contention: 8 tasks per connection holding it for a short query, acquire wait from the metrics.
+        if suite.selected("pg.pool_contention"):
+            metrics.registry.reset()
+            metrics.enable()
+            try:
+                async def hold():
+                    async with connector.get_connection() as conn:
+                        await conn.fetchval("SELECT pg_sleep(0.001)")
+
+                tasks = pool_size * 8
+                start = time.perf_counter()
+                for _ in range(5 if suite.quick else 20):
+                    await asyncio.gather(*(hold() for _ in range(tasks)))
+                elapsed = time.perf_counter() - start
+            finally:
+                metrics.disable()
+
+            wait = metrics.registry.histogram("pool_acquire_seconds", pool=connector.name)
+            suite.record(
+                "pg.pool_contention", elapsed / wait.count * 1e9, wait.count,
+                acquire_p50_ms=wait.quantile(0.5) * 1000,
+                acquire_p99_ms=wait.quantile(0.99) * 1000,
+                acquire_max_ms=wait.max * 1000
+            )
+    finally:
+        async with connector.get_connection() as conn:
+            await conn.execute("DROP TABLE IF EXISTS bench_users")
+        await connector.close()
@@ -0,0 +1,95 @@
+import json
+import platform
+import sys
+import time
+import timeit
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+
+# (Brief) One measurement: nanoseconds per operation (best of `repeat` runs), plus free-form extra values
+#         (throughput, latency percentiles) that are reported but not compared.
+@dataclass
+class Result:
+    name: str
+    ns_per_op: float
+    ops: int
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+# (Brief) Collects results of the benchmark modules. Each module exposes run(suite) (or an async variant).
+# (Params)
+#   quick (bool) - Fewer repeats and smaller sizes, for a fast smoke run.
+#   only (string) - Run only benchmarks whose name starts with this prefix.
+class Suite:
+    def __init__(self, quick: bool = False, only: str = ""):
+        self.quick = quick
+        self.only = only
+        self.repeat = 3 if quick else 5
+        self.results: List[Result] = []
+
+    def selected(self, name: str) -> bool:
+        return name.startswith(self.only)
+
+    def record(self, name: str, ns_per_op: float, ops: int, **extra: Any) -> Result:
+        result = Result(name, ns_per_op, ops, extra)
+        self.results.append(result)
+        details = " ".join(f"{k}={v:.4g}" if isinstance(v, float) else f"{k}={v}" for k, v in extra.items())
+        print(f"{name:<44} {ns_per_op:12.1f} ns/op  {details}")
+        return result
+
+    # Times func(), which performs `ops` operations per call. The number of calls is chosen by timeit.
+    def run(self, name: str, func: Callable[[], Any], ops: int = 1) -> Result | None:
+        if not self.selected(name): return None
+
+        timer = timeit.Timer(func)
+        number, _ = timer.autorange()
+        best = min(timer.repeat(repeat=self.repeat, number=number))
+        return self.record(name, best / (number * ops) * 1e9, number * ops)
+
+    # Times `await func()` called `number` times in a loop, best of the repeats.
+    async def run_async(self, name: str, func: Callable[[], Awaitable[Any]], number: int = 10000, ops: int = 1) -> Result | None:
+        if not self.selected(name): return None
+        if self.quick: number = max(1, number // 10)
+
+        best = float("inf")
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                await func()
+            best = min(best, time.perf_counter() - start)
+        return self.record(name, best / (number * ops) * 1e9, number * ops)
+
+def meta(mode: str) -> Dict[str, Any]:
+    return {
+        "mode": mode,
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+def write_json(path: str, results: List[Result], info: Dict[str, Any]) -> None:
+    with open(path, "w") as f:
+        json.dump({"meta": info, "results": {x.name: asdict(x) for x in results}}, f, indent=2, default=str)
+
+def read_json(path: str) -> Dict[str, Dict[str, Any]]:
+    with open(path) as f:
+        return json.load(f)["results"]
+
+# (Brief) Compares ns/op with a baseline run. Returns [(name, baseline ns, current ns, ratio)] of the
+#         benchmarks slower than the baseline by more than `tolerance` (0.15 = 15%).
+def compare(results: List[Result], baseline: Dict[str, Dict[str, Any]], tolerance: float = 0.15) -> List[Tuple[str, float, float, float]]:
+    regressions = []
+    print(f"\n{'benchmark':<44} {'baseline':>12} {'current':>12} {'ratio':>7}")
+    for result in results:
+        base = baseline.get(result.name)
+        if base is None or not base["ns_per_op"]: continue
+
+        ratio = result.ns_per_op / base["ns_per_op"]
+        flag = ""
+        if ratio > 1 + tolerance:
+            regressions.append((result.name, base["ns_per_op"], result.ns_per_op, ratio))
+            flag = "  REGRESSION"
+        elif ratio < 1 - tolerance:
+            flag = "  faster"
+        print(f"{result.name:<44} {base['ns_per_op']:12.1f} {result.ns_per_op:12.1f} {ratio:7.2f}{flag}")
+    return regressions
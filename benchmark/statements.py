@@ -0,0 +1,20 @@
+from asyncrepository.connection import StmtGenerator
+
+from benchmark.models import BenchUser
+
+# (Brief) SQL building with StmtGenerator, for statements built per call (dynamic filters, pages).
+#         Shapes are memoized, so these measure recording a shape and looking up its compiled statement.
+
+def run(suite) -> None:
+    stmt = StmtGenerator(model=BenchUser)
+    fields = tuple(BenchUser.__fields__)
+
+    suite.run("statements.select_where", lambda: stmt.select().where("id").sql())
+    suite.run("statements.select_filters", lambda: stmt.select().where("tag", "created_at>=", "score<").sql())
+    suite.run("statements.page", lambda: stmt.select().after("created_at", "id").order_by(asc=("created_at", "id")).limit().sql())
+    suite.run("statements.where_any", lambda: stmt.select().where_any("id").sql())
+    suite.run("statements.in_range_null", lambda: stmt.select().where("tag IN", "created_at BETWEEN", "score IS NULL").sql())
+    suite.run("statements.where_batch", lambda: stmt.select().where_batch("id", "tag").sql())
+    suite.run("statements.insert", lambda: stmt.insert(*fields).sql())
+    suite.run("statements.upsert", lambda: stmt.insert(*fields).on_conflict("id", update=fields[1:]).sql())
+    suite.run("statements.update_all", lambda: stmt.update_all(exceptions=("id", )).where("id").sql())
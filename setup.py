@@ -3,5 +3,5 @@ from setuptools import setup, find_packages
 setup(
     name="asyncrepository",
     version="1.0.0",
-    packages=find_packages(),
+    packages=find_packages(exclude=("benchmark", "benchmark.*")),
 )
\ No newline at end of file
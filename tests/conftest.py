@@ -0,0 +1,16 @@
+# The tests run without a database: the variables asyncrepository.config requires get placeholder
+# defaults here, before anything imports asyncrepository.connection (see benchmark/__init__.py).
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+for name, value in (
+        ("DB_PASSWORD", "test"),
+        ("DB_USERNAME", "test"),
+        ("DB_HOST", "localhost"),
+        ("RESOURCE_DIR", os.path.join(ROOT, "resources", "sql")),
+        ("DB_SCHEMA", "schema.sql"),
+):
+    os.environ.setdefault(name, value)
@@ -0,0 +1,83 @@
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List
+
+from asyncpg.protocol.protocol import _create_record
+
+# (Brief) Stand-in for asyncpg.Connection: every statement is recorded in `log`, reads answer from `rows`
+#         (key -> tuple of column values, looked up by the first argument).
+class FakeConnection:
+    def __init__(self, columns=(), rows: Dict[Any, tuple] | None = None):
+        self.columns = {name: i for i, name in enumerate(columns)}
+        self.rows = rows if rows is not None else {}
+        self.log: List[tuple] = []
+        self.depth = 0 # open transactions
+
+    def _record(self, values: tuple):
+        return _create_record(self.columns, tuple(values))
+
+    async def fetchrow(self, sql: str, *args):
+        self.log.append((sql, args))
+        values = self.rows.get(args[0]) if args else None
+        return None if values is None else self._record(values)
+
+    async def fetch(self, sql: str, *args):
+        self.log.append((sql, args))
+        if args and isinstance(args[0], list):
+            return [self._record(self.rows[x]) for x in args[0] if x in self.rows]
+        return [self._record(x) for x in self.rows.values()]
+
+    async def cursor(self, sql: str, *args):
+        self.log.append((sql, args))
+        return _FakeCursor([self._record(x) for x in self.rows.values()])
+
+    async def fetchval(self, sql: str, *args):
+        self.log.append((sql, args))
+        return len(self.rows)
+
+    async def execute(self, sql: str, *args):
+        self.log.append((sql, args))
+        return "EXECUTE 1"
+
+    async def executemany(self, sql: str, args):
+        for x in args: await self.execute(sql, *x)
+
+    async def copy_records_to_table(self, table: str, records, columns=None, **kwargs):
+        records = list(records)
+        self.log.append((f"COPY {table}", tuple(records)))
+        return f"COPY {len(records)}"
+
+    @asynccontextmanager
+    async def _transaction(self):
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+
+    def transaction(self, **options):
+        return self._transaction()
+
+    def is_in_transaction(self) -> bool:
+        return self.depth > 0
+
+    def statements(self, prefix: str = "") -> List[tuple]:
+        return [x for x in self.log if x[0].startswith(prefix)]
+
+class _FakeCursor:
+    def __init__(self, records: list):
+        self.records = records
+
+    async def fetch(self, n: int) -> list:
+        batch, self.records = self.records[:n], self.records[n:]
+        return batch
+
+# Pool handing out one FakeConnection.
+class FakePool:
+    def __init__(self, conn: FakeConnection):
+        self.conn = conn
+
+    async def acquire(self, timeout=None):
+        return self.conn
+
+    async def release(self, conn):
+        pass
@@ -0,0 +1,111 @@
+import itertools
+
+import pytest
+
+from asyncrepository import cache as cache_module
+from asyncrepository.cache import CountMinSketch, LFUCache, LRUCache, TTLCache, WTinyLFUCache
+
+# Stand-in for the time module of asyncrepository.cache.
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+def test_sketch_counts_keys_apart_and_saturates():
+    sketch = CountMinSketch(1024)
+    for key in range(100):
+        for _ in range(key % 4): sketch.increment(key)
+    assert [sketch.frequency(x) for x in range(8)] == [0, 1, 2, 3, 0, 1, 2, 3]
+
+    for _ in range(20): sketch.increment("hot")
+    assert sketch.frequency("hot") == 15
+
+# Popular keys read between the keys of a long scan: every popular key is read again only after 200 scan keys,
+# so an LRU of 100 entries loses them all, while admission keeps them.
+def test_wtinylfu_keeps_popular_entries_through_a_scan():
+    def hits(cache) -> int:
+        count = 0
+        scan = iter(range(1000, 100000))
+        for i in range(10000):
+            key = i % 50
+            if cache.get(key) is None: cache[key] = key
+            else: count += 1
+            for key in itertools.islice(scan, 4):
+                if cache.get(key) is None: cache[key] = key
+        return count
+
+    cache = WTinyLFUCache(capacity=100)
+    assert hits(cache) > 9000 and len(cache) == 100
+    assert all(key in cache for key in range(50))
+    assert hits(LRUCache(capacity=100)) == 0
+
+def test_ttl_entries_expire_in_set_order_and_a_reset_moves_to_the_end(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    cache = TTLCache(maxsize=10, ttl=10)
+    evicted = []
+    cache.on_evict = lambda key, value: evicted.append(key)
+
+    for key in "abc":
+        cache[key] = key
+        clock.now += 1
+    cache["a"] = "a2" # expires last now
+    clock.now += 8.5 # b expired, c expires in 0.5
+
+    assert len(cache) == 2 and evicted == ["b"]
+    assert cache.get("b") is None and cache.get("c") == "c" and cache.get("a") == "a2"
+    clock.now += 1
+    assert "c" not in cache and len(cache) == 1 and evicted == ["b", "c"]
+
+def test_ttl_stale_window(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache_module, "time", clock)
+    cache = TTLCache(ttl=10, stale=5)
+    cache["a"] = 1
+
+    clock.now += 10
+    assert cache.get("a") == 1 and cache.get_stale("a") == (1, True)
+    clock.now += 3 # expired, within the stale window
+    assert cache.get("a") is None and "a" not in cache
+    assert cache.get_stale("a") == (1, False) and len(cache) == 1
+    clock.now += 3 # past the stale window
+    assert cache.get_stale("a") is None and len(cache) == 0
+
+BYTE_BOUNDED = [
+    lambda **kwargs: LRUCache(capacity=100, **kwargs),
+    lambda **kwargs: TTLCache(maxsize=100, **kwargs),
+    lambda **kwargs: LFUCache(capacity=100, **kwargs),
+    lambda **kwargs: WTinyLFUCache(capacity=100, **kwargs),
+]
+
+@pytest.mark.parametrize("make", BYTE_BOUNDED)
+def test_entries_over_the_byte_budget_are_refused_and_drop_the_old_value(make):
+    cache = make(max_bytes=10, weigher=len)
+    cache["a"] = "xxxx"
+    cache["b"] = "xxxx"
+    assert cache.weight == 8
+
+    cache["a"] = "x" * 11
+    assert "a" not in cache and cache.get("a") is None
+    assert "b" in cache and cache.weight == 4 and len(cache) == 1
+
+@pytest.mark.parametrize("make", BYTE_BOUNDED)
+def test_caches_evict_until_they_fit_the_byte_budget(make):
+    cache = make(max_bytes=10, weigher=len)
+    evicted = []
+    cache.on_evict = lambda key, value: evicted.append(key)
+    for key in "abcd":
+        cache[key] = "xxx"
+
+    assert cache.weight == 9 and len(cache) == 3
+    assert len(evicted) == 1 and evicted[0] not in cache
+
+    cache.pop("d")
+    assert cache.weight == 6
+    cache.clear()
+    assert cache.weight == 0
@@ -0,0 +1,89 @@
+import asyncio
+from dataclasses import dataclass
+
+from asyncrepository.connection import DBConnector
+from asyncrepository.deadline import background, deadline, remaining
+from asyncrepository.entity import entity, BaseEntity, PrimaryKey, Varchar
+from asyncrepository.notify import InvalidationBus
+from asyncrepository.repository import Repository, repository
+
+from fakes import FakeConnection, FakePool
+
+@dataclass(slots=True)
+@entity(table_name="deadline_users")
+class User(BaseEntity):
+    id: PrimaryKey[int]
+    tag: Varchar[255]
+
+@repository(User)
+class UserRepository(Repository): pass
+
+def test_flush_outlives_the_deadline_of_the_writer():
+    async def main():
+        conn = FakeConnection()
+        connector = DBConnector()
+        connector.pool = FakePool(conn)
+        bus = InvalidationBus(connector, flush_interval=0.02)
+        bus.register(UserRepository)
+
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        with deadline(0.01):
+            UserRepository._written([1])
+        await asyncio.sleep(0.05)
+
+        UserRepository._written([2])
+        await asyncio.sleep(0.05)
+
+        notified = [x[1][1] for x in conn.statements("SELECT pg_notify")]
+        assert len(notified) == 2 and '"k": [1]' in notified[0] and '"k": [2]' in notified[1]
+        assert not bus._pending and not errors
+
+    asyncio.run(main())
+
+def test_background_tasks_run_without_the_deadline():
+    async def budget():
+        return remaining()
+
+    async def main():
+        with deadline(0.01):
+            inherited = asyncio.ensure_future(budget())
+            detached = background(budget())
+        assert await inherited is not None
+        assert await detached is None
+
+    asyncio.run(main())
+
+def test_hedged_reads_use_the_latency_of_decorated_queries():
+    from asyncrepository import metrics
+    from asyncrepository.deadline import HEDGE_MIN_SAMPLES, hedged
+    from asyncrepository.repository import query
+
+    @repository(User)
+    class HedgedRepository(Repository):
+        @classmethod
+        @query(User, "SELECT * FROM deadline_users WHERE id = $1")
+        async def by_id(cls, conn, id): pass
+
+    class SlowOnce(FakeConnection):
+        async def fetchrow(self, sql, *args):
+            self.log.append((sql, args))
+            if len(self.log) == 1: await asyncio.sleep(1)
+            return self._record((args[0], "x"))
+
+    async def main():
+        assert HedgedRepository.by_id.__name__ == "by_id"
+        histogram = metrics.registry.histogram("query_seconds", query="HedgedRepository.by_id")
+        for _ in range(HEDGE_MIN_SAMPLES): histogram.record(0.001)
+
+        conn = SlowOnce(User.__fields__)
+        connector = DBConnector()
+        connector.pool = FakePool(conn)
+        metrics.enable()
+        try:
+            assert (await asyncio.wait_for(hedged(HedgedRepository.by_id, connector, 1), 0.5)).id == 1
+        finally:
+            metrics.disable()
+        assert len(conn.log) == 2
+
+    asyncio.run(main())
@@ -0,0 +1,74 @@
+import asyncio
+from dataclasses import dataclass
+
+from asyncrepository.connection import DBConnector
+from asyncrepository.entity import entity, BaseEntity, PrimaryKey, Varchar
+from asyncrepository.repository import Repository, repository
+
+from fakes import FakeConnection, FakePool
+
+@dataclass(slots=True)
+@entity(table_name="loader_users")
+class User(BaseEntity):
+    id: PrimaryKey[int]
+    tag: Varchar[255]
+
+@repository(User)
+class UserRepository(Repository): pass
+
+ROWS = {x: (x, str(x)) for x in range(10)}
+
+def queries(conn: FakeConnection) -> list:
+    return [x[1] for x in conn.statements("SELECT")]
+
+def test_batches_of_connections_stay_on_their_connection():
+    async def main():
+        UserRepository.enable_batching()
+        try:
+            a, b = FakeConnection(User.__fields__, ROWS), FakeConnection(User.__fields__, ROWS)
+            found = await asyncio.gather(
+                UserRepository.find_by_id(a, 1), UserRepository.find_by_id(b, 2), UserRepository.find_by_id(a, 3)
+            )
+            assert [x.id for x in found] == [1, 2, 3]
+            assert queries(a) == [([1, 3], )] and queries(b) == [([2], )]
+        finally:
+            UserRepository.disable_batching()
+
+    asyncio.run(main())
+
+def test_batches_span_callers_of_a_connector_outside_of_transactions():
+    async def main():
+        shared = FakeConnection(User.__fields__, ROWS)
+        connector = DBConnector()
+        connector.pool = FakePool(shared)
+        UserRepository.enable_batching(connector)
+        try:
+            mine = FakeConnection(User.__fields__, ROWS)
+            async with mine.transaction():
+                found = await asyncio.gather(
+                    UserRepository.find_by_id(connector, 1),
+                    UserRepository.find_by_id(FakeConnection(User.__fields__, ROWS), 2),
+                    UserRepository.find_by_id(mine, 3)
+                )
+            assert [x.id for x in found] == [1, 2, 3]
+            assert queries(shared) == [([1, 2], )] and queries(mine) == [([3], )]
+        finally:
+            UserRepository.disable_batching()
+
+    asyncio.run(main())
+
+def test_a_cancelled_first_caller_hands_the_batch_over():
+    async def main():
+        UserRepository.enable_batching(window=0.05)
+        try:
+            conn = FakeConnection(User.__fields__, ROWS)
+            first = asyncio.ensure_future(UserRepository.find_by_id(conn, 1))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(UserRepository.find_by_id(conn, 2))
+            await asyncio.sleep(0)
+            first.cancel()
+            assert (await second).id == 2 and queries(conn) == [([2], )]
+        finally:
+            UserRepository.disable_batching()
+
+    asyncio.run(main())
@@ -0,0 +1,77 @@
+import asyncio
+from dataclasses import dataclass
+
+from asyncrepository.connection import DBConnector
+from asyncrepository.entity import entity, BaseEntity, PrimaryKey, Varchar
+from asyncrepository.notify import InvalidationBus
+from asyncrepository.repository import Repository, repository
+
+from fakes import FakeConnection, FakePool
+
+@dataclass(slots=True)
+@entity(table_name="notify_users")
+class User(BaseEntity):
+    id: PrimaryKey[int]
+    tag: Varchar[255]
+
+@repository(User)
+class UserRepository(Repository): pass
+
+class FailingConnection(FakeConnection):
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+        self.attempts = []
+
+    async def execute(self, sql: str, *args):
+        if sql.startswith("SELECT pg_notify"):
+            self.attempts.append(asyncio.get_running_loop().time())
+            if self.failures:
+                self.failures -= 1
+                raise OSError("connection lost")
+        return await super().execute(sql, *args)
+
+def test_failed_flushes_back_off_and_keep_a_bounded_set_of_keys(caplog):
+    async def main():
+        conn = FailingConnection(failures=3)
+        connector = DBConnector()
+        connector.pool = FakePool(conn)
+        bus = InvalidationBus(connector, flush_interval=0.01, max_keys=5)
+        bus.register(UserRepository)
+
+        errors = []
+        asyncio.get_running_loop().set_exception_handler(lambda loop, context: errors.append(context))
+        UserRepository._written([1, 2, 3])
+        await asyncio.sleep(0.05)
+        UserRepository._written([4, 5, 6]) # over max_keys while failing: one "clear"
+        assert bus._pending["notify_users"].clear and not bus._pending["notify_users"].keys
+        await asyncio.sleep(0.2)
+
+        gaps = [b - a for a, b in zip(conn.attempts, conn.attempts[1:])]
+        assert len(conn.attempts) == 4 and gaps == sorted(gaps)
+        assert '"c": true' in conn.statements("SELECT pg_notify")[0][1][1]
+        assert not bus._pending and bus._failures == 0 and not errors
+
+    asyncio.run(main())
+    assert len([x for x in caplog.records if "Could not send" in x.message]) == 3
+
+def test_remote_invalidations_keep_the_next_reads_on_the_primary():
+    import json
+    import time
+    from asyncrepository.connection import Replica
+
+    async def main():
+        primary, standby = FakeConnection(User.__fields__, {1: (1, "new")}), FakeConnection(User.__fields__, {1: (1, "old")})
+        connector = DBConnector()
+        connector.pool = FakePool(primary)
+        connector.sticky_window, connector.max_lag, connector.check_interval = 1.0, 5.0, 1.0
+        connector.replicas = connector._rotation = [Replica(name="standby", dsn="", pool=FakePool(standby), healthy=True)]
+        bus = InvalidationBus(connector)
+        bus.register(UserRepository)
+
+        assert (await UserRepository.find_by_id(connector, 1)).tag == "old"
+        bus._on_notify(None, 0, "notify_users", json.dumps({"o": "other", "k": [1]}))
+        assert (await UserRepository.find_by_id(connector, 1)).tag == "new"
+        assert connector._sticky["notify_users"] - time.monotonic() > 5.5 # covers max_lag + check_interval
+
+    asyncio.run(main())
@@ -0,0 +1,73 @@
+import asyncio
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from uuid import UUID
+
+import pytest
+
+from asyncrepository.entity import entity, BaseEntity, PrimaryKey, Varchar
+from asyncrepository.expections import CursorError
+from asyncrepository.pagination import decode_cursor, encode_cursor
+from asyncrepository.repository import Repository, repository
+
+from fakes import FakeConnection
+
+def test_cursor_round_trip():
+    values = (
+        1, -2.5, "a/b?", None, True,
+        datetime(2024, 2, 29, 23, 59, 59, 123456), date(2024, 1, 1), time(12, 30), timedelta(seconds=90.5),
+        Decimal("12.3400"), UUID("12345678-1234-5678-1234-567812345678"), b"\x00\xff",
+    )
+    cursor = encode_cursor(values)
+    assert "=" not in cursor and "/" not in cursor and "+" not in cursor
+    assert decode_cursor(cursor) == values
+
+@pytest.mark.parametrize("cursor", ["", "!!!", encode_cursor([1])[:-2], "eyJhIjoxfQ", "W3siJHQiOiJ4IiwidiI6IjEifV0"])
+def test_malformed_cursors_raise_cursor_error(cursor):
+    # "eyJhIjoxfQ" is {"a":1}, not a list; the last one has an unknown type tag.
+    with pytest.raises(CursorError):
+        decode_cursor(cursor)
+
+@dataclass(slots=True)
+@entity(table_name="pagination_users")
+class User(BaseEntity):
+    id: PrimaryKey[int]
+    tag: Varchar[255]
+
+@repository(User)
+class UserRepository(Repository): pass
+
+# Answers page queries ordered by id: (size) for the first page, (after id, size) for the next ones.
+class PageConnection(FakeConnection):
+    async def fetch(self, sql: str, *args):
+        self.log.append((sql, args))
+        desc = "DESC" in sql
+        rows = sorted(self.rows.values(), reverse=desc)
+        if len(args) == 2:
+            rows = [x for x in rows if (x[0] < args[0] if desc else x[0] > args[0])]
+        return [self._record(x) for x in rows[:args[-1]]]
+
+def test_pages_end_at_the_last_row():
+    async def pages(conn, **kwargs):
+        result, after = [], None
+        while True:
+            entities, after = await UserRepository.page(conn, after, size=2, **kwargs)
+            result.append([x.id for x in entities])
+            if after is None: return result
+
+    async def main():
+        conn = PageConnection(User.__fields__, {x: (x, "t") for x in range(1, 6)})
+        assert await pages(conn) == [[1, 2], [3, 4], [5]]
+        assert await pages(conn, desc=True) == [[5, 4], [3, 2], [1]]
+
+        del conn.rows[5] # a full last page still returns a cursor, followed by an empty page
+        assert await pages(conn) == [[1, 2], [3, 4], []]
+
+        conn.rows.clear()
+        assert await UserRepository.page(conn) == ([], None)
+
+        with pytest.raises(CursorError):
+            await UserRepository.page(conn, encode_cursor(["t", 1]))
+
+    asyncio.run(main())
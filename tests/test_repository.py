@@ -0,0 +1,185 @@
+import asyncio
+from dataclasses import dataclass
+
+from asyncrepository.entity import entity, BaseEntity, PrimaryKey, Varchar
+from asyncrepository.repository import Repository, repository, query_all_lru
+
+from fakes import FakeConnection
+
+@dataclass(slots=True)
+@entity(table_name="repository_users")
+class User(BaseEntity):
+    id: PrimaryKey[int]
+    tag: Varchar[255]
+
+@repository(User)
+class UserRepository(Repository):
+    @classmethod
+    @query_all_lru(User, "SELECT * FROM repository_users WHERE tag = $1", args_cache_key=True)
+    async def by_tag(cls, conn, tag): pass
+
+def test_args_cached_lists_are_invalidated_by_their_entities():
+    async def main():
+        conn = FakeConnection(User.__fields__, {2: (2, "a"), 3: (3, "a")})
+        assert [x.id for x in await UserRepository.by_tag(conn, "a")] == [2, 3]
+
+        del conn.rows[2]
+        await UserRepository.delete_by_id(conn, 2)
+        assert [x.id for x in await UserRepository.by_tag(conn, "a")] == [3]
+
+    asyncio.run(main())
+
+@dataclass(slots=True)
+@entity(table_name="repository_items")
+class Item(BaseEntity):
+    tag: Varchar[255]
+    id: PrimaryKey[int]
+    note: Varchar[255]
+
+@repository(Item)
+class ItemRepository(Repository): pass
+
+def test_update_numbers_the_key_after_the_set_columns():
+    assert ItemRepository.__update_query__ == "UPDATE repository_items SET tag=$1,note=$2 WHERE id=$3 "
+
+    async def main():
+        conn = FakeConnection()
+        await ItemRepository.update(conn, Item(tag="a", id=7, note="n"))
+        assert conn.statements("UPDATE") == [(ItemRepository.__update_query__, ("a", "n", 7))]
+
+    asyncio.run(main())
+
+def test_upsert_many_merges_duplicate_keys_and_drops_its_staging_table():
+    from asyncrepository.repository import COPY_THRESHOLD
+
+    async def main():
+        conn = FakeConnection()
+        users = [User(id=x % 10, tag=str(x)) for x in range(COPY_THRESHOLD)]
+        for _ in range(2): # twice in one transaction of the caller
+            assert await UserRepository.upsert_many(conn, users) == COPY_THRESHOLD
+
+        copies = conn.statements("COPY")
+        assert len(copies) == 2 and sorted(copies[0][1]) == [(x, str(COPY_THRESHOLD - 10 + x)) for x in range(10)]
+        assert [x[0].split()[0] for x in conn.statements("CREATE") + conn.statements("DROP")] == ["CREATE"] * 2 + ["DROP"] * 2
+
+    asyncio.run(main())
+
+def test_approximate_count_reads_the_analyze_age_on_the_primary_only_when_bounded():
+    from asyncrepository.connection import DBConnector, Replica
+    from fakes import FakePool
+
+    async def main():
+        # A standby has the estimate but no analyze age, the primary has both.
+        standby = FakeConnection(("estimate", "age"), {"repository_users": (1000, None)})
+        primary = FakeConnection(("estimate", "age"), {"repository_users": (1200, 5.0)})
+        connector = DBConnector()
+        connector.pool = FakePool(primary)
+        connector._rotation = [Replica(name="standby", dsn="", pool=FakePool(standby), healthy=True)]
+
+        assert await UserRepository.count(connector, approximate=True) == 1000
+        assert await UserRepository.count(connector, approximate=True, max_staleness=60) == 1200
+        assert await UserRepository.count(connector, approximate=True, max_staleness=1) == 1 # COUNT(*) fallback
+        assert not connector._sticky
+
+    asyncio.run(main())
+
+def test_expired_entries_are_served_stale_while_one_background_refresh_runs():
+    from asyncrepository.connection import DBConnector
+    from asyncrepository.repository import query_ttl
+    from fakes import FakePool
+
+    @repository(User)
+    class StaleRepository(Repository):
+        @classmethod
+        @query_ttl(User, "SELECT * FROM repository_users WHERE id = $1", cache_expire=0.01, cache_stale=10)
+        async def by_id(cls, conn, id): pass
+
+    async def main():
+        conn = FakeConnection(User.__fields__, {1: (1, "old")})
+        connector = DBConnector()
+        connector.pool = FakePool(conn)
+        assert (await StaleRepository.by_id(connector, 1)).tag == "old"
+
+        conn.rows[1] = (1, "new")
+        await asyncio.sleep(0.02)
+        served = await asyncio.gather(*(StaleRepository.by_id(connector, 1) for _ in range(3)))
+        assert [x.tag for x in served] == ["old"] * 3
+
+        await asyncio.sleep(0)
+        assert (await StaleRepository.by_id(connector, 1)).tag == "new" and len(conn.log) == 2
+
+    asyncio.run(main())
+
+def test_writes_in_a_transaction_invalidate_after_the_outermost_commit_only(caplog):
+    from asyncrepository.connection import DBConnector, transaction
+    from asyncrepository.repository import query_lru
+    from fakes import FakePool
+
+    @repository(User)
+    class TxRepository(Repository):
+        @classmethod
+        @query_lru(User, "SELECT * FROM repository_users WHERE id = $1", args_cache_key=True)
+        async def by_id(cls, conn, id): pass
+
+    cache = TxRepository.__caches__[0]
+
+    async def main():
+        conn = FakeConnection(User.__fields__, {1: (1, "old")})
+        connector = DBConnector()
+        connector.pool = FakePool(conn)
+        await TxRepository.by_id(conn, 1)
+
+        async with connector.transaction():
+            async with connector.transaction(): # savepoint
+                await TxRepository.update(connector, User(id=1, tag="new"))
+            assert (1, ) in cache
+        assert (1, ) not in cache
+
+        await TxRepository.by_id(conn, 1)
+        try:
+            async with transaction(conn):
+                await TxRepository.delete_by_id(conn, 1)
+                raise RuntimeError("rolled back")
+        except RuntimeError:
+            pass
+        assert (1, ) in cache
+
+        async with transaction(conn):
+            await TxRepository.delete_by_id(conn, 1)
+            assert (1, ) in cache
+        assert (1, ) not in cache
+        assert "transaction(conn)" not in caplog.text
+
+        async with conn.transaction(): # not registered: invalidated at once, with a warning
+            await TxRepository.delete_by_id(conn, 1)
+        assert "transaction(conn)" in caplog.text
+
+    asyncio.run(main())
+
+def test_key_filter_warns_without_a_bus_and_rebuilds_for_outside_writes(caplog):
+    from asyncrepository.connection import DBConnector
+    from fakes import FakePool
+
+    async def main():
+        conn = FakeConnection(User.__fields__, {1: (1, "a")})
+        connector = DBConnector()
+        connector.pool = FakePool(conn)
+        try:
+            await UserRepository.load_key_filter(connector)
+            assert "without an InvalidationBus" in caplog.text
+            assert await UserRepository.exists_by_id(connector, 1)
+
+            conn.rows[2] = (2, "b") # inserted outside of the repository: a false negative until rebuilt
+            assert not await UserRepository.exists_by_id(connector, 2)
+
+            caplog.clear()
+            old = await UserRepository.load_key_filter(connector, rebuild_interval=0.01)
+            assert caplog.text == "" and await UserRepository.exists_by_id(connector, 2)
+            conn.rows[3] = (3, "c")
+            await asyncio.sleep(0.05)
+            assert UserRepository.__key_filter__ is not old and await UserRepository.exists_by_id(connector, 3)
+        finally:
+            UserRepository.unload_key_filter()
+        assert UserRepository.__key_filter_task__ is None and UserRepository.__key_filter__ is None
+
+    asyncio.run(main())
@@ -0,0 +1,42 @@
+import asyncio
+from dataclasses import dataclass
+
+from asyncrepository.entity import entity, BaseEntity, PrimaryKey, Varchar
+from asyncrepository.repository import Repository, repository
+from asyncrepository.session import UnitOfWork
+
+from fakes import FakeConnection
+
+@dataclass(slots=True)
+@entity(table_name="session_users")
+class User(BaseEntity):
+    id: PrimaryKey[int]
+    tag: Varchar[255]
+
+@repository(User)
+class UserRepository(Repository): pass
+
+def test_flush_sends_only_changed_columns():
+    async def main():
+        conn = FakeConnection(User.__fields__, {1: (1, "a"), 2: (2, "b")})
+        async with UnitOfWork(conn) as uow:
+            (await uow.get(UserRepository, 1)).tag = "x"
+            (await uow.get(UserRepository, 2)).tag = "y"
+        assert conn.statements("UPDATE") == [
+            ("UPDATE session_users SET tag=$1 WHERE id=$2 ", ("x", 1)),
+            ("UPDATE session_users SET tag=$1 WHERE id=$2 ", ("y", 2)),
+        ]
+        assert not uow.dirty()
+
+    asyncio.run(main())
+
+def test_changed_key_updates_the_loaded_row_and_is_tracked_under_the_new_key():
+    async def main():
+        conn = FakeConnection(User.__fields__, {1: (1, "a")})
+        async with UnitOfWork(conn) as uow:
+            user = await uow.get(UserRepository, 1)
+            user.id, user.tag = 5, "b"
+        assert conn.statements("UPDATE") == [("UPDATE session_users SET id=$1,tag=$2 WHERE id=$3 ", (5, "b", 1))]
+        assert list(uow._tracked) == [(UserRepository, 5)] and await uow.get(UserRepository, 5) is user
+
+    asyncio.run(main())
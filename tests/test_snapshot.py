@@ -0,0 +1,54 @@
+import asyncio
+from dataclasses import dataclass
+
+from asyncrepository.entity import entity, BaseEntity, PrimaryKey, Varchar
+from asyncrepository.repository import Repository, repository, query_all_lru, query_lru, query_ttl
+from asyncrepository.snapshot import CacheSnapshot
+
+from fakes import FakeConnection
+
+@dataclass(slots=True)
+@entity(table_name="snapshot_users")
+class User(BaseEntity):
+    id: PrimaryKey[int]
+    tag: Varchar[255]
+
+@repository(User)
+class UserRepository(Repository):
+    @classmethod
+    @query_lru(User, "SELECT * FROM snapshot_users WHERE id = $1", args_cache_key=True)
+    async def by_id(cls, conn, id): pass
+
+    @classmethod
+    @query_ttl(User, "SELECT * FROM snapshot_users WHERE id = $1", cache_expire=60.0)
+    async def by_id_ttl(cls, conn, id): pass
+
+    @classmethod
+    @query_all_lru(User, "SELECT * FROM snapshot_users WHERE tag = $1", args_cache_key=True)
+    async def by_tag(cls, conn, tag): pass
+
+def test_caches_without_expiry_are_restored_only_with_a_refresh(tmp_path):
+    lru, ttl, lists = (UserRepository.__dict__[x].__func__.__query_cache__ for x in ("by_id", "by_id_ttl", "by_tag"))
+
+    async def main():
+        conn = FakeConnection(User.__fields__, {1: (1, "old")})
+        await UserRepository.by_id(conn, 1)
+        await UserRepository.by_id_ttl(conn, 1)
+        await UserRepository.by_tag(conn, "old")
+
+        snapshot = CacheSnapshot(str(tmp_path / "caches.bin"))
+        assert snapshot.max_age is not None
+        snapshot.register(UserRepository)
+        await snapshot.save()
+
+        conn.rows[1] = (1, "new") # written while the process is down
+        for cache in (lru, ttl, lists): cache.clear()
+        await snapshot.restore()
+        assert len(lru) == 0 and len(lists) == 0
+        assert ttl.get((1, )).tag == "old" # served until it expires
+
+        ttl.clear()
+        await snapshot.restore(conn)
+        assert lru.get((1, )).tag == "new" and len(lists) == 0
+
+    asyncio.run(main())
@@ -0,0 +1,68 @@
+from dataclasses import dataclass
+
+import pytest
+
+from asyncrepository.connection import StmtGenerator
+from asyncrepository.entity import entity, BaseEntity, PrimaryKey, Timestamp, Varchar
+
+@dataclass(slots=True)
+@entity(table_name="stmt_events")
+class Event(BaseEntity):
+    id: PrimaryKey[int]
+    tag: Varchar[255]
+    created_at: Timestamp
+
+@pytest.mark.parametrize("column, sql, params", [
+    ("tag",                     "tag=$1",                          1),
+    ("id=",                     "id=$1",                           1),
+    ("id>=",                    "id>=$1",                          1),
+    ("id<=",                    "id<=$1",                          1),
+    ("id<>",                    "id<>$1",                          1),
+    ("id!=",                    "id!=$1",                          1),
+    ("id >",                    "id>$1",                           1),
+    ("id<",                     "id<$1",                           1),
+    ("id IN",                   "id=ANY($1)",                      1),
+    ("id not in",               "id<>ALL($1)",                     1),
+    ("created_at BETWEEN",      "created_at BETWEEN $1 AND $2",    2),
+    ("created_at IS NULL",      "created_at IS NULL",              0),
+    ("created_at IS NOT NULL",  "created_at IS NOT NULL",          0),
+])
+def test_where_operators(column, sql, params):
+    query = StmtGenerator(Event).select().where(column).compile()
+    assert query.sql == f"SELECT * FROM stmt_events WHERE {sql} "
+    assert query.params == params
+
+def test_placeholders_are_numbered_across_where_calls_after_and_limit():
+    query = (StmtGenerator(Event).select("id", "tag")
+             .where("tag", "created_at BETWEEN").where("id IN")
+             .after("created_at", "id", desc=True)
+             .order_by(desc=["created_at", "id"]).limit().compile())
+    assert query.sql == (
+        "SELECT id,tag FROM stmt_events WHERE tag=$1 and created_at BETWEEN $2 AND $3 AND id=ANY($4) "
+        "AND (created_at,id) < ($5,$6) ORDER BY created_at DESC,id DESC LIMIT $7 "
+    )
+    assert query.params == 7
+
+    query = StmtGenerator(Event).select().after("id").limit(20).compile()
+    assert query.sql == "SELECT * FROM stmt_events WHERE (id) > ($1) LIMIT 20 "
+    assert query.params == 1
+
+def test_where_batch_types():
+    query = StmtGenerator(Event).select().where_batch("id", "tag", "created_at").compile()
+    assert query.sql == ("SELECT * FROM stmt_events WHERE (id,tag,created_at) IN "
+                         "(SELECT * FROM unnest($1::bigint[],$2::text[],$3::timestamp[])) ")
+    assert query.params == 3
+
+    query = StmtGenerator(Event).select().where("tag").where_batch("id", types=("int",)).compile()
+    assert query.sql == "SELECT * FROM stmt_events WHERE tag=$1 AND (id) IN (SELECT * FROM unnest($2::int[])) "
+    assert query.params == 2
+
+    with pytest.raises(ValueError):
+        StmtGenerator(Event).select().where_batch("missing").compile()
+
+def test_equal_shapes_compile_to_the_same_query():
+    first = StmtGenerator(Event).select().where("tag", "id>=").limit().compile()
+    generator = StmtGenerator(Event)
+    assert generator.select().where("tag", "id>=").limit().compile() is first
+    assert generator.select().where("tag", "id>").limit().compile() is not first # compile() emptied the generator
+    assert StmtGenerator(Event).update("tag").where("id").compile().sql == "UPDATE stmt_events SET tag=$1 WHERE id=$2 "